@@ -14,3 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
 
 application = get_asgi_application()
+
+# Download jobs run in the server process, take up those a previous one left behind.
+# This module is imported inside the server's event loop, the queries have to run off it
+from youtubedl.jobs import resume_jobs_in_background  # noqa: E402
+
+resume_jobs_in_background()
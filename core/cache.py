@@ -0,0 +1,113 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from django.conf import settings
+from django.core.cache import caches
+
+TRACKING_PARAMS = re.compile(r'^(utm_\w+|si|feature|pp|fbclid|gclid|igshid|ref|ab_channel)$')
+
+def normalize_url(url: str) -> str:
+    """
+    Canonical form of a media URL, so different links to the same resource share a cache entry.
+    """
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    for prefix in ('www.', 'm.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    path = parts.path.rstrip('/')
+    query = [(k, v) for k, v in parse_qsl(parts.query) if not TRACKING_PARAMS.match(k)]
+
+    if host == 'youtu.be':
+        host, query, path = 'youtube.com', [('v', path.lstrip('/'))], '/watch'
+    if host == 'youtube.com':
+        query = [(k, v) for k, v in query if k in ('v', 'list')]
+    elif host == 'open.spotify.com':
+        path = re.sub(r'^/intl-[\w-]+', '', path)
+        query = []
+
+    return urlunsplit(('https', host, path, urlencode(sorted(query)), ''))
+
+class MetadataCache:
+    """
+    Two tier cache for extracted metadata: a small in-memory LRU in front of the
+    persistent ``metadata`` cache backend. Entries are stored as JSON so every
+    hit hands out fresh objects the serializers are free to mutate. The memory
+    tier is bounded by entry count and by the size of the JSON it holds.
+    """
+    def __init__(self, backend=None, max_entries=None, max_bytes=None) -> None:
+        self.backend = backend or caches['metadata']
+        self.max_entries = max_entries or settings.METADATA_CACHE_MEMORY_ENTRIES
+        self.max_bytes = max_bytes or settings.METADATA_CACHE_MEMORY_BYTES
+        self._memory = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def key(self, url: str) -> str:
+        return 'metadata:' + hashlib.sha256(normalize_url(url).encode()).hexdigest()
+
+    def ttl(self, platform: str) -> int:
+        return settings.METADATA_CACHE_TTL.get(platform, settings.METADATA_CACHE_TTL['default'])
+
+    def get(self, url: str):
+        key = self.key(url)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[0] > time.time():
+                self._memory.move_to_end(key)
+                return json.loads(entry[1])
+            self._forget(key)
+
+        value = self.backend.get(key)
+        if value is None:
+            return None
+        expires, payload = value
+        if expires <= time.time():
+            return None
+        self._remember(key, expires, payload)
+        return json.loads(payload)
+
+    def set(self, url: str, platform: str, info) -> None:
+        key = self.key(url)
+        ttl = self.ttl(platform)
+        payload = json.dumps(info)
+        expires = time.time() + ttl
+        self.backend.set(key, (expires, payload), ttl)
+        self._remember(key, expires, payload)
+
+    def delete(self, url: str) -> None:
+        key = self.key(url)
+        with self._lock:
+            self._forget(key)
+        self.backend.delete(key)
+
+    def _forget(self, key) -> None:
+        # Called with the lock held
+        entry = self._memory.pop(key, None)
+        if entry:
+            self._bytes -= len(entry[1])
+
+    def _remember(self, key, expires, payload) -> None:
+        with self._lock:
+            self._forget(key)
+            # json.dumps escapes everything outside ASCII, so the length is the size in bytes
+            if len(payload) > self.max_bytes:
+                return
+            self._memory[key] = (expires, payload)
+            self._bytes += len(payload)
+            while len(self._memory) > self.max_entries or self._bytes > self.max_bytes:
+                self._forget(next(iter(self._memory)))
+
+_metadata_cache = None
+_metadata_cache_lock = threading.Lock()
+
+def get_metadata_cache() -> MetadataCache:
+    global _metadata_cache
+    with _metadata_cache_lock:
+        if _metadata_cache is None:
+            _metadata_cache = MetadataCache()
+        return _metadata_cache
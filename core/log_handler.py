@@ -1,12 +1,134 @@
 # log_handler.py
 import logging
-from django.db import models
+import queue
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from django.db import close_old_connections, connection
+
+# Request and download job being handled, stored on every record logged meanwhile
+request_id = ContextVar('request_id', default=None)
+job_id = ContextVar('job_id', default=None)
 
 class DatabaseLogHandler(logging.Handler):
+    """
+    Stores log records as LogEntry rows without touching the database on the
+    logging thread. Records go into a bounded queue that a background thread
+    writes out with bulk_create, once batch_size records are waiting or
+    flush_interval seconds have passed. When the queue is full new records
+    are dropped and counted, and the count is logged with the next batch.
+    """
+    def __init__(self, level=logging.NOTSET, batch_size=100, flush_interval=2.0, max_queue=10000):
+        super().__init__(level)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.dropped_lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = None
+        self.thread_lock = threading.Lock()
+
     def emit(self, record):
         try:
-            from core.models import LogEntry
-            message = self.format(record)
-            LogEntry.objects.create(message=message)
+            entry = {
+                'created_at': datetime.fromtimestamp(record.created, tz=timezone.utc),
+                'level': record.levelno,
+                'logger': record.name[:255],
+                'request_id': request_id.get(),
+                'job_id': job_id.get(),
+                'message': self.format(record),
+            }
         except Exception:
-            pass  # You might want to handle exceptions or at least pass them silently.
+            self.handleError(record)
+            return
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            with self.dropped_lock:
+                self.dropped += 1
+        self.start()
+
+    def start(self):
+        # Started on the first record, so management commands that never log spawn no thread
+        if self.thread is None and not self.stopping.is_set():
+            with self.thread_lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self.run, name='DatabaseLogHandler', daemon=True)
+                    self.thread.start()
+
+    def run(self):
+        try:
+            while not self.stopping.is_set():
+                batch = self.collect()
+                if batch:
+                    # Drops a connection the database closed while we waited
+                    close_old_connections()
+                    self.write(batch)
+        finally:
+            connection.close()
+
+    def collect(self) -> list[dict]:
+        """
+        Wait up to flush_interval for a first record, then take what arrives until
+        the batch is full or the interval since that first record has passed.
+        """
+        try:
+            batch = [self.queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def drain(self) -> list[dict]:
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def write(self, entries: list[dict]) -> None:
+        from core.models import LogEntry
+        with self.dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        rows = [LogEntry(**entry) for entry in entries]
+        if dropped:
+            rows.append(LogEntry(level=logging.WARNING, logger=__name__, message=f"DatabaseLogHandler dropped {dropped} log records, the queue was full"))
+        with self.write_lock:
+            try:
+                LogEntry.objects.bulk_create(rows, batch_size=self.batch_size)
+            except Exception as e:
+                # Logging the failure would queue it again, stderr still reaches the process logs
+                with self.dropped_lock:
+                    self.dropped += dropped + len(entries)
+                print(f"DatabaseLogHandler could not write {len(entries)} log records: {e}", file=sys.stderr)
+
+    def flush(self):
+        """
+        Write every queued record now, on the calling thread.
+        """
+        batch = self.drain()
+        if batch:
+            self.write(batch)
+
+    def close(self):
+        # logging.shutdown calls this at interpreter exit
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join(timeout=self.flush_interval + 5)
+        try:
+            self.flush()
+        finally:
+            super().close()
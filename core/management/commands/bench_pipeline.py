@@ -0,0 +1,330 @@
+import json
+import os
+import platform
+import stat
+import subprocess
+import tempfile
+import textwrap
+import time
+import tracemalloc
+from contextlib import contextmanager
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.test.utils import CaptureQueriesContext, override_settings, setup_databases, teardown_databases
+from rest_framework.test import APIRequestFactory, force_authenticate
+from core.utils import YoutubeDLHelper
+from youtubedl.jobs import handle_download
+from youtubedl.models import Track, Playlist
+from youtubedl.serializers import TrackSerializer, PlaylistSerializer
+from youtubedl.viewsets import YoutubeDLViewSet
+
+# Stages that can be left out, extract, validate and save feed each other
+OPTIONAL_STAGES = ('download', 'resave', 'list_tracks', 'list_playlists')
+TIMESTAMPS = [{'start': '00:00:10', 'end': '00:00:20'}, {'start': '00:01:00', 'end': '00:01:30'}]
+
+# Prints the recorded entries of a URL like --print-json, flat ones with --flat-playlist, or writes
+# a silent file where -o points, printing the video's entry too when asked to
+FAKE_YTDLP = textwrap.dedent('''\
+    #!/bin/sh
+    output=""
+    ext=wav
+    url=""
+    flat=""
+    print=""
+    while [ $# -gt 0 ]; do
+        case "$1" in
+            -o) output="$2"; shift ;;
+            --audio-format) ext="$2"; shift ;;
+            --flat-playlist) flat=".flat" ;;
+            --print-json) print=1 ;;
+            *) url="$1" ;;
+        esac
+        shift
+    done
+    id="${url##*list=}"
+    [ "$id" = "$url" ] && id="${url##*v=}"
+    if [ -z "$output" ]; then
+        exec cat "$BENCH_FIXTURES/$id$flat.jsonl"
+    fi
+    mkdir -p "$(dirname "$output")"
+    head -c "$BENCH_AUDIO_BYTES" /dev/zero > "$output.$ext"
+    [ -n "$print" ] && cat "$BENCH_FIXTURES/$id.jsonl"
+    exit 0
+''')
+
+# Writes a silent file for every output, the argument closing each -map group
+FAKE_FFMPEG = textwrap.dedent('''\
+    #!/bin/sh
+    mapped=0
+    previous=""
+    for arg in "$@"; do
+        if [ "$arg" = "-map" ]; then
+            [ $mapped -eq 1 ] && head -c "$BENCH_SNIPPET_BYTES" /dev/zero > "$previous"
+            mapped=1
+        fi
+        previous="$arg"
+    done
+    [ $mapped -eq 1 ] && head -c "$BENCH_SNIPPET_BYTES" /dev/zero > "$previous"
+    exit 0
+''')
+
+def entry(i: int, playlist_id: str = None) -> dict:
+    """
+    A yt-dlp --print-json entry shaped like a real YouTube one, formats included,
+    so parsing and memory costs are close to what production extractions carry.
+    """
+    video_id = f'bench{i:07d}'
+    info = {
+        'id': video_id,
+        'title': f'Bench track {i}',
+        'uploader': 'Bench Uploader',
+        'uploader_id': '@benchuploader',
+        'uploader_url': 'https://www.youtube.com/@benchuploader',
+        'channel_id': 'UCbench',
+        'timestamp': 1700000000 + i,
+        'upload_date': '20231114',
+        'duration': 180.0 + i % 120,
+        'webpage_url': f'https://www.youtube.com/watch?v={video_id}',
+        'webpage_url_basename': 'watch',
+        'webpage_url_domain': 'youtube.com',
+        'original_url': f'https://www.youtube.com/watch?v={video_id}',
+        'view_count': 1000 * i,
+        'like_count': 10 * i,
+        'comment_count': i,
+        'extractor': 'youtube',
+        'extractor_key': 'Youtube',
+        'description': f'Description of bench track {i}. ' * 20,
+        'tags': [f'tag{k}' for k in range(15)],
+        'categories': ['Music'],
+        'tbr': 129.5,
+        'ext': 'webm',
+        'formats': [
+            {
+                'format_id': str(k),
+                'format_note': 'medium',
+                'ext': 'webm' if k % 2 else 'm4a',
+                'acodec': 'opus' if k % 2 else 'mp4a.40.2',
+                'vcodec': 'none' if k < 6 else 'vp9',
+                'abr': 48.0 * (k % 4 + 1),
+                'filesize': 1_000_000 * (k + 1),
+                'url': f'https://rr1---sn-bench.googlevideo.com/videoplayback?id={video_id}&itag={k}&expire=1700021600&sig={"0" * 64}',
+                'http_headers': {'User-Agent': 'Mozilla/5.0', 'Accept-Language': 'en-us,en;q=0.5'},
+            }
+            for k in range(24)
+        ],
+        'thumbnails': [
+            {'url': f'https://i.ytimg.com/vi/{video_id}/{k}.jpg', 'width': 120 * k, 'height': 90 * k, 'id': str(k), 'preference': -k}
+            for k in range(1, 6)
+        ],
+    }
+    if playlist_id:
+        info.update({'playlist_title': f'Bench playlist {playlist_id}', 'playlist_id': playlist_id, 'playlist_index': i + 1})
+    return info
+
+def flat_entry(info: dict) -> dict:
+    """
+    The entry --flat-playlist lists for a video.
+    """
+    fields = ('id', 'title', 'duration', 'uploader', 'webpage_url', 'webpage_url_basename', 'extractor', 'extractor_key', 'playlist_title', 'playlist_id', 'playlist_index')
+    return {'_type': 'url', 'url': info['webpage_url'], **{field: info[field] for field in fields if field in info}}
+
+def write_fixture(directory: str, name: str, entries: list) -> None:
+    with open(os.path.join(directory, f'{name}.jsonl'), 'w') as f:
+        for info in entries:
+            f.write(json.dumps(info) + '\n')
+
+def install(directory: str, name: str, script: str) -> None:
+    path = os.path.join(directory, name)
+    with open(path, 'w') as f:
+        f.write(script)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark extraction, download, serialization, persistence and the list endpoint on generated "
+        "yt-dlp fixtures, with fake yt-dlp and ffmpeg executables, in a throwaway test database. "
+        "Set DB_ENGINE=sqlite to run against SQLite instead of the configured Postgres"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,100,1000,5000', help="Comma separated playlist sizes, a single track case always runs too")
+        parser.add_argument('--skip', action='append', choices=OPTIONAL_STAGES, default=[], help="Leave a stage out, can be repeated")
+        parser.add_argument('--stream', action='store_true', help="Stream playlists with --flat-playlist, see STREAM_PLAYLISTS")
+        parser.add_argument('--no-memory', action='store_true', help="Do not trace allocations, tracing slows every stage down")
+        parser.add_argument('--audio-bytes', type=int, default=64 * 1024, help="Size of every fake downloaded file")
+        parser.add_argument('--output', default=None, help="Write the results to this JSON file")
+        parser.add_argument('--compare', default=None, help="JSON file of an earlier run to compare against")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted({int(size) for size in options['sizes'].split(',')})
+        except ValueError:
+            raise CommandError(f"Invalid sizes: {options['sizes']}")
+        if not sizes or sizes[0] < 1:
+            raise CommandError("Sizes must be positive")
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        self.memory = not options['no_memory']
+        self.skip = set(options['skip'])
+        self.stream = options['stream']
+        if self.stream and 'download' in self.skip:
+            raise CommandError("A streamed playlist only gets its metadata from the download stage")
+        cases = [('track', 1, TrackSerializer)] + [('playlist', size, PlaylistSerializer) for size in sizes]
+
+        with tempfile.TemporaryDirectory() as workdir:
+            bin_dir, fixtures, media = (os.path.join(workdir, name) for name in ('bin', 'fixtures', 'media'))
+            for directory in (bin_dir, fixtures, media):
+                os.makedirs(directory)
+            install(bin_dir, 'yt-dlp', FAKE_YTDLP)
+            install(bin_dir, 'ffmpeg', FAKE_FFMPEG)
+            write_fixture(fixtures, 'benchtrack', [entry(0)])
+            for size in sizes:
+                entries = [entry(i, f'BENCH{size}') for i in range(size)]
+                write_fixture(fixtures, f'BENCH{size}', entries)
+                write_fixture(fixtures, f'BENCH{size}.flat', [flat_entry(info) for info in entries])
+            if self.stream:
+                # Downloads print the entry of their video
+                for i in range(sizes[-1]):
+                    write_fixture(fixtures, f'bench{i:07d}', [entry(i)])
+
+            environ = {
+                'PATH': os.pathsep.join([bin_dir, os.environ.get('PATH', '')]),
+                'BENCH_FIXTURES': fixtures,
+                'BENCH_AUDIO_BYTES': str(options['audio_bytes']),
+                'BENCH_SNIPPET_BYTES': str(max(options['audio_bytes'] // 8, 1)),
+            }
+            caches = {**settings.CACHES, 'metadata': {**settings.CACHES['metadata'], 'LOCATION': os.path.join(workdir, 'metadata')}}
+            old_config = setup_databases(verbosity=0, interactive=False, aliases={DEFAULT_DB_ALIAS})
+            try:
+                with patched_environ(environ), override_settings(YTDLP_ENGINE='subprocess', MEDIA_ROOT=media, CACHES=caches, ALLOWED_HOSTS=['testserver']):
+                    self.user = get_user_model().objects.create_user('bench', password='bench')
+                    results = []
+                    # An unrecorded first pass pays for imports, URL patterns and other one-off setup
+                    for index, (name, size, serializer_class) in enumerate([cases[0]] + cases):
+                        url = 'https://www.youtube.com/watch?v=benchtrack' if name == 'track' else f'https://www.youtube.com/playlist?list=BENCH{size}'
+                        measured = self.run_case(name, size, url, serializer_class)
+                        if index:
+                            results += measured
+                        Playlist.objects.all().delete()
+                        Track.objects.all().delete()
+            finally:
+                teardown_databases(old_config, verbosity=0)
+
+        report = {
+            'commit': git_commit(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'memory_traced': self.memory,
+            'stream': self.stream,
+            'results': results,
+        }
+        self.print_results(results, baseline)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def run_case(self, name: str, size: int, url: str, serializer_class) -> list[dict]:
+        results = []
+
+        def stage(stage: str):
+            return self.measure(results, name, size, stage)
+
+        with stage('extract'):
+            ydl = YoutubeDLHelper(url, refresh=True, stream=self.stream)
+        if 'download' not in self.skip:
+            with stage('download'):
+                ydl.download(timestamps=TIMESTAMPS, incremental=False)
+        # Building the serializer normalizes every track, so it is timed as part of validation
+        with stage('validate'):
+            serializer = serializer_class(ydl=ydl)
+            if not serializer.is_valid():
+                raise CommandError(f"{name} {size} does not validate: {serializer.errors}")
+        with stage('save'):
+            serializer.save()
+        if 'resave' not in self.skip:
+            # Saving the same download again takes the upsert path over rows that already exist.
+            # The serializers consume the info they are given, the metadata cache hands out a fresh copy
+            ydl = YoutubeDLHelper(url, stream=False)
+            with stage('resave'):
+                handle_download(ydl, serializer_class)
+        view = YoutubeDLViewSet.as_view({'get': 'list'})
+        for type in ('tracks', 'playlists'):
+            if f'list_{type}' in self.skip:
+                continue
+            request = APIRequestFactory().get('/api/youtubedl/', {'type': type})
+            force_authenticate(request, user=self.user)
+            with stage(f'list_{type}'):
+                response = view(request)
+                response.render()
+        return results
+
+    @contextmanager
+    def measure(self, results: list, name: str, size: int, stage: str):
+        if self.memory:
+            tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                yield
+                seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if self.memory else None
+        finally:
+            if self.memory:
+                tracemalloc.stop()
+        results.append({
+            'case': name,
+            'size': size,
+            'stage': stage,
+            'seconds': round(seconds, 6),
+            # Queries of the calling thread, download workers and the log handler use connections of their own
+            'queries': len(queries),
+            'peak_bytes': peak,
+        })
+
+    def print_results(self, results: list, baseline: dict = None) -> None:
+        previous = {}
+        if baseline:
+            previous = {(row['case'], row['size'], row['stage']): row for row in baseline['results']}
+            self.stdout.write(f"Compared with {baseline.get('commit') or 'baseline'} on {baseline.get('database')}")
+            if baseline.get('memory_traced') != self.memory:
+                self.stderr.write("Only one of the runs traced memory, which skews the timings")
+        header = f"{'case':<10}{'size':>7}  {'stage':<16}{'seconds':>10}{'queries':>9}{'peak KiB':>11}"
+        self.stdout.write(header + (f"{'was (s)':>10}{'change':>9}" if baseline else ''))
+        for row in results:
+            peak = f"{row['peak_bytes'] / 1024:.0f}" if row['peak_bytes'] is not None else '-'
+            line = f"{row['case']:<10}{row['size']:>7}  {row['stage']:<16}{row['seconds']:>10.4f}{row['queries']:>9}{peak:>11}"
+            before = previous.get((row['case'], row['size'], row['stage']))
+            if before:
+                change = (row['seconds'] - before['seconds']) / before['seconds'] * 100 if before['seconds'] else 0
+                line += f"{before['seconds']:>10.4f}{change:>+8.1f}%"
+            self.stdout.write(line)
+
+@contextmanager
+def patched_environ(values: dict):
+    previous = {key: os.environ.get(key) for key in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
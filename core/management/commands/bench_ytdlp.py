@@ -0,0 +1,72 @@
+import os
+import sys
+import tempfile
+import textwrap
+import time
+import importlib.util
+from django.core.management.base import BaseCommand
+from core.ytdlp import InProcessEngine, SubprocessEngine
+
+FAKE_EXTRACTOR = textwrap.dedent('''
+    from yt_dlp.extractor.common import InfoExtractor
+
+    class FakeBenchIE(InfoExtractor):
+        _VALID_URL = r'fakebench://(?P<id>[\\w-]+)'
+
+        def _real_extract(self, url):
+            video_id = self._match_id(url)
+            return {
+                'id': video_id,
+                'title': f'Fake track {video_id}',
+                'url': f'http://127.0.0.1/{video_id}.wav',
+                'ext': 'wav',
+                'vcodec': 'none',
+                'duration': 180,
+                'uploader': 'bench',
+                'timestamp': 1700000000,
+            }
+''')
+
+class Command(BaseCommand):
+    help = "Compare per-track yt-dlp overhead of the in-process and subprocess engines using a local fake extractor"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tracks', type=int, default=20)
+
+    def handle(self, *args, **options):
+        tracks = options['tracks']
+        urls = [f'fakebench://track{i}' for i in range(tracks)]
+
+        with tempfile.TemporaryDirectory() as plugin_dir:
+            # The CLI picks the extractor up as a yt-dlp plugin, the in-process engine gets the class directly
+            package = os.path.join(plugin_dir, 'yt_dlp_plugins', 'extractor')
+            os.makedirs(package)
+            module_path = os.path.join(package, 'fakebench.py')
+            with open(module_path, 'w') as f:
+                f.write(FAKE_EXTRACTOR)
+            spec = importlib.util.spec_from_file_location('fakebench', module_path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+
+            env = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [plugin_dir, os.environ.get('PYTHONPATH')]))}
+            engines = [
+                InProcessEngine(extractors=[module.FakeBenchIE]),
+                SubprocessEngine(executable=os.path.join(os.path.dirname(sys.executable), 'yt-dlp'), env=env),
+            ]
+
+            self.stdout.write(f"{'engine':<12}{'tracks':>8}{'first (ms)':>14}{'per track (ms)':>18}{'total (s)':>12}")
+            for engine in engines:
+                timings = []
+                for url in urls:
+                    start = time.perf_counter()
+                    info = engine.extract_info(url)
+                    timings.append(time.perf_counter() - start)
+                    if not info:
+                        self.stderr.write(f"{engine.name}: no metadata returned for {url}")
+                        return
+                # The first call pays for building the YoutubeDL instance, the rest show the steady state
+                steady = timings[1:] or timings
+                self.stdout.write(
+                    f"{engine.name:<12}{tracks:>8}{timings[0] * 1000:>14.1f}"
+                    f"{sum(steady) / len(steady) * 1000:>18.1f}{sum(timings):>12.2f}"
+                )
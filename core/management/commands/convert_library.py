@@ -0,0 +1,70 @@
+import concurrent.futures
+import os
+import subprocess
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.utils import AUDIO_FORMATS
+
+class Command(BaseCommand):
+    help = "Convert the stored audio library to another storage format in parallel"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='audio_format', default=None, choices=list(AUDIO_FORMATS), help="Defaults to AUDIO_STORAGE_FORMAT")
+        parser.add_argument('--root', default=settings.MEDIA_ROOT)
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--keep-originals', action='store_true')
+        parser.add_argument('--include-lossy', action='store_true', help="Also convert opus and m4a files, re-encoding them loses quality")
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        audio_format = options['audio_format'] or settings.AUDIO_STORAGE_FORMAT
+        target = AUDIO_FORMATS[audio_format]
+        if not os.path.isdir(options['root']):
+            raise CommandError(f"{options['root']} is not a directory")
+
+        sources = list(self.find_sources(options['root'], target['ext'], options['include_lossy']))
+        self.stdout.write(f"{len(sources)} files to convert to {audio_format}")
+        if options['dry_run']:
+            for source in sources:
+                self.stdout.write(source)
+            return
+
+        def convert(source):
+            output = f"{os.path.splitext(source)[0]}.{target['ext']}"
+            partial = f"{output}.part"
+            process = subprocess.run(
+                ["ffmpeg", "-y", "-v", "error", "-i", source, "-vn", *target['codec'], "-f", target['muxer'], partial],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            )
+            if process.returncode != 0:
+                if os.path.exists(partial):
+                    os.remove(partial)
+                return source, process.stderr.decode()
+            os.replace(partial, output)
+            if not options['keep_originals']:
+                os.remove(source)
+            return source, None
+
+        converted, failed = 0, 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for source, error in executor.map(convert, sources):
+                if error:
+                    failed += 1
+                    self.stderr.write(f"Failed {source}: {error}")
+                else:
+                    converted += 1
+                    self.stdout.write(f"Converted {source}")
+        self.stdout.write(self.style.SUCCESS(f"Converted {converted} files, {failed} failed"))
+
+    def find_sources(self, root, ext, include_lossy=False):
+        # A lossy file only gets worse when it is encoded again, and is no better for being stored lossless
+        extensions = {
+            f".{audio_format['ext']}" for audio_format in AUDIO_FORMATS.values()
+            if audio_format['lossless'] or include_lossy
+        } - {f".{ext}"}
+        for directory, dirs, files in os.walk(root):
+            # Skip caches and other hidden directories
+            dirs[:] = [name for name in dirs if not name.startswith('.')]
+            for name in files:
+                if os.path.splitext(name)[1].lower() in extensions:
+                    yield os.path.join(directory, name)
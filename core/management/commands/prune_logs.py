@@ -0,0 +1,35 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+from django.utils import timezone
+from core.models import LogEntry
+
+class Command(BaseCommand):
+    help = "Delete log entries older than LOG_RETENTION_DAYS in primary key chunks, run it daily from cron"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.LOG_RETENTION_DAYS)
+        parser.add_argument('--chunk-size', type=int, default=10000)
+        parser.add_argument('--pause', type=float, default=0.0, help="Seconds to sleep between chunks to spare the database")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        # Rows are inserted in time order, so everything up to the newest expired id can go
+        bounds = LogEntry.objects.filter(created_at__lt=cutoff).aggregate(low=Min('id'), high=Max('id'))
+        if bounds['high'] is None:
+            self.stdout.write("Nothing to prune")
+            return
+
+        deleted = 0
+        start = bounds['low']
+        while start <= bounds['high']:
+            end = min(start + options['chunk_size'] - 1, bounds['high'])
+            # Each chunk is a short DELETE on a primary key range, in its own transaction
+            count, _ = LogEntry.objects.filter(id__gte=start, id__lte=end, created_at__lt=cutoff).delete()
+            deleted += count
+            start = end + 1
+            if options['pause']:
+                time.sleep(options['pause'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} log entries older than {cutoff:%Y-%m-%d %H:%M}"))
@@ -0,0 +1,23 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from youtubedl.stats import rollup
+
+class Command(BaseCommand):
+    help = "Roll library additions and totals up into one DailyStat row per day, run it daily from cron"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=2, help="Days back from today to roll up, the default redoes yesterday and today")
+        parser.add_argument('--since', default=None, help="Roll up every day from this ISO date, e.g. to backfill")
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        if options['since']:
+            start = parse_date(options['since'])
+            if start is None:
+                raise CommandError(f"Invalid date: {options['since']}")
+        else:
+            start = today - timedelta(days=options['days'] - 1)
+        days = rollup(start, today)
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {days} days from {start}"))
@@ -0,0 +1,123 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds, from a cached lookup up to a long playlist transfer
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, math.inf)
+
+_registry = []
+
+def escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def format_labels(names, values, extra=()) -> str:
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+def format_value(value) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """
+    A metric kept in this process, one series per label combination. Each
+    worker process exports its own values, Prometheus sums them per instance.
+    """
+    type = None
+
+    def __init__(self, name: str, help: str, labels=()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.series = {}
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes the labels {', '.join(self.labels)}")
+        return tuple(labels[name] for name in self.labels)
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        with self.lock:
+            series = sorted(self.series.items(), key=lambda item: tuple(map(str, item[0])))
+            for values, value in series:
+                lines.extend(self.render_series(values, value))
+        return lines
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels) -> None:
+        key = self.key(labels)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def render_series(self, values, value):
+        return [f'{self.name}{format_labels(self.labels, values)} {format_value(value)}']
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self.key(labels)
+        with self.lock:
+            counts, total = self.series.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self.series[key] = (counts, total + value)
+
+    def render_series(self, values, value):
+        counts, total = value
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{format_labels(self.labels, values, [("le", format_value(bound))])} {cumulative}')
+        lines.append(f'{self.name}_sum{format_labels(self.labels, values)} {format_value(total)}')
+        lines.append(f'{self.name}_count{format_labels(self.labels, values)} {cumulative}')
+        return lines
+
+@contextmanager
+def timer(histogram: Histogram, **labels):
+    """
+    Observe the seconds the block took, also when it raises.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
+
+def render() -> str:
+    """
+    Every registered metric in the Prometheus text exposition format.
+    """
+    return '\n'.join(line for metric in _registry for line in metric.render()) + '\n'
+
+STAGE_SECONDS = Histogram(
+    'pipeline_stage_seconds', "Seconds spent in each stage of the download pipeline",
+    ['stage', 'platform', 'type'],
+)
+BYTES = Counter(
+    'pipeline_bytes_total', "Bytes written by the download pipeline",
+    ['stage', 'platform', 'type'],
+)
+SUBPROCESS_EXITS = Counter(
+    'pipeline_subprocess_exits_total', "Exit codes of the yt-dlp and ffmpeg runs of the pipeline",
+    ['command', 'code'],
+)
+METADATA_LOOKUPS = Counter(
+    'pipeline_metadata_lookups_total', "Metadata lookups by whether the metadata cache answered them",
+    ['platform', 'type', 'cached'],
+)
@@ -0,0 +1,48 @@
+import re
+import uuid
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from .log_handler import request_id
+
+# Ids taken over from the front proxy, anything else is replaced by a fresh one
+REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+class RequestIdMiddleware:
+    """
+    Tag the request with the proxy's X-Request-ID or a new id, so every record
+    logged while handling it can be found by that id. The id is echoed back in
+    the response. Runs natively under ASGI too, so async views such as the job
+    event stream are not moved onto a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def tag(self, request):
+        header = request.headers.get('X-Request-ID', '')
+        request.id = header if REQUEST_ID_RE.match(header) else uuid.uuid4().hex
+        return request_id.set(request.id)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = self.tag(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_id.reset(token)
+        response['X-Request-ID'] = request.id
+        return response
+
+    async def __acall__(self, request):
+        token = self.tag(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_id.reset(token)
+        response['X-Request-ID'] = request.id
+        return response
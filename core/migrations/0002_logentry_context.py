@@ -0,0 +1,77 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:24
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class AddIndexConcurrently(migrations.AddIndex):
+    """
+    CREATE INDEX CONCURRENTLY on PostgreSQL, so the log handler keeps writing
+    while the indexes of a large table build. Other databases add it plainly.
+    """
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.add_index(model, self.index, concurrently=True)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.remove_index(model, self.index, concurrently=True)
+
+
+class Migration(migrations.Migration):
+    # Concurrent index builds cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='logentry',
+            name='job_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='logentry',
+            name='level',
+            field=models.PositiveSmallIntegerField(default=20),
+        ),
+        migrations.AddField(
+            model_name='logentry',
+            name='logger',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='logentry',
+            name='request_id',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AlterField(
+            model_name='logentry',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        AddIndexConcurrently(
+            model_name='logentry',
+            index=models.Index(fields=['created_at'], name='logentry_created_at_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='logentry',
+            index=models.Index(fields=['level', 'created_at'], name='logentry_level_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='logentry',
+            index=models.Index(fields=['job_id', 'created_at'], name='logentry_job_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='logentry',
+            index=models.Index(fields=['request_id'], name='logentry_request_idx'),
+        ),
+    ]
@@ -1,4 +1,6 @@
+import logging
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.db.models.signals import post_save
 from django.dispatch import receiver
@@ -20,8 +22,21 @@ class Profile(models.Model):
         return f'Profile for {self.user.username}'
 
 class LogEntry(models.Model):
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Set from the log record, so batched writes keep the time it was logged
+    created_at = models.DateTimeField(default=timezone.now)
+    level = models.PositiveSmallIntegerField(default=logging.INFO)
+    logger = models.CharField(max_length=255, blank=True)
+    request_id = models.CharField(max_length=64, blank=True, null=True)
+    job_id = models.BigIntegerField(blank=True, null=True)
     message = models.TextField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='logentry_created_at_idx'),
+            models.Index(fields=['level', 'created_at'], name='logentry_level_idx'),
+            models.Index(fields=['job_id', 'created_at'], name='logentry_job_idx'),
+            models.Index(fields=['request_id'], name='logentry_request_idx'),
+        ]
+
     def __str__(self):
         return f'LogEntry(id={self.id}) at {self.created_at} with message "{self.message}"'
\ No newline at end of file
@@ -1,6 +1,7 @@
+import logging
 from djoser.serializers import UserSerializer
 from rest_framework import serializers
-from .models import Profile
+from .models import LogEntry, Profile
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
 class ProfileSerializer(serializers.ModelSerializer):
@@ -52,3 +53,13 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         data.update(user_data)
 
         return data
+
+class LogEntrySerializer(serializers.ModelSerializer):
+    level_name = serializers.SerializerMethodField()
+
+    class Meta:
+        model = LogEntry
+        fields = ['id', 'created_at', 'level', 'level_name', 'logger', 'request_id', 'job_id', 'message']
+
+    def get_level_name(self, instance):
+        return logging.getLevelName(instance.level)
@@ -53,6 +53,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "core.middleware.RequestIdMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -98,6 +99,13 @@ DATABASES = {
     }
 }
 
+# 'sqlite' swaps Postgres for a local file, e.g. to run the tests or bench_pipeline without a database server
+if os.environ.get('DB_ENGINE') == 'sqlite':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -142,6 +150,103 @@ DOMAIN = 'localhost:3000'
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Library of downloaded tracks, playlists and snippets
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', '/media')
+
+# Number of download jobs run concurrently by the in-process worker pool
+YOUTUBEDL_JOB_WORKERS = int(os.environ.get('YOUTUBEDL_JOB_WORKERS', 2))
+# Seconds between the heartbeats of running jobs, and without one after which a running job counts as interrupted
+YOUTUBEDL_JOB_HEARTBEAT = int(os.environ.get('YOUTUBEDL_JOB_HEARTBEAT', 30))
+YOUTUBEDL_JOB_STALE_AFTER = int(os.environ.get('YOUTUBEDL_JOB_STALE_AFTER', 120))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Persistent tier of the extracted metadata cache, see core.cache.MetadataCache
+    'metadata': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('METADATA_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'metadata')),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+# Seconds extracted metadata stays cached, per platform
+METADATA_CACHE_TTL = {
+    'default': 6 * 60 * 60,
+    'youtube': 6 * 60 * 60,
+    'soundcloud': 6 * 60 * 60,
+    'spotify': 60 * 60,
+}
+
+# Entries and JSON bytes kept in the in-memory tier of the metadata cache, full playlists with formats run to megabytes each
+METADATA_CACHE_MEMORY_ENTRIES = 128
+METADATA_CACHE_MEMORY_BYTES = int(os.environ.get('METADATA_CACHE_MEMORY_BYTES', 32 * 1024 * 1024))
+
+# Playlist and album pages fetched from Spotify at once
+SPOTIFY_PAGE_WORKERS = int(os.environ.get('SPOTIFY_PAGE_WORKERS', 4))
+# YouTube searches run at once and per second when resolving Spotify tracks
+SPOTIFY_RESOLVE_WORKERS = int(os.environ.get('SPOTIFY_RESOLVE_WORKERS', 4))
+SPOTIFY_RESOLVE_RATE = float(os.environ.get('SPOTIFY_RESOLVE_RATE', 2))
+
+# Download YouTube and SoundCloud playlists while they are listed with --flat-playlist, fetching each track's metadata with its download
+STREAM_PLAYLISTS = os.environ.get('STREAM_PLAYLISTS', 'true').lower() == 'true'
+
+# Seconds between the progress events of one downloading track, and between keepalives of an idle event stream
+PROGRESS_INTERVAL = float(os.environ.get('PROGRESS_INTERVAL', 0.5))
+PROGRESS_KEEPALIVE = int(os.environ.get('PROGRESS_KEEPALIVE', 15))
+# Events kept per job for listeners that connect late, and finished jobs whose events are kept
+PROGRESS_HISTORY = int(os.environ.get('PROGRESS_HISTORY', 500))
+PROGRESS_FINISHED_JOBS = int(os.environ.get('PROGRESS_FINISHED_JOBS', 100))
+
+# Format downloads are stored in, one of core.utils.AUDIO_FORMATS: wav, flac, opus or m4a
+AUDIO_STORAGE_FORMAT = os.environ.get('AUDIO_STORAGE_FORMAT', 'wav')
+
+# Copy PCM audio into WAV snippets instead of re-encoding to 16-bit 44.1kHz
+SNIPPET_STREAM_COPY = os.environ.get('SNIPPET_STREAM_COPY', 'false').lower() == 'true'
+
+# Let the front proxy send library files: 'nginx' (X-Accel-Redirect), 'x-sendfile' (Apache/lighttpd) or empty
+SENDFILE_BACKEND = os.environ.get('SENDFILE_BACKEND') or None
+SENDFILE_ROOT = os.environ.get('SENDFILE_ROOT', MEDIA_ROOT)
+# Internal nginx location that aliases SENDFILE_ROOT
+SENDFILE_URL = os.environ.get('SENDFILE_URL', '/protected-media/')
+
+# Opus/MP3 renditions produced by the stream endpoint, least recently used ones are evicted past the limit
+TRANSCODE_CACHE_DIR = os.environ.get('TRANSCODE_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'transcode'))
+TRANSCODE_CACHE_MAX_BYTES = int(os.environ.get('TRANSCODE_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+
+# Upload finished downloads and snippets to AWS_STORAGE_BUCKET_NAME when S3 credentials are set
+AWS_S3_UPLOAD = os.environ.get('AWS_S3_UPLOAD', 'true').lower() == 'true'
+# Multipart part size in bytes, files from this size up are uploaded in parts
+AWS_S3_MULTIPART_CHUNKSIZE = int(os.environ.get('AWS_S3_MULTIPART_CHUNKSIZE', 16 * 1024 * 1024))
+# Concurrent part uploads per file, and files uploaded at once
+AWS_S3_MAX_CONCURRENCY = int(os.environ.get('AWS_S3_MAX_CONCURRENCY', 8))
+AWS_S3_UPLOAD_WORKERS = int(os.environ.get('AWS_S3_UPLOAD_WORKERS', 4))
+# Seconds a bucket listing answers existence checks before the prefix is listed again
+AWS_S3_INDEX_TTL = int(os.environ.get('AWS_S3_INDEX_TTL', 300))
+# How save_track delivers files the bucket holds: 'local' streams them from disk,
+# 'redirect' answers with a 302 to a presigned URL and 'url' returns that URL as JSON
+AWS_S3_DELIVERY = os.environ.get('AWS_S3_DELIVERY', 'local')
+# Lifetime of presigned URLs, and how long before expiry a cached one stops being handed out
+AWS_S3_PRESIGN_EXPIRES = int(os.environ.get('AWS_S3_PRESIGN_EXPIRES', 3600))
+AWS_S3_PRESIGN_MARGIN = int(os.environ.get('AWS_S3_PRESIGN_MARGIN', 300))
+
+# Day windows the dashboard stats can be asked for, the default one, and how long they stay cached
+STATS_WINDOWS = (1, 7, 30)
+STATS_DEFAULT_WINDOW = 7
+STATS_CACHE_TTL = int(os.environ.get('STATS_CACHE_TTL', 300))
+
+# Days of LogEntry rows prune_logs keeps
+LOG_RETENTION_DAYS = int(os.environ.get('LOG_RETENTION_DAYS', 30))
+
+# 'inprocess' drives yt-dlp through its Python API, 'subprocess' runs the yt-dlp CLI per call
+YTDLP_ENGINE = os.environ.get('YTDLP_ENGINE', 'inprocess')
+
+# Bearer token Prometheus must send to scrape /metrics, left empty the endpoint is open
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework_simplejwt.authentication.JWTAuthentication",
@@ -184,14 +289,23 @@ LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'handlers': {
+        'console': {
+            'level': 'INFO',
+            'class': 'logging.StreamHandler',
+        },
         'db': {
             'level': 'INFO',
             'class': 'core.log_handler.DatabaseLogHandler',  # Use the correct path
+            # Records are written in batches of batch_size or every flush_interval seconds,
+            # past max_queue waiting records new ones are dropped and counted
+            'batch_size': 100,
+            'flush_interval': 2.0,
+            'max_queue': 10000,
         },
     },
     'loggers': {
         '': {
-            'handlers': ['db'],
+            'handlers': ['console', 'db'],
             'level': 'INFO',
             'propagate': True,
         },
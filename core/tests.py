@@ -0,0 +1,503 @@
+import io
+import logging
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock, skipIf
+from django.contrib.auth import get_user_model
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from .cache import MetadataCache, normalize_url
+from .log_handler import DatabaseLogHandler, job_id, request_id
+from .metrics import Counter, Histogram, _registry, timer
+from .models import LogEntry
+from .ytdlp import EXTRACT_ARGS, InProcessEngine, Listing, SubprocessEngine, yt_dlp
+
+# The LOGGING database handler may store records of its own meanwhile, assertions only look at the rows a test made
+class DatabaseLogHandlerTest(TestCase):
+    def setUp(self):
+        self.handler = DatabaseLogHandler(batch_size=50, flush_interval=60, max_queue=100)
+        # Records stay queued until the test flushes them on its own thread
+        self.handler.start = mock.Mock()
+        self.logger = logging.Logger('test')
+        self.logger.addHandler(self.handler)
+
+    def test_records_are_written_in_batches(self):
+        with self.assertNumQueries(0):
+            for i in range(75):
+                self.logger.info("message %s", i)
+        with self.assertNumQueries(2):
+            self.handler.flush()
+        self.assertEqual(list(LogEntry.objects.filter(logger='test').order_by('id').values_list('message', flat=True)), [f"message {i}" for i in range(75)])
+
+    def test_overflow_is_counted_and_reported(self):
+        for i in range(130):
+            self.logger.info("message %s", i)
+        self.assertEqual(self.handler.dropped, 30)
+        self.handler.flush()
+        self.assertEqual(LogEntry.objects.filter(logger='test').count(), 100)
+        self.assertTrue(LogEntry.objects.filter(message__contains="dropped 30 log records").exists())
+        self.assertEqual(self.handler.dropped, 0)
+
+    def test_failed_writes_are_counted_as_dropped(self):
+        self.logger.info("lost")
+        with mock.patch.object(LogEntry.objects, 'bulk_create', side_effect=DatabaseError("down")), mock.patch('sys.stderr'):
+            self.handler.flush()
+        self.assertEqual(self.handler.dropped, 1)
+
+    def test_close_flushes_queued_records(self):
+        self.logger.info("last words")
+        self.handler.close()
+        self.assertTrue(LogEntry.objects.filter(message="last words").exists())
+
+    def test_records_keep_their_level_logger_and_context(self):
+        request_token, job_token = request_id.set('req-1'), job_id.set(42)
+        try:
+            self.logger.warning("tagged")
+        finally:
+            request_id.reset(request_token)
+            job_id.reset(job_token)
+        self.logger.info("untagged")
+        self.handler.flush()
+
+        tagged, untagged = LogEntry.objects.filter(logger='test').order_by('id')
+        self.assertEqual((tagged.level, tagged.logger, tagged.request_id, tagged.job_id), (logging.WARNING, 'test', 'req-1', 42))
+        self.assertEqual((untagged.request_id, untagged.job_id), (None, None))
+        self.assertLessEqual(tagged.created_at, untagged.created_at)
+
+class LogRetentionAndQueryTest(TestCase):
+    url = '/api/logs/'
+
+    def setUp(self):
+        now = timezone.now()
+        LogEntry.objects.bulk_create(
+            [LogEntry(created_at=now - timedelta(days=40 - i), message=f"old {i}") for i in range(7)]
+            + [LogEntry(created_at=now - timedelta(minutes=i), level=logging.ERROR if i % 2 else logging.INFO, logger='youtubedl.jobs', job_id=i % 3, message=f"new {i}") for i in range(10)]
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user('admin', password='x', is_staff=True))
+
+    def test_prune_deletes_expired_rows_in_chunks(self):
+        with mock.patch('sys.stdout'):
+            call_command('prune_logs', days=30, chunk_size=3)
+        self.assertFalse(LogEntry.objects.filter(message__startswith='old').exists())
+        self.assertEqual(LogEntry.objects.filter(message__startswith='new').count(), 10)
+
+    def test_log_endpoint_filters_and_paginates(self):
+        response = self.client.get(self.url, {'level': 'error', 'logger': 'youtubedl', 'page_size': 2})
+        self.assertEqual([row['message'] for row in response.json()['results']], ['new 1', 'new 3'])
+        self.assertEqual(response.json()['results'][0]['level_name'], 'ERROR')
+        with self.assertNumQueries(1):
+            response = self.client.get(response.json()['next'])
+        self.assertEqual([row['message'] for row in response.json()['results']], ['new 5', 'new 7'])
+
+        self.assertEqual(len(self.client.get(self.url, {'job_id': 0}).json()['results']), 4)
+        self.assertEqual(self.client.get(self.url, {'level': 'loud'}).status_code, 400)
+
+    def test_requests_get_an_id(self):
+        response = self.client.get(self.url, HTTP_X_REQUEST_ID='abc-123')
+        self.assertEqual(response['X-Request-ID'], 'abc-123')
+        self.assertEqual(len(self.client.get(self.url)['X-Request-ID']), 32)
+
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        self.histogram = Histogram('test_seconds', "Test", ['stage'], buckets=(0.1, 1, float('inf')))
+        self.counter = Counter('test_total', "Test", ['code'])
+        self.addCleanup(_registry.remove, self.histogram)
+        self.addCleanup(_registry.remove, self.counter)
+
+    def test_histograms_render_cumulative_buckets(self):
+        for value in (0.05, 0.5, 0.7, 5):
+            self.histogram.observe(value, stage='download')
+        with mock.patch('core.metrics.time.perf_counter', side_effect=[0, 0.01]):
+            with self.assertRaises(RuntimeError), timer(self.histogram, stage='say "hi"'):
+                raise RuntimeError
+        self.counter.inc(code='0')
+        self.counter.inc(2, code='0')
+        with self.assertRaises(ValueError):
+            self.counter.inc(command='ffmpeg')
+
+        lines = self.histogram.render() + self.counter.render()
+        self.assertIn('# TYPE test_seconds histogram', lines)
+        self.assertIn('test_seconds_bucket{stage="download",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{stage="download",le="1"} 3', lines)
+        self.assertIn('test_seconds_bucket{stage="download",le="+Inf"} 4', lines)
+        self.assertIn('test_seconds_sum{stage="download"} 6.25', lines)
+        self.assertIn('test_seconds_count{stage="download"} 4', lines)
+        self.assertIn('test_seconds_count{stage="say \\"hi\\""} 1', lines)
+        self.assertIn('test_total{code="0"} 3', lines)
+
+    def test_endpoint_serves_the_registry(self):
+        self.counter.inc(code='1')
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertIn('test_total{code="1"} 1', response.content.decode())
+        self.assertIn('# TYPE pipeline_stage_seconds histogram', response.content.decode())
+
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+class NormalizeUrlTest(TestCase):
+    def test_youtube_links_share_a_form(self):
+        canonical = 'https://youtube.com/watch?v=abc123'
+        for url in ('https://youtu.be/abc123?si=xyz', 'https://www.youtube.com/watch?v=abc123&feature=share',
+                    'http://m.youtube.com/watch?utm_source=x&v=abc123&pp=yg', ' https://youtube.com/watch/?v=abc123 '):
+            self.assertEqual(normalize_url(url), canonical)
+
+    def test_youtube_playlist_parameters_are_kept_in_order(self):
+        self.assertEqual(normalize_url('https://www.youtube.com/watch?list=PL1&v=abc&index=3&t=10'), 'https://youtube.com/watch?list=PL1&v=abc')
+        self.assertEqual(normalize_url('https://youtube.com/playlist?list=PL1&si=xyz'), 'https://youtube.com/playlist?list=PL1')
+
+    def test_spotify_locale_and_query_are_dropped(self):
+        self.assertEqual(normalize_url('https://open.spotify.com/intl-de/track/42?si=abc'), 'https://open.spotify.com/track/42')
+        self.assertEqual(normalize_url('https://open.spotify.com/intl-pt-BR/playlist/7/'), 'https://open.spotify.com/playlist/7')
+
+    def test_other_query_parameters_are_kept(self):
+        self.assertEqual(normalize_url('https://soundcloud.com/artist/sets/mix?utm_medium=x&secret=s'), 'https://soundcloud.com/artist/sets/mix?secret=s')
+
+@override_settings(METADATA_CACHE_TTL={'default': 60})
+class MetadataCacheTest(TestCase):
+    def setUp(self):
+        self.backend = LocMemCache('metadata-test', {})
+        self.backend.clear()
+        self.now = 1000.0
+        patch = mock.patch('core.cache.time.time', side_effect=lambda: self.now)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def url(self, i):
+        return f'https://youtube.com/watch?v={i}'
+
+    def test_hits_are_fresh_copies(self):
+        cache = MetadataCache(backend=self.backend)
+        cache.set(self.url(1), 'youtube', [{'title': 'a'}])
+        cache.get(self.url(1))[0]['title'] = 'changed'
+        self.assertEqual(cache.get('https://youtu.be/1'), [{'title': 'a'}])
+
+    def test_entries_expire_after_their_ttl(self):
+        cache = MetadataCache(backend=self.backend)
+        cache.set(self.url(1), 'youtube', [{'title': 'a'}])
+        self.now += 59
+        self.assertEqual(cache.get(self.url(1)), [{'title': 'a'}])
+        self.now += 1
+        self.assertIsNone(cache.get(self.url(1)))
+
+    def test_backend_entries_past_their_expiry_are_misses(self):
+        # Backends may keep an entry past its timeout, a file cache until it is next read
+        cache = MetadataCache(backend=self.backend)
+        self.backend.set(cache.key(self.url(1)), (self.now - 1, '[{"title": "a"}]'), None)
+        self.assertIsNone(cache.get(self.url(1)))
+        self.assertEqual(len(cache._memory), 0)
+
+    def test_memory_tier_evicts_the_least_recently_used(self):
+        cache = MetadataCache(backend=self.backend, max_entries=2)
+        for i in range(3):
+            cache.set(self.url(i), 'youtube', [{'id': i}])
+            if i == 1:
+                cache.get(self.url(0))
+        self.assertEqual(len(cache._memory), 2)
+        self.assertNotIn(cache.key(self.url(1)), cache._memory)
+        self.assertIn(cache.key(self.url(0)), cache._memory)
+        # Evicted entries are still served by the backend, and move back into memory
+        self.assertEqual(cache.get(self.url(1)), [{'id': 1}])
+        self.assertIn(cache.key(self.url(1)), cache._memory)
+
+    def test_memory_tier_is_bounded_by_size(self):
+        cache = MetadataCache(backend=self.backend, max_entries=100, max_bytes=250)
+        for i in range(3):
+            cache.set(self.url(i), 'youtube', [{'id': i, 'formats': 'x' * 80}])
+        self.assertEqual(len(cache._memory), 2)
+        self.assertLessEqual(cache._bytes, 250)
+        self.assertEqual(cache._bytes, sum(len(payload) for _, payload in cache._memory.values()))
+        self.assertNotIn(cache.key(self.url(0)), cache._memory)
+
+        # Too large for memory at all, but still cached
+        cache.set(self.url(3), 'youtube', [{'id': 3, 'formats': 'x' * 300}])
+        self.assertNotIn(cache.key(self.url(3)), cache._memory)
+        self.assertEqual(len(cache._memory), 2)
+        self.assertEqual(cache.get(self.url(3))[0]['id'], 3)
+
+        cache.delete(self.url(1))
+        self.assertIsNone(cache.get(self.url(1)))
+        self.assertEqual(cache._bytes, sum(len(payload) for _, payload in cache._memory.values()))
+
+class MetadataRefreshTest(TestCase):
+    def setUp(self):
+        self.cache = MetadataCache(backend=LocMemCache('refresh-test', {}))
+        self.cache.backend.clear()
+        self.engine = mock.Mock()
+        self.engine.extract_info.return_value = Listing([{'title': 'Song', 'uploader': 'Artist'}])
+        for patch in (mock.patch('core.utils.get_metadata_cache', return_value=self.cache),
+                      mock.patch('core.utils.get_engine', return_value=self.engine)):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_refresh_bypasses_and_replaces_the_cached_metadata(self):
+        from .utils import YoutubeDLHelper
+        url = 'https://www.youtube.com/watch?v=abc'
+        YoutubeDLHelper(url)
+        self.engine.extract_info.return_value = Listing([{'title': 'Song (Remastered)', 'uploader': 'Artist'}])
+        self.assertEqual(YoutubeDLHelper('https://youtube.com/watch?v=abc&feature=share').info[0]['title'], 'Song')
+        self.assertEqual(self.engine.extract_info.call_count, 1)
+
+        self.assertEqual(YoutubeDLHelper(url, refresh=True).info[0]['title'], 'Song (Remastered)')
+        self.assertEqual(self.engine.extract_info.call_count, 2)
+        self.assertEqual(YoutubeDLHelper(url).info[0]['title'], 'Song (Remastered)')
+        self.assertEqual(self.engine.extract_info.call_count, 2)
+
+# Records its arguments one per line and creates every output, FAKE_FFMPEG_EXIT makes it fail
+FAKE_FFMPEG = """#!/bin/sh
+printf '%s\\n' "$@" > "$FAKE_FFMPEG_ARGS"
+while [ $# -gt 0 ]; do
+    case "$1" in *.wav|*.flac|*.opus|*.m4a) [ "$prev" = "-i" ] || printf snippet > "$1" ;; esac
+    prev="$1"
+    shift
+done
+echo "fake failure" >&2
+exit ${FAKE_FFMPEG_EXIT:-0}
+"""
+
+def install_ffmpeg(test, script) -> str:
+    """
+    Put the script first on PATH as ffmpeg for the duration of the test, returns its temporary directory.
+    """
+    directory = tempfile.TemporaryDirectory()
+    test.addCleanup(directory.cleanup)
+    ffmpeg = os.path.join(directory.name, 'ffmpeg')
+    with open(ffmpeg, 'w') as f:
+        f.write(script)
+    os.chmod(ffmpeg, 0o755)
+    environ = mock.patch.dict(os.environ, {'PATH': os.pathsep.join([directory.name, os.environ.get('PATH', '')])})
+    environ.start()
+    test.addCleanup(environ.stop)
+    return directory.name
+
+class CreateSnippetsTest(TestCase):
+    timestamps = [{'start': '00:00:05', 'end': '00:00:10'}, {'start': '00:01:00', 'end': '00:01:30'}]
+
+    def setUp(self):
+        self.dir = install_ffmpeg(self, FAKE_FFMPEG)
+        self.args = os.path.join(self.dir, 'args')
+        environ = mock.patch.dict(os.environ, {'FAKE_FFMPEG_ARGS': self.args})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+    def helper(self, audio_format):
+        from .utils import AUDIO_FORMATS, YoutubeDLHelper
+        # Only the attributes create_snippets reads, without extracting any metadata
+        helper = YoutubeDLHelper.__new__(YoutubeDLHelper)
+        helper.audio_format, helper.ext = audio_format, AUDIO_FORMATS[audio_format]['ext']
+        helper.platform, helper.type = 'youtube', 'track'
+        return helper
+
+    def create(self, audio_format):
+        with self.assertLogs('core.utils', 'INFO') as self.logs:
+            outputs = self.helper(audio_format).create_snippets(os.path.join(self.dir, 'track'), self.timestamps)
+        with open(self.args) as f:
+            return outputs, f.read().splitlines()
+
+    def test_each_segment_is_seeked_before_its_input_and_mapped_to_one_output(self):
+        outputs, argv = self.create('flac')
+        source = os.path.join(self.dir, 'track.flac')
+        self.assertEqual(outputs, [os.path.join(self.dir, '000005_000010.flac'), os.path.join(self.dir, '000100_000130.flac')])
+        self.assertEqual(argv[:3], ['-y', '-v', 'error'])
+        self.assertEqual(argv[3:15], ['-ss', '00:00:05', '-to', '00:00:10', '-i', source,
+                                      '-ss', '00:01:00', '-to', '00:01:30', '-i', source])
+        self.assertEqual(argv[15:], ['-map', '0:a', '-c:a', 'flac', outputs[0], '-map', '1:a', '-c:a', 'flac', outputs[1]])
+        self.assertTrue(all(os.path.isfile(output) for output in outputs))
+        self.assertEqual(self.logs.output, [f"INFO:core.utils:Snippet created: {output}" for output in outputs])
+
+    def test_only_wav_is_stream_copied(self):
+        for audio_format, codec in (('wav', ['-c:a', 'pcm_s16le', '-ar', '44100']), ('opus', ['-c:a', 'libopus', '-b:a', '160k'])):
+            with self.subTest(audio_format=audio_format):
+                outputs, argv = self.create(audio_format)
+                self.assertEqual(argv[15:], ['-map', '0:a', *codec, outputs[0], '-map', '1:a', *codec, outputs[1]])
+        with override_settings(SNIPPET_STREAM_COPY=True):
+            for audio_format, codec in (('wav', ['-c:a', 'copy']), ('m4a', ['-c:a', 'aac', '-b:a', '256k'])):
+                with self.subTest(audio_format=audio_format, stream_copy=True):
+                    outputs, argv = self.create(audio_format)
+                    self.assertEqual(argv[15:], ['-map', '0:a', *codec, outputs[0], '-map', '1:a', *codec, outputs[1]])
+
+    def test_a_failed_run_is_logged(self):
+        with mock.patch.dict(os.environ, {'FAKE_FFMPEG_EXIT': '1'}):
+            outputs, _ = self.create('flac')
+        self.assertEqual(outputs, [])
+        message, = self.logs.output
+        self.assertIn("Error creating snippets", message)
+        self.assertIn("fake failure", message)
+
+class AudioFormatTest(TestCase):
+    def test_downloads_ask_yt_dlp_for_the_storage_format(self):
+        from .utils import download_args
+        self.assertEqual(download_args('flac'), ('--format', 'bestaudio/best', '--extract-audio', '--audio-format', 'flac', '--audio-quality', '0'))
+
+    def test_stored_audio_is_found_in_any_format(self):
+        from .utils import find_audio
+        with tempfile.TemporaryDirectory() as root:
+            base = os.path.join(root, 'track')
+            self.assertIsNone(find_audio(base))
+            open(f"{base}.opus", 'w').close()
+            self.assertEqual(find_audio(base), f"{base}.opus")
+            # Lossless copies come first in AUDIO_FORMATS, and win over lossy ones
+            open(f"{base}.flac", 'w').close()
+            self.assertEqual(find_audio(base), f"{base}.flac")
+
+# Copies its input to the output given last, FAKE_FFMPEG_EXIT makes it fail
+FAKE_CONVERT = """#!/bin/sh
+while [ $# -gt 1 ]; do
+    if [ "$1" = "-i" ]; then input="$2"; fi
+    shift
+done
+if [ "${FAKE_FFMPEG_EXIT:-0}" != 0 ]; then echo "fake failure" >&2; printf partial > "$1"; exit 1; fi
+cp "$input" "$1"
+"""
+
+class ConvertLibraryTest(TestCase):
+    def setUp(self):
+        install_ffmpeg(self, FAKE_CONVERT)
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = root.name
+        for path in ('artist/a.wav', 'artist/b.flac', 'artist/c.opus', 'artist/d.m4a', 'artist/notes.txt', '.transcode/e.wav'):
+            os.makedirs(os.path.dirname(os.path.join(self.root, path)), exist_ok=True)
+            with open(os.path.join(self.root, path), 'w') as f:
+                f.write(path)
+
+    def convert(self, *args):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('convert_library', '--root', self.root, '--workers', '2', *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def files(self):
+        return sorted(os.path.relpath(os.path.join(directory, name), self.root) for directory, _, names in os.walk(self.root) for name in names)
+
+    def test_only_lossless_files_are_converted(self):
+        out, err = self.convert('--format', 'flac')
+        self.assertIn("1 files to convert to flac", out)
+        self.assertIn("Converted 1 files, 0 failed", out)
+        self.assertEqual(err, '')
+        self.assertEqual(self.files(), ['.transcode/e.wav', 'artist/a.flac', 'artist/b.flac', 'artist/c.opus', 'artist/d.m4a', 'artist/notes.txt'])
+        with open(os.path.join(self.root, 'artist/a.flac')) as f:
+            self.assertEqual(f.read(), 'artist/a.wav')
+
+    def test_lossy_files_are_converted_when_asked(self):
+        out, _ = self.convert('--format', 'wav', '--include-lossy', '--keep-originals')
+        self.assertIn("3 files to convert to wav", out)
+        self.assertEqual(self.files(), ['.transcode/e.wav', 'artist/a.wav', 'artist/b.flac', 'artist/b.wav', 'artist/c.opus', 'artist/c.wav',
+                                        'artist/d.m4a', 'artist/d.wav', 'artist/notes.txt'])
+
+    def test_dry_run_lists_the_sources(self):
+        with override_settings(AUDIO_STORAGE_FORMAT='opus'):
+            out, _ = self.convert('--dry-run')
+        self.assertIn("2 files to convert to opus", out)
+        self.assertIn(os.path.join(self.root, 'artist/a.wav'), out)
+        self.assertIn(os.path.join(self.root, 'artist/b.flac'), out)
+        self.assertEqual(len(self.files()), 6)
+
+    def test_failed_conversions_keep_the_original(self):
+        with mock.patch.dict(os.environ, {'FAKE_FFMPEG_EXIT': '1'}):
+            out, err = self.convert('--format', 'opus')
+        self.assertIn("Converted 0 files, 2 failed", out)
+        self.assertIn("fake failure", err)
+        self.assertEqual(self.files(), ['.transcode/e.wav', 'artist/a.wav', 'artist/b.flac', 'artist/c.opus', 'artist/d.m4a', 'artist/notes.txt'])
+
+    def test_missing_root_is_an_error(self):
+        with self.assertRaises(CommandError):
+            call_command('convert_library', '--root', os.path.join(self.root, 'missing'), stdout=io.StringIO())
+
+def fake_extractors(source):
+    """
+    yt-dlp extractors for fake://<id> videos, which download source unless the
+    id is "bad", and a fake://list/<ids> playlist of them.
+    """
+    from yt_dlp.extractor.common import InfoExtractor
+    from yt_dlp.utils import ExtractorError
+
+    class FakeVideoIE(InfoExtractor):
+        IE_NAME = 'fakevideo'
+        _VALID_URL = r'fake://(?P<id>[^/]+)$'
+
+        def _real_extract(self, url):
+            video_id = self._match_id(url)
+            if video_id == 'bad':
+                raise ExtractorError('Video unavailable', expected=True)
+            return {'id': video_id, 'title': f"Video {video_id}", 'url': f"file://{source}", 'ext': 'mp3'}
+
+    class FakePlaylistIE(InfoExtractor):
+        IE_NAME = 'fakeplaylist'
+        _VALID_URL = r'fake://list/(?P<id>.+)$'
+
+        def _real_extract(self, url):
+            entries = [self.url_result(f"fake://{video_id}", FakeVideoIE) for video_id in self._match_id(url).split(',')]
+            return self.playlist_result(entries, 'PL1', 'Playlist')
+
+    return FakePlaylistIE, FakeVideoIE
+
+@skipIf(yt_dlp is None, "yt-dlp is not installed")
+class InProcessEngineTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = directory.name
+        source = os.path.join(self.dir, 'source.mp3')
+        with open(source, 'wb') as f:
+            f.write(b'audio')
+        self.engine = InProcessEngine(extractors=fake_extractors(source))
+
+    def download(self, video_id):
+        with self.assertLogs('core.ytdlp', 'DEBUG'):
+            return self.engine.download(f"fake://{video_id}", os.path.join(self.dir, '%(id)s.%(ext)s'), args=('--enable-file-urls',))
+
+    def test_a_failed_download_does_not_fail_the_next_on_the_same_instance(self):
+        self.assertEqual(self.download('a'), (True, ''))
+        ok, errors = self.download('bad')
+        self.assertFalse(ok)
+        self.assertIn("Video unavailable", errors)
+        self.assertEqual(self.download('c'), (True, ''))
+        # All three went through the one pooled instance
+        self.assertEqual(len(self.engine._idle[('--enable-file-urls',)]), 1)
+        self.assertTrue(os.path.isfile(os.path.join(self.dir, 'c.mp3')))
+
+    def test_playlist_entries_are_fully_extracted(self):
+        with self.assertLogs('core.ytdlp', 'DEBUG'):
+            info = self.engine.extract_info('fake://list/a,bad,c', EXTRACT_ARGS)
+        self.assertEqual([entry['id'] for entry in info], ['a', 'c'])
+        self.assertEqual([entry['title'] for entry in info], ['Video a', 'Video c'])
+        self.assertEqual({entry['playlist_title'] for entry in info}, {'Playlist'})
+        self.assertEqual([entry['webpage_url'] for entry in info], ['fake://a', 'fake://c'])
+        self.assertIn("Video unavailable", info.incomplete)
+
+    def test_errors_are_logged_once(self):
+        with self.assertLogs('core.ytdlp', 'ERROR') as logs:
+            ok, errors = self.engine.download('fake://bad', os.path.join(self.dir, '%(id)s.%(ext)s'), args=('--enable-file-urls',))
+        self.assertFalse(ok)
+        self.assertEqual(logs.output, [f"ERROR:core.ytdlp:{errors}"])
+
+# Prints the JSON of two playlist entries, then fails on the third like a private video
+FAKE_YTDLP = """#!/bin/sh
+echo '{"id": "a", "title": "A", "playlist_title": "Playlist"}'
+echo '{"id": "b", "title": "B", "playlist_title": "Playlist"}'
+echo "ERROR: [youtube] c: Private video" >&2
+exit 1
+"""
+
+class SubprocessEngineTest(TestCase):
+    def test_a_failed_entry_leaves_the_others_in_an_incomplete_listing(self):
+        with tempfile.TemporaryDirectory() as directory:
+            executable = os.path.join(directory, 'yt-dlp')
+            with open(executable, 'w') as f:
+                f.write(FAKE_YTDLP)
+            os.chmod(executable, 0o755)
+            with self.assertLogs('core.ytdlp', 'ERROR') as logs:
+                info = SubprocessEngine(executable).extract_info('https://www.youtube.com/playlist?list=PL1')
+        self.assertEqual(logs.output, ["ERROR:core.ytdlp:Error extracting metadata of https://www.youtube.com/playlist?list=PL1: ERROR: [youtube] c: Private video"])
+        self.assertEqual([entry['id'] for entry in info], ['a', 'b'])
+        self.assertIn("Private video", info.incomplete)
@@ -4,11 +4,15 @@ from rest_framework.routers import DefaultRouter
 
 from auth.views import LoginView, LogoutView, UserView
 from youtubedl.viewsets import YoutubeDLViewSet 
+from youtubedl.views import job_events
 from playlist.viewsets import PlaylistViewSet
+from core.viewsets import LogEntryViewSet
+from core.views import metrics
 
 router = DefaultRouter()
 router.register(r"youtubedl", YoutubeDLViewSet, basename="youtubedl")
 router.register(r"playlist", PlaylistViewSet, basename="playlist")
+router.register(r"logs", LogEntryViewSet, basename="logs")
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -17,5 +21,7 @@ urlpatterns = [
     path('auth/jwt/create/', LoginView.as_view(), name='jwt-create'),
     path("auth/logout/", LogoutView.as_view()),
     path("auth/update/", UserView.as_view(), name='auth-update'),
-    path("api/", include(router.urls))
+    path("api/youtubedl/jobs/<int:job_id>/events", job_events, name="job-events"),
+    path("api/", include(router.urls)),
+    path("metrics", metrics, name="metrics"),
 ]
\ No newline at end of file
@@ -1,27 +1,73 @@
+import hashlib
 import logging
 from datetime import datetime, timezone
 import json
 import re
 import subprocess
+import itertools
+import threading
+import time
+from collections import Counter, OrderedDict
 from dotenv import load_dotenv
 import os
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import BotoCoreError, ClientError
 import concurrent.futures
+import contextvars
 import spotipy
+from spotipy.cache_handler import MemoryCacheHandler
 from spotipy.oauth2 import SpotifyClientCredentials
+import requests
 import shutil as sh
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.http import content_disposition_header
+from core.ytdlp import get_engine, ListingError
+from core.cache import get_metadata_cache
+from core.metrics import STAGE_SECONDS, BYTES, SUBPROCESS_EXITS, METADATA_LOOKUPS, timer
 
 load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
 logger = logging.getLogger(__name__)  
 
+# Storage formats for downloaded audio, the key is what yt-dlp's --audio-format expects
+AUDIO_FORMATS = {
+    'wav': {'ext': 'wav', 'muxer': 'wav', 'codec': ['-c:a', 'pcm_s16le', '-ar', '44100'], 'lossless': True},
+    'flac': {'ext': 'flac', 'muxer': 'flac', 'codec': ['-c:a', 'flac'], 'lossless': True},
+    'opus': {'ext': 'opus', 'muxer': 'ogg', 'codec': ['-c:a', 'libopus', '-b:a', '160k'], 'lossless': False},
+    'm4a': {'ext': 'm4a', 'muxer': 'ipod', 'codec': ['-c:a', 'aac', '-b:a', '256k'], 'lossless': False},
+}
+
+def download_args(audio_format: str) -> tuple:
+    return (
+        '--format', 'bestaudio/best',
+        '--extract-audio',
+        '--audio-format', audio_format,
+        '--audio-quality', '0',
+    )
+
+def find_audio(base: str):
+    """
+    Return the stored audio file for a path without extension, whatever format it was saved in.
+    """
+    for audio_format in AUDIO_FORMATS.values():
+        path = f"{base}.{audio_format['ext']}"
+        if os.path.isfile(path):
+            return path
+    return None
+
+# Records which playlist entry each downloaded file belongs to, see YoutubeDLHelper.sync_playlist
+SYNC_MANIFEST = '.sync.json'
+
 def log(message):
-    print(message)
+    # The console handler in LOGGING prints it, the database handler stores it
     logger.info(message)
 
 def run_concurrent_tasks(task_function, items):
     results = []
     with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures = [executor.submit(task_function, item) for item in items]
+        # Each task runs in a copy of our context, so its log records keep the request and job ids
+        futures = [executor.submit(contextvars.copy_context().run, task_function, item) for item in items]
         for future in concurrent.futures.as_completed(futures):
             result = future.result()
             if result:
@@ -35,52 +81,70 @@ class YoutubeDLHelper:
     platform = ''
     save_directory = ''
     
-    def __init__(self, url) -> None:
+    def __init__(self, url, refresh=False, audio_format=None, stream=None, progress=None) -> None:
         self.url = url
+        # Called with an event name and its data as tracks download, see youtubedl.progress
+        self.progress = progress
+        self.stream = settings.STREAM_PLAYLISTS if stream is None else stream
+        # Entries of a streamed playlist still to be listed, see download_streamed
+        self.streamed = None
+        self.audio_format = audio_format or settings.AUDIO_STORAGE_FORMAT
+        if self.audio_format not in AUDIO_FORMATS:
+            raise ValueError(f"Unsupported audio format: {self.audio_format}")
+        self.ext = AUDIO_FORMATS[self.audio_format]['ext']
         self.downloaded = []
-        self.extract_info(url)
+        self.results = []
+        self.sync = {'added': 0, 'kept': 0, 'removed': 0}
+        self.refresh = refresh
+        # yt-dlp's errors when some playlist entries could not be extracted, see core.ytdlp.Listing
+        self.incomplete = None
+        self.extract_info(url, refresh=refresh)
     
-    def extract_info(self, url: str) -> list[dict]:
+    def extract_info(self, url: str, refresh: bool = False) -> list[dict]:
         info = []
         platform, type = self.identify_url_components()
-        if platform == 'spotify':
-            spotify = SpotifyClient()
-            info.append(spotify.get_track_info(url) if type == 'track' else spotify.get_playlist_info(url))
+        cache = get_metadata_cache()
+        cached = None if refresh else cache.get(url)
+        METADATA_LOOKUPS.inc(platform=platform, type=type, cached=str(bool(cached)).lower())
+        if cached:
+            info = cached
+        elif platform == 'spotify':
+            spotify = get_spotify_client()
+            with timer(STAGE_SECONDS, stage='extract', platform=platform, type=type):
+                info.append(spotify.get_track_info(url) if type == 'track' else spotify.get_playlist_info(url))
+        elif platform in ['youtube', 'soundcloud'] and type == 'playlist' and self.stream:
+            # Only waits for the first entry, the rest are listed while the first tracks download
+            with timer(STAGE_SECONDS, stage='extract', platform=platform, type=type):
+                entries = get_engine().iter_entries(url)
+                first = next(entries, None)
+            info = [first] if first else []
+            self.streamed = itertools.chain(info, entries)
         elif platform in ['youtube', 'soundcloud']:
-            command = [
-                'yt-dlp',
-                '--skip-download',
-                '--print-json',
-                url
-            ]
-            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            for line in process.stdout:
-                strip = line.strip()
-                if strip:
-                    info.append(json.loads(strip))
-            errors = process.stderr.read()
-            if errors:
-                print(f"Error extracting metadata: {errors}")
-
-            output, errors = process.communicate()
-            process.stdout.close()
-            process.stderr.close()
-            process.wait()
+            with timer(STAGE_SECONDS, stage='extract', platform=platform, type=type):
+                info = get_engine().extract_info(url)
+            self.incomplete = info.incomplete
         else:
             exit(f"Unsupported URL: {url}")
-            
+
+        if not info:
+            raise ListingError(f"Nothing could be extracted from {url}" + (f": {self.incomplete}" if self.incomplete else ""))
+        # A streamed listing only holds flat entries, caching it would hide the full metadata, a partial one the missing entries
+        if not cached and self.streamed is None and not self.incomplete:
+            cache.set(url, platform, info)
+
         if platform in ['youtube', 'soundcloud']:
             name = info[0]['playlist_title'] if type == 'playlist' else info[0]['title']
-            uploader = info[0]['uploader'] if platform == 'youtube' else self.url.split("/")[3]
+            # Flat playlist entries may only name the playlist's uploader
+            uploader = (info[0].get('uploader') or info[0].get('playlist_uploader')) if platform == 'youtube' else self.url.split("/")[3]
         elif platform == 'spotify':
             if type == 'playlist':
                 name = info[0]['name']
-                uploader = info[0]['owner']['display_name']
+                uploader = info[0]['owner']['display_name'] if 'owner' in info[0] else info[0]['artists'][0]['name']
             else:
-                name = info[0]['title']
+                name = info[0]['name']
                 uploader = info[0]['artists'][0]['name']
 
-        self.path = os.path.join("/media", platform, uploader, name)
+        self.path = os.path.join(settings.MEDIA_ROOT, platform, uploader, name)
         self.platform = platform
         self.type = type
         self.info = info
@@ -99,62 +163,392 @@ class YoutubeDLHelper:
                 return platform, url_type
         exit(f"Unsupported URL: {self.url}")
 
-    def create_snippet(self, input, timestamp, output):
-        subprocess.call([
-            "ffmpeg", "-i", f"{input}.wav", "-ss", timestamp['start'], "-to", timestamp['end'], "-c:a", "pcm_s16le", "-ar", "44100", f"{output}.wav"
-        ])
-        print(f"Snippet created: {output}")
+    def snippet_output(self, path, timestamp) -> str:
+        return os.path.join(path.rsplit("/", 1)[0], f"{timestamp['start'].replace(':', '')}_{timestamp['end'].replace(':', '')}")
+
+    def create_snippets(self, input, timestamps) -> list[str]:
+        """
+        Cut every timestamp out of the source in a single ffmpeg run. Each segment
+        is opened as its own input with -ss/-to before -i, so ffmpeg seeks straight
+        to it instead of decoding the file from the start.
+        """
+        command = ["ffmpeg", "-y", "-v", "error"]
+        for timestamp in timestamps:
+            command += ["-ss", timestamp['start'], "-to", timestamp['end'], "-i", f"{input}.{self.ext}"]
+
+        # PCM can be cut losslessly at any sample, so it can be copied instead of re-encoded
+        if settings.SNIPPET_STREAM_COPY and self.audio_format == 'wav':
+            codec = ["-c:a", "copy"]
+        else:
+            codec = AUDIO_FORMATS[self.audio_format]['codec']
+        outputs = []
+        for index, timestamp in enumerate(timestamps):
+            output = f"{self.snippet_output(input, timestamp)}.{self.ext}"
+            command += ["-map", f"{index}:a", *codec, output]
+            outputs.append(output)
+
+        with timer(STAGE_SECONDS, stage='snippets', platform=self.platform, type=self.type):
+            process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        SUBPROCESS_EXITS.inc(command='ffmpeg', code=str(process.returncode))
+        if process.returncode != 0:
+            log(f"Error creating snippets for {input}: {process.stderr.decode()}")
+            return []
+        for output in outputs:
+            log(f"Snippet created: {output}")
+        BYTES.inc(sum(os.path.getsize(output) for output in outputs if os.path.isfile(output)), stage='snippets', platform=self.platform, type=self.type)
+        return outputs
+
+    def entries(self) -> list:
+        """
+        The tracks of the download, as playlist items for Spotify.
+        """
+        if self.platform != 'spotify':
+            return self.info
+        return self.info[0]['tracks']['items'] if self.type == 'playlist' else [{'track': self.info[0]}]
+
+    def track_entry(self, track) -> tuple[str, str, str]:
+        """
+        Return the (upload id, file name, url) of a playlist or track entry. Files
+        are named by upload id, titles repeat within a playlist and every YouTube
+        video's URL basename is "watch".
+        """
+        if self.platform == "spotify":
+            track = track['track']
+            return track['id'], track['id'], track['external_urls']['spotify']
+        return track['id'], track['id'], track['webpage_url']
+
+    def read_manifest(self) -> dict:
+        try:
+            with open(os.path.join(self.path, SYNC_MANIFEST)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write_manifest(self, manifest: dict) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        manifest_path = os.path.join(self.path, SYNC_MANIFEST)
+        with open(f"{manifest_path}.tmp", 'w') as f:
+            json.dump(manifest, f)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+
+    def publish(self, event: str, data: dict) -> None:
+        if self.progress is None:
+            return
+        try:
+            self.progress(event, data)
+        except Exception as e:
+            # Progress is only reported, it must never fail a download
+            logger.warning(f"Could not publish {event} progress: {e}")
+
+    def progress_hook(self, upload_id: str, name: str):
+        """
+        yt-dlp progress hook publishing a track's percent, speed and ETA, at most
+        once per PROGRESS_INTERVAL seconds while it downloads.
+        """
+        if self.progress is None:
+            return None
+        last = {'at': 0.0}
+
+        def hook(status: dict) -> None:
+            now = time.monotonic()
+            if status.get('status') == 'downloading' and now - last['at'] < settings.PROGRESS_INTERVAL:
+                return
+            last['at'] = now
+            downloaded = status.get('downloaded_bytes')
+            total = status.get('total_bytes') or status.get('total_bytes_estimate')
+            self.publish('progress', {
+                'upload_id': upload_id,
+                'name': name,
+                'status': status.get('status'),
+                'percent': round(downloaded / total * 100, 1) if downloaded is not None and total else None,
+                'downloaded_bytes': downloaded,
+                'total_bytes': total,
+                'speed': status.get('speed'),
+                'eta': status.get('eta'),
+            })
+        return hook
 
-    def process_snippet(self, path, timestamp):
-        snippet_output = os.path.join(path.rsplit("/", 1)[0], f"{timestamp['start'].replace(':', '')}_{timestamp['end'].replace(':', '')}")
-        self.create_snippet(path, timestamp, snippet_output)
-        return f"{snippet_output}.wav"
+    def renamable(self, manifest: dict) -> dict:
+        """
+        The upload ids of a manifest whose file name is their own. Syncs before
+        files were named by upload id gave every YouTube video the same name.
+        """
+        names = Counter(manifest.values())
+        return {upload_id: name for upload_id, name in manifest.items() if names[name] == 1}
 
-    def download(self, timestamps: list = None) -> any:
+    def keep_existing(self, track, previous: str = None) -> str:
+        """
+        Record an entry whose file is already on disk as kept and return its path.
+        A file an older sync stored under the previous name is renamed first.
+        """
+        upload_id, name, url = self.track_entry(track)
+        path = find_audio(os.path.join(self.path, name))
+        if not path and previous and previous != name:
+            old = find_audio(os.path.join(self.path, previous))
+            if old:
+                path = os.path.join(self.path, f"{name}{os.path.splitext(old)[1]}")
+                os.replace(old, path)
+        if path:
+            self.results.append({'upload_id': upload_id, 'name': name, 'url': url, 'path': path, 'snippets': [], 'success': True, 'status': 'kept', 'error': None})
+            self.publish('track', {'upload_id': upload_id, 'name': name, 'status': 'kept', 'error': None})
+        return path
+
+    def remove_unlisted(self, manifest: dict, entries: dict) -> None:
+        """
+        Remove the files of manifest entries that are not in the playlist any more,
+        and files of entries still listed that are now stored under another name.
+        """
+        current = set(entries.values())
+        for upload_id, name in manifest.items():
+            if entries.get(upload_id) == name or name in current:
+                continue
+            path = find_audio(os.path.join(self.path, name))
+            if path:
+                os.remove(path)
+                self.sync['removed'] += 1
+                log(f"Removed {path}, no longer in playlist {self.url}")
+
+    def update_manifest(self, entries: dict) -> None:
+        self.write_manifest({
+            upload_id: name for upload_id, name in entries.items()
+            if find_audio(os.path.join(self.path, name))
+        })
+
+    def sync_playlist(self, tracks: list) -> list:
+        """
+        Keep the files of entries already on disk and remove the files of entries
+        that have left the playlist. Nothing is removed when the listing is
+        incomplete, entries missing from it may still be in the playlist.
+        Returns the entries still to be downloaded.
+        """
+        manifest = self.read_manifest()
+        entries = {}
+        for track in tracks:
+            upload_id, name, url = self.track_entry(track)
+            entries[upload_id] = name
+
+        renamable = self.renamable(manifest)
+        pending = []
+        for track in tracks:
+            path = self.keep_existing(track, renamable.get(self.track_entry(track)[0]))
+            if path:
+                self.downloaded.append(path)
+            else:
+                pending.append(track)
+
+        if self.incomplete:
+            log(f"Not removing files of {self.url}, its listing is incomplete: {self.incomplete}")
+        else:
+            self.remove_unlisted(manifest, entries)
+        return pending
+
+    def process_track(self, track, timestamps: list = None, matches: dict = None, with_info: bool = False) -> tuple[str, dict]:
+        """
+        Download an entry and cut its snippets. Returns the stored path, or None when
+        the download failed, and with with_info the info yt-dlp extracted on the way.
+        """
+        save = self.path
+        upload_id, name, url = self.track_entry(track)
+
+        if self.type == "playlist":
+            save = os.path.join(save, name)
+        elif timestamps:
+            os.makedirs(save, exist_ok=True)
+            save = os.path.join(save, track.get('title', name))
+
+        result = {'upload_id': upload_id, 'name': name, 'url': url, 'path': None, 'snippets': [], 'success': False, 'status': 'failed', 'error': None}
+        self.results.append(result)
+        if self.platform == 'spotify':
+            if upload_id not in (matches or {}):
+                result['error'] = "No YouTube match found"
+                logger.error(f"Error downloading {name}: {result['error']}")
+                self.publish('track', {'upload_id': upload_id, 'name': name, 'status': 'failed', 'error': result['error']})
+                return None, None
+            result['source_url'] = matches[upload_id].video_url
+            result['source_id'] = matches[upload_id].video_id
+        info = None
+        progress = self.progress_hook(upload_id, name)
+        with timer(STAGE_SECONDS, stage='download', platform=self.platform, type=self.type):
+            if with_info:
+                ok, errors, info = get_engine().download_info(result.get('source_url', url), save, args=download_args(self.audio_format), progress=progress)
+            else:
+                ok, errors = get_engine().download(result.get('source_url', url), save, args=download_args(self.audio_format), progress=progress)
+        # The in-process engine reports success rather than an exit code, 1 stands for any failure
+        SUBPROCESS_EXITS.inc(command='yt-dlp', code='0' if ok else '1')
+        if ok:
+            if os.path.isfile(f"{save}.{self.ext}"):
+                BYTES.inc(os.path.getsize(f"{save}.{self.ext}"), stage='download', platform=self.platform, type=self.type)
+            if timestamps:
+                result['snippets'] = self.create_snippets(save, timestamps)
+                self.downloaded.extend(result['snippets'])
+                self.publish('snippets', {'upload_id': upload_id, 'name': name, 'snippets': result['snippets'], 'success': bool(result['snippets'])})
+            result['path'] = f"{save}.{self.ext}"
+            result['success'] = True
+            result['status'] = 'downloaded'
+            self.publish('track', {'upload_id': upload_id, 'name': name, 'status': 'downloaded', 'error': None})
+            return result['path'], info
+        else:
+            result['error'] = errors
+            logger.error(f"Error downloading {name}: {result['error']}")
+            self.publish('track', {'upload_id': upload_id, 'name': name, 'status': 'failed', 'error': errors})
+            return None, None
+
+    def track_info(self, url: str):
+        """
+        The slim info of a single video, from the metadata cache or a metadata only
+        extraction. A re-sync of an unchanged playlist extracts nothing.
+        """
+        cached = None if self.refresh else get_metadata_cache().get(url)
+        METADATA_LOOKUPS.inc(platform=self.platform, type='track', cached=str(bool(cached)).lower())
+        if cached:
+            return cached[0]
+        info = get_engine().extract_info(url)
+        return self.remember(url, info[0] if info else None)
+
+    def remember(self, url: str, info):
+        """
+        Cache the fields of a video's info the serializers read, by the video's URL.
+        """
+        from youtubedl.normalize import slim_info
+
+        if info:
+            info = slim_info(info)
+            get_metadata_cache().set(url, self.platform, [info])
+        return info
+
+    def matched_info(self, matches: dict, infos: dict) -> list[dict]:
+        """
+        The info of the YouTube videos the Spotify tracks were downloaded from, in
+        playlist order, for the serializers. Tracks are stored as those videos, a
+        playlist keeps the Spotify playlist's name and id.
+        """
+        playlist = {}
+        if self.type == 'playlist':
+            playlist = {
+                'playlist_title': self.info[0]['name'],
+                'playlist_id': self.info[0]['id'],
+                'playlist_extractor': 'spotify',
+                'playlist_extractor_key': 'Spotify',
+            }
+        results = {result['upload_id']: result for result in self.results}
+        matched = []
+        for track in self.entries():
+            upload_id = self.track_entry(track)[0]
+            info = infos.get(upload_id)
+            result = results.get(upload_id)
+            if info is None and result and result['status'] == 'kept' and upload_id in matches:
+                result['source_id'] = matches[upload_id].video_id
+                info = self.track_info(matches[upload_id].video_url)
+            if info:
+                matched.append({**info, **playlist})
+        return matched
+
+    def download(self, timestamps: list = None, incremental: bool = True) -> any:
+        if self.streamed is not None:
+            return self.download_streamed(timestamps, incremental)
+
+        tracks = self.entries()
         if os.path.isdir(self.path) and self.type == "playlist":
-            sh.rmtree(self.path)
-
-        def process_track(track) -> any:
-            save = self.path
-            if self.platform == "spotify":
-                track = track['track']
-                name = track['name']
-                url = track['external_urls']['spotify']
+            if incremental:
+                tracks = self.sync_playlist(tracks)
+            else:
+                sh.rmtree(self.path)
+
+        # yt-dlp cannot fetch audio from Spotify, every track is downloaded from its YouTube match
+        matches = {}
+        infos = {}
+        if self.platform == 'spotify':
+            from youtubedl.resolver import resolve_tracks
+            # Kept files are looked up too, their match names the video whose metadata is stored
+            matches = resolve_tracks([track['track'] for track in self.entries() if track.get('track')])
+
+        def process_entry(track) -> any:
+            path, info = self.process_track(track, timestamps, matches, with_info=self.platform == 'spotify')
+            if info:
+                upload_id = self.track_entry(track)[0]
+                infos[upload_id] = self.remember(matches[upload_id].video_url, info)
+            return path
+
+        self.downloaded.extend(run_concurrent_tasks(process_entry, tracks))
+        self.sync['added'] = sum(1 for result in self.results if result['status'] == 'downloaded')
+        self.sync['kept'] = sum(1 for result in self.results if result['status'] == 'kept')
+
+        if self.type == "playlist":
+            listed = dict(self.track_entry(track)[:2] for track in self.entries())
+            # Entries missing from an incomplete listing keep their files, and their place in the manifest
+            self.update_manifest({**self.read_manifest(), **listed} if self.incomplete else listed)
+        if self.platform == 'spotify':
+            self.info = self.matched_info(matches, infos)
+        return self.downloaded
+
+    def download_streamed(self, timestamps: list = None, incremental: bool = True) -> list:
+        """
+        Download a playlist while yt-dlp is still listing it. Entries go to the
+        workers as they arrive and every worker fetches the full metadata of its
+        own track, from the download or, for a file already on disk, from the
+        metadata cache or a metadata only extraction. Only the fields the
+        serializers read are kept, in self.info in playlist order, so memory
+        does not grow with the formats and descriptions of the whole playlist,
+        and each track's fields are cached by its URL. When the listing fails part way
+        the listed entries are still downloaded, then ListingError is raised
+        without pruning any file or touching the manifest.
+        """
+        manifest = {}
+        if os.path.isdir(self.path):
+            if incremental:
+                manifest = self.read_manifest()
             else:
-                name = track['webpage_url_basename']
-                url = track['webpage_url']
-
-            if self.type == "playlist":
-                save = os.path.join(save, name)
-            elif timestamps:
-                os.makedirs(save, exist_ok=True)
-                save = os.path.join(save, track['title'])
-
-            download_cmd = [
-                'yt-dlp',
-                '--format', 'bestaudio/best',
-                '--extract-audio',
-                '--audio-format', 'wav',
-                '--audio-quality', '0',
-                '-o', save, url
-            ]
-            download = subprocess.Popen(download_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            output, errors = download.communicate()
-            if download.returncode == 0:
-                if timestamps:
-                    self.downloaded.extend(run_concurrent_tasks(lambda t: self.process_snippet(save, t), timestamps))
-                return f"{save}.wav"
+                sh.rmtree(self.path)
+        renamable = self.renamable(manifest)
+        listed = {}
+        infos = {}
+        failures = []
+
+        def listing():
+            try:
+                for index, track in enumerate(self.streamed):
+                    upload_id, name, url = self.track_entry(track)
+                    listed[upload_id] = name
+                    yield index, track
+            except ListingError as e:
+                failures.append(e)
+
+        def process_entry(item) -> any:
+            index, track = item
+            upload_id, name, url = self.track_entry(track)
+            path = self.keep_existing(track, renamable.get(upload_id)) if incremental else None
+            if path:
+                info = self.track_info(url)
             else:
-                print(f"Error downloading {name}: {errors.decode()}")
-                return None
-            
+                path, info = self.process_track(track, timestamps, with_info=True)
+                info = self.remember(url, info)
+            if info:
+                # The track's own extraction knows nothing of the playlist it was listed in
+                playlist = {key: track[key] for key in ('playlist_title', 'playlist_id') if key in track}
+                infos[index] = {**info, **playlist}
+            return path
+
+        self.downloaded.extend(run_concurrent_tasks(process_entry, listing()))
+        self.streamed = None
+        self.info = [infos[index] for index in sorted(infos)]
+        self.sync['added'] = sum(1 for result in self.results if result['status'] == 'downloaded')
+        self.sync['kept'] = sum(1 for result in self.results if result['status'] == 'kept')
 
-        tracks = self.info[0]['tracks']['items'] if self.platform == 'spotify' else self.info
-        self.downloaded.extend(run_concurrent_tasks(process_track, tracks))
+        if failures:
+            # Entries past the failure were never listed, pruning against this listing would delete them
+            raise ListingError(f"Listing {self.url} stopped after {len(listed)} entries: {failures[0]}")
+        if incremental:
+            self.remove_unlisted(manifest, listed)
+        self.update_manifest(listed)
         return self.downloaded
-    
+
 class S3Client:
     client = None
+    # delete_objects takes at most this many keys per request
+    DELETE_BATCH_SIZE = 1000
+    # Signed URLs kept in memory
+    PRESIGN_CACHE_SIZE = 10000
+
     def __init__(self) -> None:
         if os.environ.get('AWS_ACCESS_KEY_ID') is None or os.environ.get('AWS_SECRET_ACCESS_KEY') is None:
             return None
@@ -162,16 +556,171 @@ class S3Client:
             's3',
             aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
             aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
+            region_name=os.environ.get('AWS_S3_REGION_NAME') or None,
+            endpoint_url=os.environ.get('AWS_S3_ENDPOINT_URL') or None,
         )
         self.bucket = os.environ.get('AWS_STORAGE_BUCKET_NAME')
         self.region = os.environ.get('AWS_S3_REGION_NAME')        
+        self.transfer_config = TransferConfig(
+            multipart_threshold=settings.AWS_S3_MULTIPART_CHUNKSIZE,
+            multipart_chunksize=settings.AWS_S3_MULTIPART_CHUNKSIZE,
+            max_concurrency=settings.AWS_S3_MAX_CONCURRENCY,
+        )
+        # key -> (size, etag) of every object under the listed prefixes
+        self.index = {}
+        # prefix -> monotonic time it was last listed
+        self.listed = {}
+        self.index_lock = threading.Lock()
+        # (key, content disposition) -> (url, monotonic expiry)
+        self.presigned = OrderedDict()
+        self.presign_lock = threading.Lock()
+
+    def refresh_index(self, prefix: str = '') -> int:
+        """
+        List every object under prefix with paginated list_objects_v2 and replace
+        the index entries of that prefix. Returns the number of objects found.
+        """
+        objects = {}
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                objects[obj['Key']] = (obj['Size'], obj['ETag'].strip('"'))
+        with self.index_lock:
+            for key in [key for key in self.index if key.startswith(prefix)]:
+                del self.index[key]
+            self.index.update(objects)
+            self.listed[prefix] = time.monotonic()
+        return len(objects)
+
+    def is_indexed(self, key: str) -> bool:
+        """
+        Whether a listing younger than AWS_S3_INDEX_TTL covers the key.
+        """
+        now = time.monotonic()
+        return any(
+            key.startswith(prefix) and now - listed < settings.AWS_S3_INDEX_TTL
+            for prefix, listed in list(self.listed.items())
+        )
+
+    def ensure_indexed(self, keys) -> None:
+        """
+        List the directories of the keys no fresh listing covers, once per directory.
+        """
+        prefixes = {key.rpartition('/')[0] + '/' if '/' in key else '' for key in keys if not self.is_indexed(key)}
+        for prefix in prefixes:
+            # Listing a parent directory covers its subdirectories too
+            if not any(prefix != other and prefix.startswith(other) for other in prefixes):
+                self.refresh_index(prefix)
+
+    def object_info(self, key: str):
+        """
+        Return the (size, etag) of an object, or None when the bucket has no such key.
+        """
+        self.ensure_indexed([key])
+        return self.index.get(key)
+
+    def key_for(self, path: str) -> str:
+        """
+        Object key of a library file: its path relative to MEDIA_ROOT.
+        """
+        return os.path.relpath(os.path.realpath(path), os.path.realpath(settings.MEDIA_ROOT)).replace(os.sep, '/')
+
+    def checksums(self, path: str) -> tuple[str, str]:
+        """
+        Return the sha256 of a file and the ETag S3 gives it when uploaded with our part size.
+        """
+        sha256, whole, parts = hashlib.sha256(), hashlib.md5(), []
+        chunksize = self.transfer_config.multipart_chunksize
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunksize), b''):
+                sha256.update(chunk)
+                whole.update(chunk)
+                parts.append(hashlib.md5(chunk).digest())
+        if os.path.getsize(path) < self.transfer_config.multipart_threshold:
+            etag = whole.hexdigest()
+        else:
+            etag = f"{hashlib.md5(b''.join(parts)).hexdigest()}-{len(parts)}"
+        return sha256.hexdigest(), etag
+
+    def remote_checksums(self, key: str):
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        return head.get('Metadata', {}).get('sha256'), head['ETag'].strip('"')
+
+    def upload(self, path: str, key: str = None) -> dict:
+        """
+        Upload a file with concurrent multipart transfers, skipping it when the
+        bucket already holds an object with the same content.
+        """
+        key = key or self.key_for(path)
+        sha256, etag = self.checksums(path)
+        indexed = self.object_info(key)
+        if indexed and indexed[1] == etag:
+            return {'key': key, 'url': self.file_url({}, key), 'skipped': True}
+        # A differing ETag can still be the same content uploaded with another part size
+        remote = self.remote_checksums(key) if indexed else None
+        if remote and remote[0] == sha256:
+            return {'key': key, 'url': self.file_url({}, key), 'skipped': True}
+        self.client.upload_file(
+            path, self.bucket, key,
+            ExtraArgs={'Metadata': {'sha256': sha256}},
+            Config=self.transfer_config,
+        )
+        with self.index_lock:
+            self.index[key] = (os.path.getsize(path), etag)
+        return {'key': key, 'url': self.file_url({}, key), 'skipped': False}
+
+    def upload_many(self, paths: list[str]) -> dict:
+        """
+        Upload several files, AWS_S3_UPLOAD_WORKERS at a time. Returns the upload result per path.
+        """
+        def upload(path):
+            try:
+                return path, self.upload(path)
+            except (BotoCoreError, ClientError, OSError) as e:
+                log(f"Error uploading {path} to S3: {e}")
+                return path, None
+
+        try:
+            self.ensure_indexed([self.key_for(path) for path in paths])
+        except (BotoCoreError, ClientError) as e:
+            # Every upload retries the listing of its own directory
+            log(f"Error listing S3 objects: {e}")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=settings.AWS_S3_UPLOAD_WORKERS) as executor:
+            return dict(executor.map(upload, paths))
     
+    def presigned_url(self, key: str, filename: str = None, as_attachment: bool = True) -> tuple[str, int]:
+        """
+        Return a presigned GET URL for an object and the seconds it stays valid.
+        URLs are reused until AWS_S3_PRESIGN_MARGIN seconds before they expire.
+        """
+        disposition = content_disposition_header(as_attachment, filename or key.rpartition('/')[2])
+        cache_key = (key, disposition)
+        now = time.monotonic()
+        with self.presign_lock:
+            cached = self.presigned.get(cache_key)
+            if cached and cached[1] - now > settings.AWS_S3_PRESIGN_MARGIN:
+                self.presigned.move_to_end(cache_key)
+                return cached[0], int(cached[1] - now)
+
+        url = self.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': key, 'ResponseContentDisposition': disposition},
+            ExpiresIn=settings.AWS_S3_PRESIGN_EXPIRES,
+        )
+        with self.presign_lock:
+            self.presigned[cache_key] = (url, now + settings.AWS_S3_PRESIGN_EXPIRES)
+            self.presigned.move_to_end(cache_key)
+            while len(self.presigned) > self.PRESIGN_CACHE_SIZE:
+                self.presigned.popitem(last=False)
+        return url, settings.AWS_S3_PRESIGN_EXPIRES
+
     def file_exists(self, key: str):
-        try:
-            self.client.head_object(Bucket=self.bucket, Key=key)
-            return True
-        except:
-            return False
+        return self.object_info(key) is not None
         
     def file_url(self, track, key: str):
         track['s3_file_key'] = key
@@ -179,25 +728,80 @@ class S3Client:
         return track['s3_file_url']
 
     def delete(self, key):
-        try:
-            self.client.delete_object(Bucket=self.bucket, Key=key)
-            return True
-        except:
-            return False
+        return not self.delete_many([key])
+
+    def delete_many(self, keys) -> list[str]:
+        """
+        Delete objects with delete_objects, DELETE_BATCH_SIZE keys per request.
+        Returns the keys that could not be deleted.
+        """
+        keys = list(dict.fromkeys(keys))
+        failed = []
+        for start in range(0, len(keys), self.DELETE_BATCH_SIZE):
+            batch = keys[start:start + self.DELETE_BATCH_SIZE]
+            try:
+                response = self.client.delete_objects(
+                    Bucket=self.bucket,
+                    Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True},
+                )
+            except (BotoCoreError, ClientError) as e:
+                log(f"Error deleting {len(batch)} objects from S3: {e}")
+                failed.extend(batch)
+                continue
+            for error in response.get('Errors', []):
+                log(f"Error deleting {error['Key']} from S3: {error.get('Message')}")
+                failed.append(error['Key'])
+        deleted = set(keys) - set(failed)
+        with self.index_lock:
+            for key in deleted:
+                self.index.pop(key, None)
+        with self.presign_lock:
+            for cache_key in [cache_key for cache_key in self.presigned if cache_key[0] in deleted]:
+                del self.presigned[cache_key]
+        return failed
 
     def is_image_file(self, file_name) -> bool:
         image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp']
         extension = os.path.splitext(file_name)[1].lower()
         return extension in image_extensions
 
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+def get_s3_client() -> S3Client:
+    """
+    Process-wide S3Client, so its object index is shared by every caller.
+    """
+    global _s3_client
+    with _s3_client_lock:
+        if _s3_client is None:
+            _s3_client = S3Client()
+        return _s3_client
+
 class SpotifyClient:
+    # Items per page of the playlist and album track endpoints
+    PLAYLIST_PAGE_SIZE = 100
+    ALBUM_PAGE_SIZE = 50
+    # A snapshot_id names one exact version of a playlist, so it can stay cached for long
+    SNAPSHOT_TTL = 7 * 24 * 60 * 60
+
     def __init__(self, client_id=None, client_secret=None):
-        load_dotenv()
         self.client_id = client_id or os.getenv('SPOTIPY_CLIENT_ID')
         self.client_secret = client_secret or os.getenv('SPOTIPY_CLIENT_SECRET')
         if not self.client_id or not self.client_secret:
             raise ValueError("SPOTIPY_CLIENT_ID and SPOTIPY_CLIENT_SECRET must be set")
-        self.sp = spotipy.Spotify(auth_manager=SpotifyClientCredentials(client_id=self.client_id, client_secret=self.client_secret))
+        # One pooled session for the API and token calls, sized for the page workers
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=settings.SPOTIFY_PAGE_WORKERS)
+        self.session.mount('https://', adapter)
+        auth_manager = SpotifyClientCredentials(
+            client_id=self.client_id,
+            client_secret=self.client_secret,
+            requests_session=self.session,
+            # Keeps the token in memory until it expires instead of in a .cache file
+            cache_handler=MemoryCacheHandler(),
+        )
+        self.sp = spotipy.Spotify(auth_manager=auth_manager, requests_session=self.session)
 
     @property
     def client_id(self):
@@ -216,10 +820,44 @@ class SpotifyClient:
         self._client_secret = value
 
     def get_playlist_info(self, playlist_url):
+        """
+        Return a playlist or album with every track in ['tracks']['items'],
+        fetching the pages after the first one concurrently. Album tracks are
+        wrapped as {'track': track} like playlist items.
+        """
         playlist_id = self._extract_id_from_url(playlist_url)
+        if '/album/' in playlist_url:
+            album = self.sp.album(playlist_id)
+            album['tracks']['items'] += self._remaining_items(
+                album['tracks'], self.ALBUM_PAGE_SIZE,
+                lambda offset: self.sp.album_tracks(playlist_id, limit=self.ALBUM_PAGE_SIZE, offset=offset),
+            )
+            album['tracks']['items'] = [{'track': track} for track in album['tracks']['items']]
+            album['tracks']['next'] = None
+            return album
+
+        snapshot_id = self.sp.playlist(playlist_id, fields='snapshot_id')['snapshot_id']
+        cache_key = f"spotify:playlist:{playlist_id}:{snapshot_id}"
+        playlist = caches['metadata'].get(cache_key)
+        if playlist is not None:
+            return playlist
         playlist = self.sp.playlist(playlist_id)
+        playlist['tracks']['items'] += self._remaining_items(
+            playlist['tracks'], self.PLAYLIST_PAGE_SIZE,
+            lambda offset: self.sp.playlist_items(playlist_id, limit=self.PLAYLIST_PAGE_SIZE, offset=offset),
+        )
+        playlist['tracks']['next'] = None
+        caches['metadata'].set(cache_key, playlist, self.SNAPSHOT_TTL)
         return playlist
 
+    def _remaining_items(self, first_page, page_size, fetch_page) -> list:
+        offsets = range(len(first_page['items']), first_page['total'], page_size)
+        if not offsets:
+            return []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=settings.SPOTIFY_PAGE_WORKERS) as executor:
+            # map keeps the pages in playlist order
+            return [item for page in executor.map(fetch_page, offsets) for item in page['items']]
+
     def get_track_info(self, track_url):
         track_id = self._extract_id_from_url(track_url)
         track = self.sp.track(track_id)
@@ -233,4 +871,17 @@ class SpotifyClient:
         return url.split("/")[-1].split("?")[0]
 
     def to_json(self, data):
-        return json.dumps(data, indent=4)
\ No newline at end of file
+        return json.dumps(data, indent=4)
+
+_spotify_client = None
+_spotify_client_lock = threading.Lock()
+
+def get_spotify_client() -> SpotifyClient:
+    """
+    Process-wide SpotifyClient, so the access token and HTTP connections are reused.
+    """
+    global _spotify_client
+    with _spotify_client_lock:
+        if _spotify_client is None:
+            _spotify_client = SpotifyClient()
+        return _spotify_client
\ No newline at end of file
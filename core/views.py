@@ -0,0 +1,16 @@
+import hmac
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+from .metrics import render
+
+@require_GET
+def metrics(request):
+    """
+    Download pipeline metrics of this process for Prometheus to scrape.
+    """
+    if settings.METRICS_TOKEN:
+        expected = f'Bearer {settings.METRICS_TOKEN}'
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), expected):
+            return HttpResponse(status=401)
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
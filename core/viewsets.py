@@ -0,0 +1,46 @@
+import logging
+from rest_framework import viewsets
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.permissions import IsAdminUser
+from youtubedl.pagination import parse_bound
+from .models import LogEntry
+from .serializers import LogEntrySerializer
+
+class LogCursorPagination(CursorPagination):
+    """
+    Newest first on the created_at index. A cursor continues from the last row
+    it saw, so deep pages cost the same as the first however large the table.
+    """
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    ordering = ('-created_at', '-id')
+
+class LogEntryViewSet(viewsets.ViewSet):
+    permission_classes = (IsAdminUser,)
+
+    def list(self, request):
+        params = request.query_params
+        queryset = LogEntry.objects.all()
+        if params.get('level'):
+            level = logging.getLevelName(params['level'].upper())
+            if not isinstance(level, int):
+                raise ValidationError({'level': f"Unknown level {params['level']}"})
+            queryset = queryset.filter(level__gte=level)
+        if params.get('logger'):
+            queryset = queryset.filter(logger__startswith=params['logger'])
+        if params.get('request_id'):
+            queryset = queryset.filter(request_id=params['request_id'])
+        if params.get('job_id'):
+            if not params['job_id'].isdigit():
+                raise ValidationError({'job_id': 'Expected a job id'})
+            queryset = queryset.filter(job_id=params['job_id'])
+        if params.get('since'):
+            queryset = queryset.filter(created_at__gte=parse_bound(params['since'], 'since'))
+        if params.get('until'):
+            queryset = queryset.filter(created_at__lt=parse_bound(params['until'], 'until'))
+
+        paginator = LogCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(LogEntrySerializer(page, many=True).data)
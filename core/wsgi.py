@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
 
 application = get_wsgi_application()
+
+# Download jobs run in the server process, take up those a previous one left behind
+from youtubedl.jobs import resume_jobs  # noqa: E402
+
+resume_jobs()
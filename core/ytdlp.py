@@ -0,0 +1,306 @@
+import json
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+from django.conf import settings
+
+try:
+    import yt_dlp
+except ImportError:  # pragma: no cover - yt-dlp is in requirements.txt, the CLI may still be on PATH
+    yt_dlp = None
+
+logger = logging.getLogger(__name__)
+
+EXTRACT_ARGS = ('--skip-download', '--print-json')
+# Lists the entries of a playlist or search without extracting every video
+FLAT_ARGS = (*EXTRACT_ARGS, '--flat-playlist')
+SEARCH_ARGS = FLAT_ARGS
+# Prints every progress update of a download as a JSON line behind this marker
+PROGRESS_MARKER = '[ytdlp-progress] '
+PROGRESS_ARGS = ('--newline', '--progress', '--progress-template', f'download:{PROGRESS_MARKER}%(progress)j')
+
+class ListingError(Exception):
+    """
+    yt-dlp stopped listing a URL before its end, the entries yielded so far are
+    not the whole playlist.
+    """
+
+class Listing(list):
+    """
+    The entries extract_info got. When some failed, a private or deleted video
+    or a page that did not load, incomplete holds yt-dlp's errors and the
+    entries are only those it could extract.
+    """
+    incomplete = None
+
+class SubprocessEngine:
+    """
+    Runs every extraction and download through a separate ``yt-dlp`` process.
+    """
+    name = 'subprocess'
+
+    def __init__(self, executable='yt-dlp', env=None) -> None:
+        self.executable = executable
+        self.env = env
+
+    def extract_info(self, url: str, args=EXTRACT_ARGS) -> Listing:
+        listing = Listing()
+        try:
+            for entry in self.iter_entries(url, args):
+                listing.append(entry)
+        except ListingError as e:
+            # yt-dlp exits non-zero when any entry failed, the entries it printed are still good
+            listing.incomplete = str(e)
+        return listing
+
+    def iter_entries(self, url: str, args=FLAT_ARGS):
+        """
+        Yield the entries of url as yt-dlp prints them, while it is still listing
+        the rest. Raises ListingError after the last entry when yt-dlp failed.
+        """
+        command = [self.executable, *args, url]
+        # stderr goes to a file, a full pipe would stall yt-dlp while we only read stdout
+        with tempfile.TemporaryFile() as errors:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=errors, text=True, env=self.env)
+            try:
+                for line in process.stdout:
+                    strip = line.strip()
+                    if strip:
+                        yield json.loads(strip)
+            finally:
+                if process.poll() is None:
+                    process.kill()
+                process.stdout.close()
+                process.wait()
+                errors.seek(0)
+                message = errors.read().decode()
+                if message:
+                    logger.error(f"Error extracting metadata of {url}: {message.strip()}")
+        if process.returncode != 0:
+            raise ListingError(message or f"yt-dlp exited with {process.returncode}")
+
+    def _download(self, command: list, progress=None) -> tuple[int, str, list[str]]:
+        """
+        Run a download, handing each progress update to progress as yt-dlp prints
+        it. Returns the exit code, stderr and the JSON lines of stdout.
+        """
+        if progress:
+            command = [command[0], *PROGRESS_ARGS, *command[1:]]
+        lines = []
+        with tempfile.TemporaryFile() as errors:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=errors, text=True, env=self.env)
+            for line in process.stdout:
+                if line.startswith(PROGRESS_MARKER):
+                    if progress:
+                        progress(json.loads(line[len(PROGRESS_MARKER):]))
+                elif line.startswith('{'):
+                    # --progress also prints yt-dlp's own [download] lines, only the JSON ones are kept
+                    lines.append(line)
+            process.stdout.close()
+            process.wait()
+            errors.seek(0)
+            return process.returncode, errors.read().decode(), lines
+
+    def download(self, url: str, output: str, args=(), progress=None) -> tuple[bool, str]:
+        returncode, errors, _ = self._download([self.executable, *args, '-o', output, url], progress)
+        return returncode == 0, errors
+
+    def download_info(self, url: str, output: str, args=(), progress=None) -> tuple[bool, str, dict]:
+        """
+        Download like download() and also return the info yt-dlp extracted for it.
+        """
+        returncode, errors, lines = self._download([self.executable, *args, '--print-json', '-o', output, url], progress)
+        info = json.loads(lines[-1]) if lines else None
+        return returncode == 0, errors, info
+
+class _YtDlpLogger:
+    """
+    Routes yt-dlp output to our logger and keeps the errors of the current call.
+    """
+    def __init__(self) -> None:
+        self.errors = []
+
+    def debug(self, message):
+        logger.debug(message)
+
+    def info(self, message):
+        logger.debug(message)
+
+    def warning(self, message):
+        logger.warning(message)
+
+    def error(self, message):
+        self.errors.append(message)
+        logger.error(message)
+
+    def failed(self, error) -> None:
+        # yt-dlp raises most errors after reporting them, those are logged once
+        if str(error) not in self.errors:
+            self.error(str(error))
+
+class InProcessEngine:
+    """
+    Runs yt-dlp through its Python API.
+
+    ``YoutubeDL`` instances are built from the same command line arguments the
+    subprocess engine uses and are pooled per argument set, so the extractor
+    instances, HTTP handlers and parsed options they hold are reused across
+    tracks and across requests. An instance is only ever used by one thread
+    at a time.
+    """
+    name = 'inprocess'
+
+    def __init__(self, extractors=()) -> None:
+        self.extractors = tuple(extractors)
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _build(self, args: tuple):
+        # Results are returned rather than printed, --print-json would only write them to our stdout
+        params = yt_dlp.parse_options([arg for arg in args if arg != '--print-json']).ydl_opts
+        params.update({'quiet': True, 'noprogress': True})
+        # The CLI discards playlist entries once it has printed them, here they are the result
+        if params.get('extract_flat') == 'discard_in_playlist':
+            params['extract_flat'] = False
+        ydl = yt_dlp.YoutubeDL(params, auto_init=False)
+        # Extra extractors go first, the default generic extractor would otherwise claim every URL
+        for extractor in self.extractors:
+            ydl.add_info_extractor(extractor())
+        ydl.add_default_info_extractors()
+        # Hands progress to the hook of whichever call holds the instance, see download()
+        def progress(status):
+            callback = ydl.params.get('progress_callback')
+            if callback:
+                callback(status)
+        ydl.add_progress_hook(progress)
+        return ydl
+
+    def _acquire(self, args: tuple):
+        with self._lock:
+            idle = self._idle.get(args)
+            if idle:
+                return idle.pop()
+        return self._build(args)
+
+    def _release(self, args: tuple, ydl) -> None:
+        ydl.params['logger'] = None
+        ydl.params['progress_callback'] = None
+        # yt-dlp never resets the exit code of a failed download, the next call would fail with it
+        ydl._download_retcode = 0
+        with self._lock:
+            self._idle.setdefault(args, []).append(ydl)
+
+    def extract_info(self, url: str, args=EXTRACT_ARGS) -> Listing:
+        args = tuple(args)
+        ydl = self._acquire(args)
+        ydl.params['logger'] = log = _YtDlpLogger()
+        try:
+            result = ydl.extract_info(url, download=False)
+        except yt_dlp.utils.YoutubeDLError as e:
+            log.failed(e)
+            result = None
+        finally:
+            self._release(args, ydl)
+        listing = Listing()
+        if result is not None:
+            entries = result.get('entries') if result.get('_type') == 'playlist' else [result]
+            listing.extend(ydl.sanitize_info(entry) for entry in entries or [] if entry)
+        if log.errors:
+            listing.incomplete = os.linesep.join(log.errors)
+        return listing
+
+    def iter_entries(self, url: str, args=FLAT_ARGS):
+        """
+        Yield the entries of url while the extractor is still paging through the
+        rest. Playlist entries get the playlist and URL fields the CLI prints.
+        Raises ListingError after the last entry when a page failed.
+        """
+        args = tuple(args)
+        ydl = self._acquire(args)
+        ydl.params['logger'] = log = _YtDlpLogger()
+        try:
+            # Unprocessed, the entries stay the extractor's lazy generator
+            result = ydl.extract_info(url, download=False, process=False)
+            if result is None:
+                return
+            if result.get('_type') != 'playlist':
+                yield ydl.sanitize_info(result)
+                return
+            playlist = {
+                'playlist_title': result.get('title'),
+                'playlist_id': result.get('id'),
+                'playlist_uploader': result.get('uploader'),
+            }
+            for index, entry in enumerate(result.get('entries') or [], 1):
+                if not entry:
+                    continue
+                entry = {**entry, **playlist, 'playlist_index': index}
+                entry.setdefault('webpage_url', entry.get('url'))
+                entry.setdefault('webpage_url_basename', yt_dlp.utils.url_basename(entry['webpage_url']))
+                entry.setdefault('extractor_key', entry.get('ie_key'))
+                yield ydl.sanitize_info(entry)
+        except yt_dlp.utils.YoutubeDLError as e:
+            log.failed(e)
+        finally:
+            self._release(args, ydl)
+        if log.errors:
+            raise ListingError(os.linesep.join(log.errors))
+
+    def download(self, url: str, output: str, args=(), progress=None) -> tuple[bool, str]:
+        args = tuple(args)
+        ydl = self._acquire(args)
+        ydl.params['outtmpl']['default'] = output
+        ydl.params['logger'] = log = _YtDlpLogger()
+        ydl.params['progress_callback'] = progress
+        try:
+            retcode = ydl.download([url])
+        except yt_dlp.utils.YoutubeDLError as e:
+            log.failed(e)
+            retcode = 1
+        finally:
+            self._release(args, ydl)
+        return retcode == 0 and not log.errors, os.linesep.join(log.errors)
+
+    def download_info(self, url: str, output: str, args=(), progress=None) -> tuple[bool, str, dict]:
+        """
+        Download like download() and also return the info yt-dlp extracted for it,
+        from the same extraction.
+        """
+        args = tuple(args)
+        ydl = self._acquire(args)
+        ydl.params['outtmpl']['default'] = output
+        ydl.params['logger'] = log = _YtDlpLogger()
+        ydl.params['progress_callback'] = progress
+        info = None
+        try:
+            info = ydl.extract_info(url, download=True)
+            info = ydl.sanitize_info(info) if info else None
+        except yt_dlp.utils.YoutubeDLError as e:
+            log.failed(e)
+        finally:
+            self._release(args, ydl)
+        return info is not None and not log.errors, os.linesep.join(log.errors), info
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+def get_engine(name: str = None):
+    """
+    Return the shared engine configured by ``YTDLP_ENGINE``. Falls back to the
+    subprocess engine when the yt-dlp package cannot be imported.
+    """
+    name = name or settings.YTDLP_ENGINE
+    if name == InProcessEngine.name and yt_dlp is None:
+        logger.warning("yt_dlp is not importable, falling back to the subprocess engine")
+        name = SubprocessEngine.name
+    with _engines_lock:
+        if name not in _engines:
+            if name == InProcessEngine.name:
+                _engines[name] = InProcessEngine()
+            elif name == SubprocessEngine.name:
+                _engines[name] = SubprocessEngine()
+            else:
+                raise ValueError(f"Unknown yt-dlp engine: {name}")
+        return _engines[name]
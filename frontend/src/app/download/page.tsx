@@ -17,9 +17,17 @@ type FormData = {
   timestamps: { start: string, end: string }[];
 };
 
+type TrackProgress = {
+  name: string;
+  status: string;
+  percent: number | null;
+  speed: number | null;
+  eta: number | null;
+};
+
 const Download: React.FC = () => {
   const router = useRouter();
-  const { download, save_track } = YoutubeDLActions();
+  const { download, job, events, save_track } = YoutubeDLActions();
   const { register, handleSubmit, formState: { errors }, setValue, watch } = useForm<FormData>({
     defaultValues: {
       url: "",
@@ -29,6 +37,7 @@ const Download: React.FC = () => {
 
   const [isLoading, setIsLoading] = useState(false);
   const [downloadLinks, setDownloadLinks] = useState<string[]>([]);
+  const [progress, setProgress] = useState<Record<string, TrackProgress>>({});
 
   const urlPattern = /^(https:\/\/(?:www\.youtube\.com\/(?:watch\?v=.+|playlist\?list=.+)|soundcloud\.com\/.+\/(?:sets\/.+|.+)|open\.spotify\.com\/(?:track\/.+|playlist\/.+)))$/;
   const timestampPattern = /^([0-1][0-9]|2[0-3]):[0-5][0-9]:[0-5][0-9]$/; // hh:mm:ss format validation
@@ -41,11 +50,11 @@ const Download: React.FC = () => {
     };
 
     download(requestData).json((json) => {
-      setIsLoading(false);
-      if (json.success && json.download) {
-        setDownloadLinks(json.download);
-        toast.success("Downloaded");
+      if (json.success && json.id) {
+        setProgress({});
+        followJob(json.id);
       } else {
+        setIsLoading(false);
         toast.error('Error Downloading');
       }
     })
@@ -56,6 +65,57 @@ const Download: React.FC = () => {
       });
   };
 
+  const finishJob = (json: any) => {
+    setIsLoading(false);
+    if (json.status === "succeeded" && json.downloaded) {
+      setDownloadLinks(json.downloaded);
+      toast.success("Downloaded");
+    } else {
+      toast.error('Error Downloading');
+    }
+  };
+
+  const updateTrack = (data: any) => {
+    setProgress((current) => ({
+      ...current,
+      [data.upload_id]: { ...current[data.upload_id], ...data },
+    }));
+  };
+
+  // Follows the job's event stream, polling instead when the stream cannot be opened
+  const followJob = (id: number) => {
+    const source = events(id);
+    source.addEventListener("progress", (event) => updateTrack(JSON.parse((event as MessageEvent).data)));
+    source.addEventListener("track", (event) => {
+      const data = JSON.parse((event as MessageEvent).data);
+      updateTrack({ ...data, percent: data.status === "failed" ? null : 100 });
+    });
+    source.addEventListener("result", (event) => {
+      source.close();
+      finishJob(JSON.parse((event as MessageEvent).data));
+    });
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED) {
+        pollJob(id);
+      }
+    };
+  };
+
+  const pollJob = (id: number) => {
+    job(id).json((json) => {
+      if (json.status === "queued" || json.status === "running") {
+        setTimeout(() => pollJob(id), 2000);
+        return;
+      }
+      finishJob(json);
+    })
+      .catch((err) => {
+        setIsLoading(false);
+        console.log(err);
+        toast.error('Error Downloading');
+      });
+  };
+
   const timestamps = watch("timestamps"); // Use watch to track changes in timestamps
 
   // useEffect to listen for changes in the last "end" timestamp field
@@ -187,6 +247,24 @@ const Download: React.FC = () => {
                 </div>
               </form>
 
+              {Object.keys(progress).length > 0 && (
+                <div className="mt-6">
+                  <h3 className="mb-4 text-lg font-medium text-black dark:text-white">Progress</h3>
+                  <ul>
+                    {Object.entries(progress).map(([id, track]) => (
+                      <li key={id} className="mb-2 flex items-center justify-between text-black dark:text-white">
+                        <span>{track.name}</span>
+                        <span>
+                          {track.status === "failed" ? "Failed" : `${Math.round(track.percent ?? 0)}%`}
+                          {track.status === "downloading" && track.speed ? ` · ${(track.speed / 1048576).toFixed(1)} MiB/s` : ""}
+                          {track.status === "downloading" && track.eta != null ? ` · ${track.eta}s left` : ""}
+                        </span>
+                      </li>
+                    ))}
+                  </ul>
+                </div>
+              )}
+
               {downloadLinks.length > 0 && (
                 <div className="mt-6">
                   <h3 className="mb-4 text-lg font-medium text-black dark:text-white">Download Links</h3>
@@ -13,18 +13,50 @@ const download = (requestData: { url: string; timestamps: { start: string; end:
   return api.post(requestData, "/api/youtubedl/download/");
 };
 
+/**
+ * Fetch the state of a queued download job.
+ * @param {number} id - The job id returned by download.
+ * @returns {Promise} A promise that resolves with the job, including per-track results.
+ */
+const job = (id: number) => {
+  return api.get(`/api/youtubedl/jobs/${id}/`);
+};
+
+/**
+ * Follow a download job's progress as server-sent events. The stream ends
+ * with a "result" event holding the job as saved.
+ * @param {number} id - The job id returned by download.
+ * @returns {EventSource} The open event source, to be closed by the caller.
+ */
+const events = (id: number) => {
+  return new EventSource(`http://localhost:8000/api/youtubedl/jobs/${id}/events`);
+};
+
+/**
+ * Download a library file. Files the bucket holds come as a presigned URL,
+ * anything else is streamed by the API.
+ * @param {string} dir - Path of the file as listed in the job results.
+ */
 const save_track = (dir: string) => {
+  const filename = dir.split("/").pop() || "downloaded_file";
+  const click = (href: string) => {
+    const a = document.createElement("a");
+    a.href = href;
+    a.download = filename;
+    document.body.appendChild(a);
+    a.click();
+    document.body.removeChild(a);
+  };
   return api
-    .post({ dir: dir }, "/api/youtubedl/save_track/")
-    .res(response => response.blob())
-    .then(blob => {
-      const url = window.URL.createObjectURL(blob);
-      const a = document.createElement("a");
-      a.href = url;
-      a.download = dir.split("/").pop() || "downloaded_file";
-      document.body.appendChild(a);
-      a.click();
-      document.body.removeChild(a);
+    .post({ dir: dir, delivery: "url" }, "/api/youtubedl/save_track/")
+    .res(async response => {
+      if (response.headers.get("Content-Type")?.includes("application/json")) {
+        const json = await response.json();
+        click(json.url);
+        return;
+      }
+      const url = window.URL.createObjectURL(await response.blob());
+      click(url);
       window.URL.revokeObjectURL(url);
     })
     .catch(error => {
@@ -39,6 +71,8 @@ const save_track = (dir: string) => {
 export const YoutubeDLActions = () => {
   return {
     download,
+    job,
+    events,
     save_track,
   };
 };
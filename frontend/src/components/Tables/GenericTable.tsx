@@ -2,6 +2,7 @@
 
 import { BRAND } from "@/types/brand";
 import Image from "next/image";
+import { useState } from "react";
 import useSWR from "swr";
 import { fetcher } from "@/app/fetcher"
 
@@ -13,8 +14,16 @@ interface GenericTableProps {
   url: string;
 }
 
+// Cursor links come back absolute, the fetcher prepends the API origin itself
+const relative = (link: string) => {
+  const url = new URL(link);
+  return url.pathname + url.search;
+};
+
 const GenericTable: React.FC<GenericTableProps> = ({ url }) => {
-  const { data: data } = useSWR(url, fetcher);
+  const [page, setPage] = useState(url);
+  const { data: response } = useSWR(page, fetcher);
+  const data = response?.results;
   const headers = data && data.length > 0 ? Object.keys(data[0]) : [];
 
   return (
@@ -66,6 +75,23 @@ const GenericTable: React.FC<GenericTableProps> = ({ url }) => {
           </div>
         ))}
       </div>
+
+      <div className="flex justify-end gap-4 py-4">
+        <button
+          className="text-primary disabled:opacity-50"
+          disabled={!response?.previous}
+          onClick={() => setPage(relative(response.previous))}
+        >
+          Previous
+        </button>
+        <button
+          className="text-primary disabled:opacity-50"
+          disabled={!response?.next}
+          onClick={() => setPage(relative(response.next))}
+        >
+          Next
+        </button>
+      </div>
     </div>
   );
 };
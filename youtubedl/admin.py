@@ -1,8 +1,11 @@
 from django.contrib import admin
-from .models import Track, Playlist, Thumbnail
+from .models import Track, Playlist, Thumbnail, DownloadJob, TrackMatch, DailyStat
 
 # Register your models here.
 
 admin.site.register(Track)
 admin.site.register(Playlist)
-admin.site.register(Thumbnail)
\ No newline at end of file
+admin.site.register(Thumbnail)
+admin.site.register(DownloadJob)
+admin.site.register(TrackMatch)
+admin.site.register(DailyStat)
@@ -0,0 +1,145 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+from botocore.exceptions import BotoCoreError, ClientError
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+from core.utils import get_s3_client, log
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+DELIVERY_MODES = ('local', 'redirect', 'url')
+BLOCK_SIZE = 64 * 1024
+
+def library_path(path: str):
+    """
+    The real path of a file in the library, relative paths being taken from
+    MEDIA_ROOT. None when the path, or a symlink on it, leads outside MEDIA_ROOT.
+    """
+    if not path:
+        return None
+    root = os.path.realpath(settings.MEDIA_ROOT)
+    real_path = os.path.realpath(os.path.join(root, path))
+    return real_path if os.path.commonpath([root, real_path]) == root else None
+
+def file_etag(stat) -> str:
+    return quote_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+
+def parse_range(request, size: int, etag: str, mtime: float):
+    """
+    Return the (start, end) byte range requested, None to send the whole file,
+    or False when the range cannot be satisfied. Only single ranges are
+    honoured, anything else falls back to the whole file as RFC 9110 allows.
+    """
+    header = request.META.get('HTTP_RANGE')
+    if not header:
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range:
+        if_range_date = parse_http_date_safe(if_range)
+        if if_range != etag and (if_range_date is None or if_range_date < int(mtime)):
+            return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start:
+        if not end:
+            return None
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+def read_range(file_handle, start: int, length: int):
+    try:
+        file_handle.seek(start)
+        while length > 0:
+            chunk = file_handle.read(min(BLOCK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file_handle.close()
+
+def sendfile_response(path: str):
+    """
+    Hand the transfer to the front proxy when SENDFILE_BACKEND is set and the
+    file lives under SENDFILE_ROOT. Returns None when Django has to send it.
+    """
+    backend = settings.SENDFILE_BACKEND
+    root = os.path.realpath(settings.SENDFILE_ROOT)
+    real_path = os.path.realpath(path)
+    if not backend or os.path.commonpath([root, real_path]) != root:
+        return None
+    response = HttpResponse()
+    if backend == 'nginx':
+        response['X-Accel-Redirect'] = settings.SENDFILE_URL.rstrip('/') + '/' + quote(os.path.relpath(real_path, root))
+    elif backend == 'x-sendfile':
+        response['X-Sendfile'] = real_path
+    else:
+        raise ValueError(f"Unknown SENDFILE_BACKEND: {backend}")
+    # The proxy fills these in from the file it serves
+    del response['Content-Type']
+    return response
+
+def serve_file(request, path: str, filename: str = None, as_attachment: bool = True):
+    """
+    Send a file with ETag/Last-Modified validators, single byte-range support
+    and, when configured, zero-copy delivery through the front proxy.
+    """
+    filename = filename or os.path.basename(path)
+    stat = os.stat(path)
+    etag = file_etag(stat)
+    last_modified = http_date(stat.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        response = sendfile_response(path)
+    if response is None:
+        byte_range = parse_range(request, stat.st_size, etag, stat.st_mtime)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+        elif byte_range:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(read_range(open(path, 'rb'), start, length), status=206)
+            response['Content-Length'] = str(length)
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            response['Content-Type'] = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        else:
+            # FileResponse lets the WSGI server use its sendfile based file wrapper
+            response = FileResponse(open(path, 'rb'))
+            response['Content-Length'] = str(stat.st_size)
+            response['Content-Type'] = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    return response
+
+def presigned_location(path: str, filename: str = None):
+    """
+    Return (url, expires_in) of a presigned URL for the bucket copy of a library
+    file, or None when there is no copy and the file has to be served locally.
+    """
+    s3 = get_s3_client()
+    if s3.client is None:
+        return None
+    key = s3.key_for(path)
+    if key.startswith('../'):
+        return None
+    try:
+        if not s3.file_exists(key):
+            return None
+        return s3.presigned_url(key, filename=filename or os.path.basename(path))
+    except (BotoCoreError, ClientError) as e:
+        log(f"Error signing {key}, serving it locally: {e}")
+        return None
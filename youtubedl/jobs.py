@@ -0,0 +1,201 @@
+import concurrent.futures
+import functools
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from core.log_handler import job_id as log_job_id
+from core.metrics import STAGE_SECONDS, timer
+from core.utils import YoutubeDLHelper, get_s3_client, log
+from .models import Track, DownloadJob
+from .progress import get_broker
+from .serializers import TrackSerializer, PlaylistSerializer, DownloadJobSerializer
+from .stats import invalidate_stats
+
+_executor = None
+_executor_lock = threading.Lock()
+# Jobs this process is running, their heartbeats tell other processes they are alive
+_running = set()
+_running_lock = threading.Lock()
+
+def get_executor() -> concurrent.futures.ThreadPoolExecutor:
+    """
+    Return the process-wide worker pool, starting it (and picking up any jobs
+    still queued from a previous run) on first use.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            return _executor
+        _executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=settings.YOUTUBEDL_JOB_WORKERS,
+            thread_name_prefix='youtubedl-job',
+        )
+        threading.Thread(target=heartbeat, name='youtubedl-job-heartbeat', daemon=True).start()
+    for job_id in DownloadJob.objects.filter(status=DownloadJob.QUEUED).values_list('id', flat=True):
+        _executor.submit(run_job, job_id)
+    return _executor
+
+def heartbeat() -> None:
+    while True:
+        time.sleep(settings.YOUTUBEDL_JOB_HEARTBEAT)
+        with _running_lock:
+            running = list(_running)
+        if not running:
+            continue
+        try:
+            DownloadJob.objects.filter(pk__in=running, status=DownloadJob.RUNNING).update(heartbeat_at=timezone.now())
+        except DatabaseError as e:
+            log(f"Could not record the heartbeat of download jobs {running}: {e}")
+        finally:
+            close_old_connections()
+
+def fail_stale_jobs(**filters) -> int:
+    """
+    Fail the running jobs whose worker stopped sending heartbeats, because its
+    process crashed or was restarted mid-download. Returns how many were failed.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.YOUTUBEDL_JOB_STALE_AFTER)
+    stale = DownloadJob.objects.filter(status=DownloadJob.RUNNING, **filters).filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__isnull=True)
+    )
+    return stale.update(status=DownloadJob.FAILED, error="Interrupted before it finished", finished_at=timezone.now())
+
+def resume_jobs() -> None:
+    """
+    Take up what an earlier server process left behind, called as the server
+    starts: fail its interrupted jobs and start the pool, which picks up the
+    jobs still queued.
+    """
+    try:
+        failed = fail_stale_jobs()
+        if failed:
+            log(f"Failed {failed} download jobs interrupted by a restart")
+        get_executor()
+    except DatabaseError as e:
+        log(f"Could not resume download jobs: {e}")
+    finally:
+        close_old_connections()
+
+def resume_jobs_in_background() -> threading.Thread:
+    """
+    Run resume_jobs on a thread of its own. ASGI servers import the application
+    inside their event loop, where Django refuses to run queries.
+    """
+    thread = threading.Thread(target=resume_jobs, name='youtubedl-resume-jobs', daemon=True)
+    thread.start()
+    return thread
+
+def enqueue(url: str, **options) -> DownloadJob:
+    job = DownloadJob.objects.create(url=url, options=options)
+    transaction.on_commit(lambda: get_executor().submit(run_job, job.id))
+    return job
+
+def run_job(job_id: int) -> None:
+    close_old_connections()
+    try:
+        # Claim the job atomically so a job resumed by two processes only runs once
+        now = timezone.now()
+        claimed = DownloadJob.objects.filter(pk=job_id, status=DownloadJob.QUEUED).update(
+            status=DownloadJob.RUNNING, started_at=now, heartbeat_at=now
+        )
+        if not claimed:
+            return
+        with _running_lock:
+            _running.add(job_id)
+        job = DownloadJob.objects.get(pk=job_id)
+        ydl = None
+        token = log_job_id.set(job.id)
+        publish = functools.partial(get_broker().publish, job.id)
+        publish('status', {'status': job.status})
+        try:
+            ydl = YoutubeDLHelper(
+                job.url,
+                refresh=job.options.get('refresh', False),
+                audio_format=job.options.get('audio_format'),
+                stream=job.options.get('stream'),
+                progress=publish,
+            )
+            job.type = ydl.type
+            job.platform = ydl.platform
+            job.path = ydl.path
+            publish('status', {'status': job.status, 'type': job.type, 'platform': job.platform, 'path': job.path})
+            ydl.download(timestamps=job.options.get('timestamps'), incremental=job.options.get('incremental', True))
+
+            if ydl.type == 'track':
+                result = handle_download(ydl, TrackSerializer)
+            else:
+                result = handle_download(ydl, PlaylistSerializer)
+
+            job.errors = result['errors']
+            job.status = DownloadJob.SUCCEEDED if result['is_valid'] else DownloadJob.FAILED
+            if result['is_valid'] and settings.AWS_S3_UPLOAD:
+                upload_to_s3(ydl)
+        except (Exception, SystemExit) as e:
+            # YoutubeDLHelper calls exit() on unsupported URLs, which must not take the worker down
+            log(f"Download job {job.id} failed: {e}")
+            job.status = DownloadJob.FAILED
+            job.error = str(e)
+        finally:
+            if ydl is not None:
+                job.downloaded = ydl.downloaded
+                job.results = ydl.results
+                job.sync = ydl.sync
+            job.finished_at = timezone.now()
+            try:
+                job.save()
+            finally:
+                log_job_id.reset(token)
+                # Listeners stop at the result, it is published even when the save failed
+                publish('result', DownloadJobSerializer(job).data)
+    finally:
+        with _running_lock:
+            _running.discard(job_id)
+        close_old_connections()
+
+def handle_download(ydl, serializer_class):
+    if not ydl.info:
+        return {'instance': None, 'is_valid': False, 'errors': {'tracks': ["No track was downloaded"]}}
+    # Saving upserts on (upload_id, extractor_key), so concurrent jobs for one URL cannot duplicate rows
+    serializer = serializer_class(ydl=ydl)
+    # The serializer keeps compact copies of what it saves, the extracted info can be freed before the writes
+    ydl.info = None
+    labels = {'platform': ydl.platform, 'type': ydl.type}
+    with timer(STAGE_SECONDS, stage='validate', **labels):
+        is_valid = serializer.is_valid()
+    if is_valid:
+        with timer(STAGE_SECONDS, stage='save', **labels):
+            instance = serializer.save()
+        invalidate_stats()
+        return {'instance': instance, 'is_valid': True, 'errors': None}
+    else:
+        return {'instance': None, 'is_valid': False, 'errors': serializer.errors}
+
+def upload_to_s3(ydl) -> None:
+    """
+    Upload the job's tracks and snippets and record where each track now lives.
+    """
+    s3 = get_s3_client()
+    if s3.client is None:
+        return
+    results = [result for result in ydl.results if result['success']]
+    uploads = s3.upload_many([path for result in results for path in [result['path'], *result['snippets']]])
+
+    # Spotify tracks are stored as the YouTube videos they were downloaded from
+    tracks = {track.upload_id: track for track in Track.objects.filter(upload_id__in=[result.get('source_id', result['upload_id']) for result in results])}
+    changed = []
+    for result in results:
+        upload = uploads.get(result['path'])
+        result['snippet_s3_keys'] = [uploads[path]['key'] for path in result['snippets'] if uploads.get(path)]
+        if not upload:
+            continue
+        result['s3_key'] = upload['key']
+        track = tracks.get(result.get('source_id', result['upload_id']))
+        if track:
+            track.s3_file_key = upload['key']
+            track.s3_file_url = upload['url']
+            changed.append(track)
+    Track.objects.bulk_update(changed, ['s3_file_key', 's3_file_url'])
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('youtubedl', '0002_downloadjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='downloadjob',
+            name='sync',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('youtubedl', '0003_downloadjob_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackMatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('spotify_id', models.CharField(max_length=255, unique=True)),
+                ('isrc', models.CharField(blank=True, db_index=True, max_length=20, null=True)),
+                ('video_id', models.CharField(max_length=255)),
+                ('title', models.CharField(max_length=255)),
+                ('duration', models.FloatField(blank=True, null=True)),
+                ('score', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
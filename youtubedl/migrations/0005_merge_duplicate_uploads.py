@@ -0,0 +1,47 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:19
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Keep the oldest row per (upload_id, extractor_key), moving the playlist
+    memberships of the duplicates onto it before they are deleted.
+    """
+    Track = apps.get_model('youtubedl', 'Track')
+    Playlist = apps.get_model('youtubedl', 'Playlist')
+    Membership = Playlist.tracks.through
+    for model, field, other in ((Track, 'track_id', 'playlist_id'), (Playlist, 'playlist_id', 'track_id')):
+        duplicates = (
+            model.objects.values('upload_id', 'extractor_key')
+            .annotate(keep=Min('id'), count=Count('id'))
+            .filter(count__gt=1)
+        )
+        for duplicate in duplicates:
+            ids = list(
+                model.objects.filter(upload_id=duplicate['upload_id'], extractor_key=duplicate['extractor_key'])
+                .exclude(id=duplicate['keep'])
+                .values_list('id', flat=True)
+            )
+            kept = set(Membership.objects.filter(**{field: duplicate['keep']}).values_list(other, flat=True))
+            for membership in Membership.objects.filter(**{f'{field}__in': ids}):
+                if getattr(membership, other) in kept:
+                    membership.delete()
+                else:
+                    kept.add(getattr(membership, other))
+                    setattr(membership, field, duplicate['keep'])
+                    membership.save()
+            model.objects.filter(id__in=ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('youtubedl', '0004_trackmatch'),
+    ]
+
+    operations = [
+        # Runs in its own migration, PostgreSQL refuses ALTER TABLE while the deletes' deferred triggers are pending
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
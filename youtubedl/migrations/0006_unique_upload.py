@@ -0,0 +1,37 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('youtubedl', '0005_merge_duplicate_uploads'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='playlist',
+            index=models.Index(fields=['extractor'], name='playlist_extractor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(fields=['uploader'], name='track_uploader_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(fields=['extractor'], name='track_extractor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(fields=['-timestamp'], name='track_timestamp_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='playlist',
+            constraint=models.UniqueConstraint(fields=('upload_id', 'extractor_key'), name='playlist_unique_upload'),
+        ),
+        migrations.AddConstraint(
+            model_name='track',
+            constraint=models.UniqueConstraint(fields=('upload_id', 'extractor_key'), name='track_unique_upload'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:21
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_created_at(apps, schema_editor):
+    """
+    Date the rows saved before created_at existed by the best time known for
+    them rather than by this migration: a track by its upload time, a playlist
+    by the upload time of its newest track. Otherwise the first stats windows
+    after the deploy would count the whole library as added that day.
+    """
+    Track = apps.get_model('youtubedl', 'Track')
+    Playlist = apps.get_model('youtubedl', 'Playlist')
+    Track.objects.update(created_at=F('timestamp'))
+    oldest = Track.objects.aggregate(oldest=Min('timestamp'))['oldest']
+    if oldest is None:
+        return
+    newest = Track.objects.filter(playlists=OuterRef('pk')).order_by('-timestamp').values('timestamp')[:1]
+    # Empty playlists predate every track known
+    Playlist.objects.update(created_at=Coalesce(Subquery(newest), Value(oldest)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('youtubedl', '0006_unique_upload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('tracks_added', models.IntegerField(default=0)),
+                ('playlists_added', models.IntegerField(default=0)),
+                ('thumbnails_added', models.IntegerField(default=0)),
+                ('tracks_total', models.IntegerField(default=0)),
+                ('playlists_total', models.IntegerField(default=0)),
+                ('thumbnails_total', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='playlist',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_created_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='playlist',
+            index=models.Index(fields=['created_at'], name='playlist_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(fields=['created_at'], name='track_created_at_idx'),
+        ),
+    ]
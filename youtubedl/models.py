@@ -22,6 +22,19 @@ class Track(models.Model):
     extractor_key = models.CharField(max_length=50)
     tbr = models.FloatField(null=True)
     ext = models.CharField(max_length=10)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # upload_id leads so lookups by upload_id alone use the index too
+            models.UniqueConstraint(fields=['upload_id', 'extractor_key'], name='track_unique_upload'),
+        ]
+        indexes = [
+            models.Index(fields=['uploader'], name='track_uploader_idx'),
+            models.Index(fields=['extractor'], name='track_extractor_idx'),
+            models.Index(fields=['-timestamp'], name='track_timestamp_idx'),
+            models.Index(fields=['created_at'], name='track_created_at_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -33,6 +46,16 @@ class Playlist(models.Model):
     extractor_key = models.CharField(max_length=50)
     webpage_url = models.URLField(max_length=1024)
     tracks = models.ManyToManyField(Track, related_name='playlists')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['upload_id', 'extractor_key'], name='playlist_unique_upload'),
+        ]
+        indexes = [
+            models.Index(fields=['extractor'], name='playlist_extractor_idx'),
+            models.Index(fields=['created_at'], name='playlist_created_at_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -46,3 +69,71 @@ class Thumbnail(models.Model):
     def __str__(self):
         display_text = f"{self.width}x{self.height}" if self.width and self.height else "original"
         return f'{self.track.title} - {display_text}'
+
+class DownloadJob(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    url = models.URLField(max_length=1024)
+    options = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    type = models.CharField(max_length=20, blank=True)
+    platform = models.CharField(max_length=20, blank=True)
+    path = models.CharField(max_length=1024, blank=True)
+    downloaded = models.JSONField(default=list, blank=True)
+    results = models.JSONField(default=list, blank=True)
+    sync = models.JSONField(blank=True, null=True)
+    errors = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    # Refreshed while a worker runs the job, see youtubedl.jobs.fail_stale_jobs
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f'DownloadJob(id={self.id}) {self.status} {self.url}'
+
+class TrackMatch(models.Model):
+    """
+    The YouTube video a Spotify track was resolved to. Looked up by Spotify id
+    and by ISRC, so a song is only ever searched for once.
+    """
+    spotify_id = models.CharField(max_length=255, unique=True)
+    isrc = models.CharField(max_length=20, blank=True, null=True, db_index=True)
+    video_id = models.CharField(max_length=255)
+    title = models.CharField(max_length=255)
+    duration = models.FloatField(blank=True, null=True)
+    score = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def video_url(self):
+        return f'https://www.youtube.com/watch?v={self.video_id}'
+
+    def __str__(self):
+        return f'{self.spotify_id} -> {self.video_id}'
+
+class DailyStat(models.Model):
+    """
+    Library additions and totals per day, rolled up by the rollup_stats command
+    so charts read one row per day instead of scanning the library.
+    """
+    date = models.DateField(unique=True)
+    tracks_added = models.IntegerField(default=0)
+    playlists_added = models.IntegerField(default=0)
+    thumbnails_added = models.IntegerField(default=0)
+    tracks_total = models.IntegerField(default=0)
+    playlists_total = models.IntegerField(default=0)
+    thumbnails_total = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.date}: {self.tracks_total} tracks, {self.playlists_total} playlists'
@@ -0,0 +1,50 @@
+from datetime import datetime, timezone
+
+# Track columns copied as they are from a yt-dlp info dict
+TRACK_FIELDS = (
+    'title', 'uploader', 'uploader_id', 'uploader_url', 'duration', 'webpage_url', 'repost_count',
+    'webpage_url_basename', 'webpage_url_domain', 'extractor', 'extractor_key', 'tbr', 'ext',
+)
+# Columns yt-dlp leaves out or reports as None or 'none' for some sites
+TRACK_DEFAULTS = {
+    'view_count': 0,
+    'like_count': 0,
+    'comment_count': 0,
+    'genre': '',
+}
+THUMBNAIL_FIELDS = ('url', 'width', 'height')
+# Info keys normalize_track and PlaylistSerializer read
+INFO_FIELDS = (*TRACK_FIELDS, *TRACK_DEFAULTS, 'id', 'timestamp', 'upload_date', 'thumbnails', 'playlist_title', 'playlist_id')
+
+def normalize_thumbnail(thumbnail: dict) -> dict:
+    return {field: thumbnail[field] for field in THUMBNAIL_FIELDS if field in thumbnail}
+
+def normalize_track(info: dict) -> dict:
+    """
+    Project a yt-dlp info dict onto the fields TrackSerializer takes. The info is
+    left untouched and nothing outside the allowlist is copied, so the record
+    stays small however much yt-dlp extracts and the info can be freed after.
+    """
+    track = {field: info[field] for field in TRACK_FIELDS if field in info}
+    track['upload_id'] = info.get('id')
+    for field, default in TRACK_DEFAULTS.items():
+        value = info.get(field)
+        track[field] = default if value is None or value == 'none' else value
+
+    if info.get('timestamp') is not None:
+        track['timestamp'] = datetime.fromtimestamp(info['timestamp'], tz=timezone.utc)
+    elif info.get('upload_date'):
+        track['timestamp'] = datetime.strptime(info['upload_date'], "%Y%m%d").replace(tzinfo=timezone.utc)
+
+    track['thumbnails'] = [normalize_thumbnail(thumbnail) for thumbnail in info.get('thumbnails') or []]
+    return track
+
+def slim_info(info: dict) -> dict:
+    """
+    The part of a yt-dlp info dict the serializers read, still shaped like one,
+    for keeping the metadata of every track of a long playlist in memory.
+    """
+    slim = {field: info[field] for field in INFO_FIELDS if field in info}
+    if 'thumbnails' in slim:
+        slim['thumbnails'] = [normalize_thumbnail(thumbnail) for thumbnail in slim['thumbnails'] or []]
+    return slim
@@ -0,0 +1,75 @@
+from django.db.models import Prefetch
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+from .models import Track, Playlist
+
+# Columns the list endpoint loads and returns for tracks
+TRACK_LIST_FIELDS = (
+    'id', 'title', 'upload_id', 'uploader', 'timestamp', 'duration', 'webpage_url',
+    'view_count', 'like_count', 'extractor', 'extractor_key', 's3_file_url',
+)
+PLAYLIST_LIST_FIELDS = ('id', 'title', 'upload_id', 'extractor', 'extractor_key', 'webpage_url')
+
+class LibraryCursorPagination(CursorPagination):
+    """
+    Cursor pagination, so deep pages cost the same as the first and rows
+    added meanwhile do not shift pages. The ordering is set per request.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+# Allowed ?ordering= values per list type, the id keeps the cursor position unique
+ORDERINGS = {
+    'tracks': {'timestamp', 'title', 'duration', 'view_count', 'id'},
+    'playlists': {'title', 'id'},
+}
+DEFAULT_ORDERING = {
+    'tracks': '-timestamp',
+    'playlists': '-id',
+}
+
+def parse_bound(value: str, name: str):
+    parsed = parse_datetime(value) or parse_date(value)
+    if parsed is None:
+        raise ValidationError({name: f'Expected an ISO date or datetime, got {value}'})
+    return parsed
+
+def track_filters(params) -> dict:
+    filters = {}
+    if params.get('uploader'):
+        filters['uploader'] = params['uploader']
+    if params.get('since'):
+        filters['timestamp__gte'] = parse_bound(params['since'], 'since')
+    if params.get('until'):
+        filters['timestamp__lt'] = parse_bound(params['until'], 'until')
+    return filters
+
+def list_queryset(type: str, params):
+    """
+    Build the filtered list queryset for tracks or playlists, loading only
+    the listed columns and prefetching playlist tracks in one query. Track
+    filters narrow playlists to those with a matching track, and their
+    tracks to the matching ones.
+    """
+    filters = track_filters(params)
+    tracks = Track.objects.only(*TRACK_LIST_FIELDS).filter(**filters)
+    if type == 'tracks':
+        queryset = tracks
+    else:
+        queryset = Playlist.objects.only(*PLAYLIST_LIST_FIELDS).prefetch_related(Prefetch('tracks', queryset=tracks))
+        if filters:
+            # One filter() call, so a single track has to match all of them
+            queryset = queryset.filter(**{f'tracks__{name}': value for name, value in filters.items()}).distinct()
+    if params.get('extractor'):
+        queryset = queryset.filter(extractor=params['extractor'])
+    return queryset
+
+def list_ordering(type: str, params) -> tuple[str, ...]:
+    ordering = params.get('ordering') or DEFAULT_ORDERING[type]
+    if ordering.lstrip('-') not in ORDERINGS[type]:
+        raise ValidationError({'ordering': f'Unsupported ordering {ordering}, one of {", ".join(sorted(ORDERINGS[type]))}'})
+    if ordering.lstrip('-') == 'id':
+        return (ordering,)
+    return (ordering, '-id' if ordering.startswith('-') else 'id')
@@ -0,0 +1,87 @@
+from collections import defaultdict
+from .models import Track, Playlist, Thumbnail
+
+# Rows per INSERT/UPDATE statement, keeps statements a sane size on very large playlists
+BULK_BATCH_SIZE = 1000
+
+# Natural key of tracks and playlists, backed by their unique constraints
+UPLOAD_KEY = ['upload_id', 'extractor_key']
+
+def upsert(model, rows: list[dict]) -> list:
+    """
+    Insert or update rows on their natural key with a single
+    INSERT ... ON CONFLICT DO UPDATE per batch. Returns the saved instances,
+    with primary keys, in input order. Duplicate keys map to one instance.
+    """
+    instances = {}
+    for row in rows:
+        instances[tuple(row[field] for field in UPLOAD_KEY)] = model(**row)
+    update_fields = sorted({field for row in rows for field in row} - set(UPLOAD_KEY))
+    model.objects.bulk_create(
+        instances.values(),
+        batch_size=BULK_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=UPLOAD_KEY,
+        update_fields=update_fields,
+    )
+    return [instances[tuple(row[field] for field in UPLOAD_KEY)] for row in rows]
+
+def upsert_tracks(tracks_data: list[dict]) -> list[tuple[Track, list[dict]]]:
+    """
+    Upsert validated track data and return (track, thumbnails) in input order.
+    """
+    tracks_data = [dict(data) for data in tracks_data]
+    thumbnails = [data.pop('thumbnails', []) for data in tracks_data]
+    return list(zip(upsert(Track, tracks_data), thumbnails))
+
+def sync_thumbnails(tracks: list[tuple[Track, list[dict]]]) -> None:
+    """
+    Reconcile each track's thumbnails with the given ones, matched on url.
+    """
+    if not tracks:
+        return
+    existing = defaultdict(dict)
+    for thumbnail in Thumbnail.objects.filter(track__in=[track for track, _ in tracks]):
+        existing[thumbnail.track_id][thumbnail.url] = thumbnail
+
+    to_create, to_update, to_delete, done = [], [], [], set()
+    for track, thumbnails in tracks:
+        if track.id in done:
+            continue
+        done.add(track.id)
+        current = existing.get(track.id, {})
+        seen = set()
+        for data in thumbnails:
+            url = data['url']
+            if url in seen:
+                continue
+            seen.add(url)
+            thumbnail = current.get(url)
+            if thumbnail is None:
+                to_create.append(Thumbnail(track=track, **data))
+            elif (thumbnail.width, thumbnail.height) != (data.get('width'), data.get('height')):
+                thumbnail.width, thumbnail.height = data.get('width'), data.get('height')
+                to_update.append(thumbnail)
+        to_delete.extend(thumbnail.id for url, thumbnail in current.items() if url not in seen)
+
+    if to_delete:
+        Thumbnail.objects.filter(id__in=to_delete).delete()
+    if to_update:
+        Thumbnail.objects.bulk_update(to_update, ['width', 'height'], batch_size=BULK_BATCH_SIZE)
+    if to_create:
+        Thumbnail.objects.bulk_create(to_create, batch_size=BULK_BATCH_SIZE)
+
+def sync_playlist_tracks(playlist: Playlist, tracks: list[Track]) -> None:
+    """
+    Make the playlist's memberships match the given tracks, only touching the rows that differ.
+    """
+    through = Playlist.tracks.through
+    current = set(through.objects.filter(playlist=playlist).values_list('track_id', flat=True))
+    wanted = {track.id for track in tracks}
+
+    removed = current - wanted
+    if removed:
+        through.objects.filter(playlist=playlist, track_id__in=removed).delete()
+    added = [through(playlist_id=playlist.id, track_id=track_id) for track_id in dict.fromkeys(track.id for track in tracks) if track_id not in current]
+    if added:
+        through.objects.bulk_create(added, batch_size=BULK_BATCH_SIZE)
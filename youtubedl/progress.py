@@ -0,0 +1,87 @@
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from django.conf import settings
+
+class JobChannel:
+    def __init__(self) -> None:
+        self.history = deque(maxlen=settings.PROGRESS_HISTORY)
+        self.next_id = 1
+        # (event loop, asyncio.Queue) of every connected listener
+        self.listeners = set()
+        self.finished = False
+
+class ProgressBroker:
+    """
+    Fan the progress events of running jobs out to event stream listeners.
+    Jobs publish from their worker threads, listeners are asyncio queues read
+    by the ASGI event loop, so an idle listener costs a queue and no thread.
+    Each channel keeps its latest events so a listener connecting late, or
+    reconnecting with Last-Event-ID, catches up on what it missed.
+    """
+    def __init__(self) -> None:
+        self.channels = OrderedDict()
+        self.lock = threading.Lock()
+
+    def publish(self, job_id: int, event: str, data: dict) -> None:
+        with self.lock:
+            channel = self.channels.get(job_id)
+            if channel is None:
+                channel = self.channels[job_id] = JobChannel()
+            message = {'id': channel.next_id, 'event': event, 'data': data}
+            channel.next_id += 1
+            channel.history.append(message)
+            if event == 'result':
+                channel.finished = True
+                self.prune()
+            listeners = list(channel.listeners)
+        for loop, queue in listeners:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, message)
+            except RuntimeError:
+                # The listener's loop has closed, its stream is gone
+                self.unsubscribe(job_id, (loop, queue))
+
+    def subscribe(self, job_id: int, last_id: int = 0):
+        """
+        Register a listener on the running loop. Returns it with the events
+        published after last_id that it has to replay first.
+        """
+        listener = (asyncio.get_running_loop(), asyncio.Queue())
+        with self.lock:
+            channel = self.channels.get(job_id)
+            if channel is None:
+                channel = self.channels[job_id] = JobChannel()
+            channel.listeners.add(listener)
+            missed = [message for message in channel.history if message['id'] > last_id]
+        return listener, missed
+
+    def unsubscribe(self, job_id: int, listener) -> None:
+        with self.lock:
+            channel = self.channels.get(job_id)
+            if channel is None:
+                return
+            channel.listeners.discard(listener)
+            if not channel.listeners and not channel.history:
+                del self.channels[job_id]
+
+    def is_running(self, job_id: int) -> bool:
+        with self.lock:
+            channel = self.channels.get(job_id)
+            return channel is not None and bool(channel.history) and not channel.finished
+
+    def prune(self) -> None:
+        # Called with the lock held, forgets the oldest finished jobs nobody listens to
+        finished = [job_id for job_id, channel in self.channels.items() if channel.finished and not channel.listeners]
+        for job_id in finished[:max(len(finished) - settings.PROGRESS_FINISHED_JOBS, 0)]:
+            del self.channels[job_id]
+
+_broker = None
+_broker_lock = threading.Lock()
+
+def get_broker() -> ProgressBroker:
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = ProgressBroker()
+        return _broker
@@ -0,0 +1,123 @@
+import concurrent.futures
+import re
+import threading
+import time
+from django.conf import settings
+from django.db.models import Q
+from core.utils import log
+from core.ytdlp import SEARCH_ARGS, get_engine
+from .models import TrackMatch
+
+# Search results scored per track
+SEARCH_RESULTS = 5
+# Candidates this many seconds longer or shorter than the Spotify track are never picked
+MAX_DURATION_DIFF = 15
+# Words that mark a different recording when the Spotify title does not have them
+VERSION_WORDS = {'live', 'cover', 'remix', 'karaoke', 'instrumental', 'acoustic', 'sped', 'slowed', 'nightcore', 'reverb'}
+
+class RateLimiter:
+    """
+    Spaces calls out to at most ``rate`` per second across threads.
+    """
+    def __init__(self, rate: float) -> None:
+        self.interval = 1 / rate
+        self.next = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next)
+            self.next = start + self.interval
+        time.sleep(start - now)
+
+def words(text: str) -> set[str]:
+    return set(re.findall(r'\w+', text.lower()))
+
+def search_query(track: dict) -> str:
+    artists = ', '.join(artist['name'] for artist in track['artists'])
+    return f"{artists} - {track['name']}"
+
+def score(track: dict, candidate: dict):
+    """
+    Score a search result for a Spotify track, higher is better. Duration
+    closeness and title/artist word overlap count 1 each, a version marker the
+    Spotify title lacks (live, remix, ...) costs 1. None when the durations
+    are too far apart to be the same recording.
+    """
+    if not candidate.get('duration') or not track.get('duration_ms'):
+        return None
+    diff = abs(candidate['duration'] - track['duration_ms'] / 1000)
+    if diff > MAX_DURATION_DIFF:
+        return None
+    wanted = words(search_query(track))
+    found = words(f"{candidate.get('title', '')} {candidate.get('channel') or candidate.get('uploader') or ''}")
+    overlap = len(wanted & found) / len(wanted) if wanted else 0
+    penalty = 1 if (found - wanted) & VERSION_WORDS else 0
+    return overlap + (1 - diff / MAX_DURATION_DIFF) - penalty
+
+def isrc_of(track: dict):
+    return (track.get('external_ids') or {}).get('isrc')
+
+def search(track: dict, limiter: RateLimiter):
+    """
+    Search YouTube for a Spotify track and return the best match, unsaved, or None.
+    """
+    limiter.wait()
+    candidates = get_engine().extract_info(f"ytsearch{SEARCH_RESULTS}:{search_query(track)}", args=SEARCH_ARGS)
+    scored = [(score(track, candidate), candidate) for candidate in candidates]
+    scored = [(value, candidate) for value, candidate in scored if value is not None]
+    if not scored:
+        log(f"No YouTube match for Spotify track {track['id']}: {search_query(track)}")
+        return None
+    value, best = max(scored, key=lambda item: item[0])
+    return TrackMatch(
+        spotify_id=track['id'],
+        isrc=isrc_of(track),
+        video_id=best['id'],
+        title=best.get('title', '')[:255],
+        duration=best.get('duration'),
+        score=value,
+    )
+
+def resolve_tracks(tracks: list[dict]) -> dict[str, TrackMatch]:
+    """
+    Map Spotify track ids to their YouTube matches. Known matches are read by
+    track id or ISRC in one query, the others are searched SPOTIFY_RESOLVE_WORKERS
+    at a time and at most SPOTIFY_RESOLVE_RATE searches per second, then stored.
+    Tracks without a match are left out.
+    """
+    tracks = list({track['id']: track for track in tracks if track.get('id')}.values())
+    isrcs = {isrc_of(track) for track in tracks} - {None}
+    known = TrackMatch.objects.filter(Q(spotify_id__in=[track['id'] for track in tracks]) | Q(isrc__in=isrcs))
+    by_id, by_isrc = {}, {}
+    for match in known:
+        by_id[match.spotify_id] = match
+        if match.isrc:
+            by_isrc.setdefault(match.isrc, match)
+
+    matches, to_create, to_search = {}, [], []
+    for track in tracks:
+        if track['id'] in by_id:
+            matches[track['id']] = by_id[track['id']]
+        elif isrc_of(track) in by_isrc:
+            # The same recording on another release, record it under this id too
+            same = by_isrc[isrc_of(track)]
+            match = TrackMatch(spotify_id=track['id'], isrc=same.isrc, video_id=same.video_id, title=same.title, duration=same.duration, score=same.score)
+            matches[track['id']] = match
+            to_create.append(match)
+        else:
+            to_search.append(track)
+
+    if to_search:
+        limiter = RateLimiter(settings.SPOTIFY_RESOLVE_RATE)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=settings.SPOTIFY_RESOLVE_WORKERS) as executor:
+            for match in executor.map(lambda track: search(track, limiter), to_search):
+                if match:
+                    matches[match.spotify_id] = match
+                    to_create.append(match)
+
+    if to_create:
+        # Another job may have resolved the same track meanwhile
+        TrackMatch.objects.bulk_create(to_create, ignore_conflicts=True)
+    return matches
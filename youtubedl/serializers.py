@@ -1,7 +1,10 @@
 from rest_framework import serializers
-from .models import Track, Playlist, Thumbnail
+from .models import Track, Playlist, Thumbnail, DownloadJob, DailyStat
+from .pagination import TRACK_LIST_FIELDS, PLAYLIST_LIST_FIELDS
+from .persistence import upsert, upsert_tracks, sync_thumbnails, sync_playlist_tracks
+from django.db import transaction
+from .normalize import normalize_track
 from core.utils import YoutubeDLHelper
-from datetime import datetime, timezone
 import json
 
 class ThumbnailSerializer(serializers.ModelSerializer):
@@ -18,48 +21,10 @@ class TrackSerializer(serializers.ModelSerializer):
     
     def __init__(self, *args, **kwargs):
         ydl = kwargs.pop('ydl', None)
-        data = kwargs.get('data', None)
         if ydl:
-            data = ydl.info[0]
-        if data:
-            data['upload_id'] = data['id']
-            
-            if 'timestamp' in data:
-                data['timestamp'] = datetime.fromtimestamp(data['timestamp'], tz=timezone.utc)
-            elif 'upload_date' in data:
-                data['timestamp'] = datetime.strptime(data['upload_date'], "%Y%m%d")
-
-            for thumbnail in data['thumbnails']:
-                for k in ['id', 'preference', 'resolution']:
-                    if k in thumbnail:
-                        del thumbnail[k]
-            default_fields = {
-                'view_count': 0,
-                'like_count': 0,
-                'comment_count': 0,
-                'genre': '',
-                'vcodec': 0,
-                'video_ext': 0
-            }
-            for k, default in default_fields.items():
-                if data.get(k) is None or data[k] == "none":
-                    data[k] = default
-            
-            remove_keys = [
-                'id', '__last_playlist_index', '_filename', '_has_drm', '_type', '_version',
-                'aspect_ratio', 'audio_ext', 'description', 'display_id', 'duration_string',
-                'epoch', 'filename','filesize_approx','format_id', 'format', 'formats', 'fulltitle','genres', 
-                'http_headers','license', 'n_entries', 'original_url', 'playlist_autonumber', 
-                'playlist_count','playlist_id', 'playlist_index', 'playlist_title', 
-                'playlist_uploader_id','playlist_uploader', 'playlist', 'preference', 'protocol', 
-                'release_year','requested_subtitles', 'resolution', 'thumbnail', 'upload_date','url', 'vbr', 
-                'video_ext'
-            ]
-            for k in remove_keys:
-                if k in data:
-                    del data[k]
-            
-            kwargs['data'] = data
+            kwargs['data'] = normalize_track(ydl.info[0])
+        elif kwargs.get('data'):
+            kwargs['data'] = normalize_track(kwargs['data'])
         super().__init__(*args, **kwargs)
     
     def to_representation(self, instance):
@@ -70,24 +35,19 @@ class TrackSerializer(serializers.ModelSerializer):
         representation.pop('thumbnails', None)  # Remove 'thumbnails' from the output
         return representation
 
+    @transaction.atomic
     def create(self, validated_data):
-        thumbnails = validated_data.pop('thumbnails', [])
-        track = Track.objects.create(**validated_data)
-        for thumbnail in thumbnails:
-            Thumbnail.objects.create(track=track, **thumbnail)
-        return track
+        # Upserts, so saving a track that is already stored updates it
+        tracks = upsert_tracks([validated_data])
+        sync_thumbnails(tracks)
+        return tracks[0][0]
 
     def update(self, instance, validated_data):
         thumbnails = validated_data.pop('thumbnails', [])
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
-        
-        # Update thumbnails
-        instance.thumbnails.all().delete()
-        for thumbnail in thumbnails:
-            Thumbnail.objects.create(track=instance, **thumbnail)
-        
+        sync_thumbnails([(instance, thumbnails)])
         return instance
 
 class PlaylistSerializer(serializers.ModelSerializer):
@@ -103,44 +63,61 @@ class PlaylistSerializer(serializers.ModelSerializer):
             kwargs['data'] = {
                 'title': data['playlist_title'],
                 'upload_id': data['playlist_id'],
-                'extractor': data['extractor'],
-                'extractor_key': data['extractor_key'],
+                # A Spotify playlist holds the YouTube videos its tracks were downloaded from
+                'extractor': data.get('playlist_extractor', data['extractor']),
+                'extractor_key': data.get('playlist_extractor_key', data['extractor_key']),
                 'webpage_url': ydl.url,
-                'tracks': []
+                # Validated once, by the tracks field
+                'tracks': [normalize_track(track) for track in ydl.info],
             }
-            for track in ydl.info:
-                track_serializer = TrackSerializer(data=track)
-                if track_serializer.is_valid():
-                    kwargs['data']['tracks'].append(track_serializer.validated_data)
-                else:
-                    print(track_serializer.errors)
-                    exit(track_serializer.errors)
         super().__init__(*args, **kwargs)
 
+    @transaction.atomic
     def create(self, validated_data):
+        # Upserts like TrackSerializer.create, tracks shared with other playlists are updated in place
         tracks = validated_data.pop('tracks', [])
-        playlist = Playlist.objects.create(**validated_data)
-        for track in tracks:
-            thumbnails = track.pop('thumbnails', [])
-            track = Track.objects.create(**track)
-            for thumbnail in thumbnails:
-                Thumbnail.objects.create(**thumbnail, track=track)
-            playlist.tracks.add(track)
+        playlist, = upsert(Playlist, [validated_data])
+        tracks = upsert_tracks(tracks)
+        sync_thumbnails(tracks)
+        sync_playlist_tracks(playlist, [track for track, _ in tracks])
         return playlist
-    
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         tracks = validated_data.pop('tracks', [])
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
 
-        # Update tracks and their thumbnails
-        instance.tracks.all().delete()
-        for track in tracks:
-            thumbnails = track.pop('thumbnails', [])
-            track = Track.objects.create(**track)
-            for thumbnail in thumbnails:
-                Thumbnail.objects.create(**thumbnail, track=track)
-            instance.tracks.add(track)
-        
-        return instance
\ No newline at end of file
+        # Only touch the thumbnails and memberships that changed
+        tracks = upsert_tracks(tracks)
+        sync_thumbnails(tracks)
+        sync_playlist_tracks(instance, [track for track, _ in tracks])
+        return instance
+
+class TrackListSerializer(serializers.ModelSerializer):
+    """
+    Read-only track rows for the list endpoint, limited to the columns it loads.
+    """
+    class Meta:
+        model = Track
+        fields = TRACK_LIST_FIELDS
+        read_only_fields = fields
+
+class PlaylistListSerializer(serializers.ModelSerializer):
+    tracks = TrackListSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Playlist
+        fields = (*PLAYLIST_LIST_FIELDS, 'tracks')
+        read_only_fields = fields
+
+class DownloadJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DownloadJob
+        fields = "__all__"
+
+class DailyStatSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DailyStat
+        exclude = ['id']
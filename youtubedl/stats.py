@@ -0,0 +1,93 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import Track, Playlist, Thumbnail, DailyStat
+
+# (card title, DailyStat field prefix, model, creation time lookup, dashboard icon)
+SERIES = (
+    ('Tracks', 'tracks', Track, 'created_at', 'faMusic'),
+    ('Playlists', 'playlists', Playlist, 'created_at', 'faClipboardList'),
+    # Thumbnails are saved with their track
+    ('Thumbnails', 'thumbnails', Thumbnail, 'track__created_at', 'faImage'),
+)
+
+def cache_key(window: int) -> str:
+    return f'youtubedl:stats:{window}'
+
+def invalidate_stats() -> None:
+    cache.delete_many([cache_key(window) for window in settings.STATS_WINDOWS])
+
+def counts(model, created_at: str, since, previous_since) -> dict:
+    """
+    Total rows plus rows added in the current and the previous window, in one aggregate query.
+    """
+    return model.objects.aggregate(
+        total=Count('pk'),
+        current=Count('pk', filter=Q(**{f'{created_at}__gte': since})),
+        previous=Count('pk', filter=Q(**{f'{created_at}__gte': previous_since, f'{created_at}__lt': since})),
+    )
+
+def growth(total: int, added: int) -> str:
+    """
+    How much the library grew over the window, as a percentage of what it held before.
+    """
+    before = total - added
+    if before <= 0:
+        return '100.00%' if added else '0.00%'
+    return f'{added / before * 100:.2f}%'
+
+def library_stats(window: int) -> list[dict]:
+    """
+    Dashboard cards with totals and the growth over the last ``window`` days.
+    Cached for STATS_CACHE_TTL seconds and dropped whenever a download is saved.
+    """
+    stats = cache.get(cache_key(window))
+    if stats is not None:
+        return stats
+    now = timezone.now()
+    since = now - timedelta(days=window)
+    stats = []
+    for title, _, model, created_at, icon in SERIES:
+        result = counts(model, created_at, since, since - timedelta(days=window))
+        stats.append({
+            'title': title,
+            'total': result['total'],
+            'added': result['current'],
+            'rate': growth(result['total'], result['current']),
+            # Arrows compare this window's additions with the previous window's
+            'levelUp': result['current'] > result['previous'],
+            'levelDown': result['current'] < result['previous'],
+            'icon': icon,
+        })
+    cache.set(cache_key(window), stats, settings.STATS_CACHE_TTL)
+    return stats
+
+def rollup(start, end) -> int:
+    """
+    Write the DailyStat rows of the days from start to end inclusive, one grouped
+    query per series. Returns the number of days written.
+    """
+    days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    if not days:
+        return 0
+    rows = {day: DailyStat(date=day) for day in days}
+    for _, name, model, created_at, _ in SERIES:
+        before = model.objects.filter(**{f'{created_at}__date__lt': start}).count()
+        added = dict(
+            model.objects.filter(**{f'{created_at}__date__gte': start, f'{created_at}__date__lte': end})
+            .annotate(day=TruncDate(created_at))
+            .values('day')
+            .annotate(count=Count('pk'))
+            .values_list('day', 'count')
+        )
+        total = before
+        for day in days:
+            total += added.get(day, 0)
+            setattr(rows[day], f'{name}_added', added.get(day, 0))
+            setattr(rows[day], f'{name}_total', total)
+    fields = [f'{name}_{kind}' for _, name, _, _, _ in SERIES for kind in ('added', 'total')]
+    DailyStat.objects.bulk_create(rows.values(), update_conflicts=True, unique_fields=['date'], update_fields=fields)
+    return len(days)
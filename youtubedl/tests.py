@@ -1,3 +1,1049 @@
-from django.test import TestCase
+import asyncio
+import copy
+import logging
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock, skipUnless
+import boto3
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils import timezone
+from django.db import connection
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from core.cache import MetadataCache
+from core.log_handler import DatabaseLogHandler
+from core.models import LogEntry
+from core.utils import S3Client, SpotifyClient, YoutubeDLHelper
+from core.ytdlp import Listing, ListingError
+from . import transcode
+from .jobs import handle_download, resume_jobs, resume_jobs_in_background, run_job, upload_to_s3
+from .models import Track, Playlist, Thumbnail, TrackMatch, DailyStat, DownloadJob
+from .normalize import TRACK_FIELDS, TRACK_DEFAULTS, normalize_track
+from .progress import ProgressBroker
+from .resolver import resolve_tracks
+from .stats import invalidate_stats, rollup
+from .serializers import TrackSerializer, PlaylistSerializer
 
-# Create your tests here.
+try:
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+def track_info(i, playlist_id='PL1', thumbnails=3):
+    """
+    A trimmed down yt-dlp ``--print-json`` entry.
+    """
+    return {
+        'id': f'vid{i}',
+        'title': f'Track {i}',
+        'uploader': 'Uploader',
+        'uploader_id': '@uploader',
+        'uploader_url': 'https://www.youtube.com/@uploader',
+        'timestamp': 1700000000 + i,
+        'duration': 180.0 + i,
+        'webpage_url': f'https://www.youtube.com/watch?v=vid{i}',
+        'view_count': 10 * i,
+        'like_count': i,
+        'comment_count': 0,
+        'webpage_url_basename': 'watch',
+        'webpage_url_domain': 'youtube.com',
+        'extractor': 'youtube',
+        'extractor_key': 'Youtube',
+        'tbr': 129.5,
+        'ext': 'webm',
+        'formats': [{'format_id': str(k)} for k in range(5)],
+        'playlist_title': 'Playlist',
+        'playlist_id': playlist_id,
+        'playlist_index': i,
+        'thumbnails': [
+            {'url': f'https://i.ytimg.com/vi/vid{i}/{k}.jpg', 'width': 120 * k, 'height': 90 * k, 'id': str(k), 'preference': -k}
+            for k in range(1, thumbnails + 1)
+        ],
+    }
+
+class FakeYoutubeDL:
+    def __init__(self, size, start=0, playlist_id='PL1'):
+        self.info = [track_info(i, playlist_id) for i in range(start, start + size)]
+        self.url = f'https://www.youtube.com/playlist?list={playlist_id}'
+
+class PersistenceQueryCountTest(TestCase):
+    # Fixed statements per save plus one per batch of bulk inserted rows, which SQLite keeps small
+    def max_queries(self, size):
+        batches = 1 + (size * 3) // 40
+        return 10 + 2 * batches
+
+    def save_playlist(self, ydl, instance=None):
+        serializer = PlaylistSerializer(instance, ydl=ydl) if instance else PlaylistSerializer(ydl=ydl)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with CaptureQueriesContext(connection) as queries:
+            playlist = serializer.save()
+        return playlist, len(queries)
+
+    def test_create_playlist(self):
+        for size in (1, 10, 100):
+            with self.subTest(size=size):
+                playlist, queries = self.save_playlist(FakeYoutubeDL(size, playlist_id=f'PL{size}'))
+                self.assertLessEqual(queries, self.max_queries(size))
+                self.assertEqual(playlist.tracks.count(), size)
+
+        self.assertEqual(Track.objects.count(), 100)
+        self.assertEqual(Thumbnail.objects.count(), 300)
+
+    def test_update_playlist(self):
+        playlist, _ = self.save_playlist(FakeYoutubeDL(100))
+        track_ids = dict(Track.objects.values_list('upload_id', 'id'))
+
+        ydl = FakeYoutubeDL(100, start=10)
+        ydl.info[0]['title'] = 'Renamed'
+        ydl.info[1]['thumbnails'].pop()
+        playlist, queries = self.save_playlist(ydl, playlist)
+
+        self.assertLessEqual(queries, self.max_queries(100))
+        self.assertEqual(set(playlist.tracks.values_list('upload_id', flat=True)), {f'vid{i}' for i in range(10, 110)})
+        self.assertEqual(Track.objects.get(upload_id='vid10').title, 'Renamed')
+        self.assertEqual(Track.objects.get(upload_id='vid50').id, track_ids['vid50'])
+        self.assertEqual(Thumbnail.objects.filter(track__upload_id='vid11').count(), 2)
+
+    def test_create_track(self):
+        serializer = TrackSerializer(data=track_info(1, thumbnails=30))
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with CaptureQueriesContext(connection) as queries:
+            track = serializer.save()
+        self.assertLessEqual(len(queries), 5)
+        self.assertEqual(track.thumbnails.count(), 30)
+
+    def test_saving_again_upserts(self):
+        first, _ = self.save_playlist(FakeYoutubeDL(10))
+        ydl = FakeYoutubeDL(10)
+        ydl.info[0]['title'] = 'Renamed'
+        # A second job for the same URL saves without looking the playlist up first
+        second, _ = self.save_playlist(ydl)
+
+        self.assertEqual(second.id, first.id)
+        self.assertEqual(Playlist.objects.count(), 1)
+        self.assertEqual(Track.objects.count(), 10)
+        self.assertEqual(Track.objects.get(upload_id='vid0').title, 'Renamed')
+        self.assertEqual(second.tracks.count(), 10)
+
+        serializer = TrackSerializer(data=track_info(0))
+        serializer.is_valid(raise_exception=True)
+        self.assertEqual(serializer.save().id, Track.objects.get(upload_id='vid0').id)
+        self.assertEqual(Track.objects.count(), 10)
+
+class NormalizeTest(TestCase):
+    def test_tracks_are_projected_onto_the_allowlist(self):
+        info = {**track_info(1), 'like_count': None, 'genre': 'none', 'added_by_a_newer_yt_dlp': {'large': 'x' * 1000}}
+        original = copy.deepcopy(info)
+        track = normalize_track(info)
+
+        self.assertEqual(info, original)
+        self.assertEqual(set(track), {*TRACK_FIELDS, *TRACK_DEFAULTS, 'upload_id', 'timestamp', 'thumbnails'} - {'repost_count'})
+        self.assertEqual((track['upload_id'], track['like_count'], track['genre']), ('vid1', 0, ''))
+        self.assertEqual(track['thumbnails'][0], {'url': 'https://i.ytimg.com/vi/vid1/1.jpg', 'width': 120, 'height': 90})
+
+    def test_playlist_tracks_are_validated_once(self):
+        ydl = FakeYoutubeDL(5)
+        with mock.patch.object(TrackSerializer, 'run_validation', autospec=True, side_effect=TrackSerializer.run_validation) as run_validation:
+            serializer = PlaylistSerializer(ydl=ydl)
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(run_validation.call_count, 5)
+
+        ydl = FakeYoutubeDL(2)
+        del ydl.info[1]['uploader']
+        serializer = PlaylistSerializer(ydl=ydl)
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('uploader', serializer.errors['tracks'][1])
+
+AWS_ENV = {
+    'AWS_ACCESS_KEY_ID': 'testing',
+    'AWS_SECRET_ACCESS_KEY': 'testing',
+    'AWS_STORAGE_BUCKET_NAME': 'library',
+    'AWS_S3_REGION_NAME': 'us-east-1',
+    'AWS_S3_ENDPOINT_URL': '',
+}
+CHUNKSIZE = 5 * 1024 * 1024
+
+@skipUnless(mock_aws, "moto is not installed")
+@override_settings(AWS_S3_MULTIPART_CHUNKSIZE=CHUNKSIZE)
+class S3UploadTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        overrides = override_settings(MEDIA_ROOT=self.media_root.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        patcher = mock.patch.dict(os.environ, AWS_ENV)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket='library')
+
+    def count_calls(self, s3, operation):
+        calls = []
+        s3.client.meta.events.register(f'before-call.s3.{operation}', lambda **kwargs: calls.append(operation))
+        return calls
+
+    def write(self, relpath, size):
+        path = os.path.join(self.media_root.name, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+        return path
+
+    def test_upload_skips_unchanged_files(self):
+        s3 = S3Client()
+        large = self.write('youtube/Uploader/Track/large.wav', 2 * CHUNKSIZE + 1)
+        small = self.write('youtube/Uploader/Track/small.wav', 1024)
+
+        uploads = s3.upload_many([large, small])
+        self.assertEqual(uploads[large]['key'], 'youtube/Uploader/Track/large.wav')
+        self.assertFalse(uploads[large]['skipped'])
+        self.assertFalse(uploads[small]['skipped'])
+        # Multipart ETag computed locally matches the one S3 reports
+        self.assertEqual(s3.remote_checksums(uploads[large]['key'])[1], s3.checksums(large)[1])
+
+        uploads = s3.upload_many([large, small])
+        self.assertTrue(uploads[large]['skipped'])
+        self.assertTrue(uploads[small]['skipped'])
+
+        self.write('youtube/Uploader/Track/small.wav', 1024)
+        self.assertFalse(s3.upload(small)['skipped'])
+
+    def test_upload_to_s3_records_track_keys(self):
+        serializer = TrackSerializer(data=track_info(1))
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        path = self.write('youtube/Uploader/Track 1.wav', CHUNKSIZE + 1)
+        snippet = self.write('youtube/Uploader/Track 1/000100_000130.wav', 1024)
+        ydl = mock.Mock(results=[
+            {'upload_id': 'vid1', 'path': path, 'snippets': [snippet], 'success': True},
+            {'upload_id': 'vid2', 'path': None, 'snippets': [], 'success': False},
+        ])
+
+        with mock.patch('youtubedl.jobs.get_s3_client', S3Client):
+            upload_to_s3(ydl)
+        track = Track.objects.get(upload_id='vid1')
+        self.assertEqual(track.s3_file_key, 'youtube/Uploader/Track 1.wav')
+        self.assertIn('library.s3.us-east-1', track.s3_file_url)
+        self.assertEqual(ydl.results[0]['snippet_s3_keys'], ['youtube/Uploader/Track 1/000100_000130.wav'])
+        self.assertNotIn('s3_key', ydl.results[1])
+
+    def test_index_answers_existence_in_memory(self):
+        s3 = S3Client()
+        for i in range(50):
+            s3.client.put_object(Bucket='library', Key=f'youtube/Uploader/Track {i}.wav', Body=b'x' * i)
+        listings = self.count_calls(s3, 'ListObjectsV2')
+        heads = self.count_calls(s3, 'HeadObject')
+
+        self.assertTrue(all(s3.file_exists(f'youtube/Uploader/Track {i}.wav') for i in range(50)))
+        self.assertFalse(s3.file_exists('youtube/Uploader/Missing.wav'))
+        self.assertEqual(s3.object_info('youtube/Uploader/Track 3.wav')[0], 3)
+        self.assertEqual(len(listings), 1)
+        self.assertEqual(heads, [])
+
+        # Another directory is listed on its own, expired prefixes are listed again
+        self.assertFalse(s3.file_exists('soundcloud/Uploader/Track.wav'))
+        with override_settings(AWS_S3_INDEX_TTL=0):
+            self.assertTrue(s3.file_exists('youtube/Uploader/Track 1.wav'))
+        self.assertEqual(len(listings), 3)
+
+    def test_delete_many_batches_requests(self):
+        s3 = S3Client()
+        keys = [f'youtube/Uploader/Track {i}.wav' for i in range(S3Client.DELETE_BATCH_SIZE + 1)]
+        for key in keys:
+            s3.client.put_object(Bucket='library', Key=key, Body=b'')
+        self.assertTrue(s3.file_exists(keys[0]))
+        deletes = self.count_calls(s3, 'DeleteObjects')
+
+        self.assertEqual(s3.delete_many(keys), [])
+        self.assertEqual(len(deletes), 2)
+        self.assertFalse(s3.file_exists(keys[0]))
+        self.assertEqual(s3.refresh_index('youtube/'), 0)
+
+    def test_save_track_delivers_presigned_urls(self):
+        s3 = S3Client()
+        s3.client.put_object(Bucket='library', Key='youtube/Uploader/Track 1.wav', Body=b'audio')
+        path = os.path.join(self.media_root.name, 'youtube/Uploader/Track 1.wav')
+        url = '/api/youtubedl/save_track/'
+
+        with mock.patch('youtubedl.delivery.get_s3_client', return_value=s3):
+            response = self.client.get(url, {'dir': path, 'delivery': 'url'})
+            self.assertEqual(response.status_code, 200)
+            signed = response.json()['url']
+            self.assertIn('Signature', signed)
+            self.assertEqual(self.client.get(url, {'dir': path, 'delivery': 'url'}).json()['url'], signed)
+
+            response = self.client.get(url, {'dir': path, 'delivery': 'redirect'})
+            self.assertEqual(response.status_code, 302)
+            self.assertEqual(response['Location'], signed)
+
+            # Close to expiry a new URL is signed
+            (_, expires), = s3.presigned.values()
+            with override_settings(AWS_S3_PRESIGN_MARGIN=3600):
+                s3.presigned_url('youtube/Uploader/Track 1.wav')
+            (_, renewed), = s3.presigned.values()
+            self.assertGreater(renewed, expires)
+
+            self.assertEqual(self.client.get(url, {'dir': path, 'delivery': 'local'}).status_code, 404)
+            self.assertEqual(self.client.get(url, {'dir': path, 'delivery': 'cdn'}).status_code, 400)
+            self.assertEqual(s3.delete_many(['youtube/Uploader/Track 1.wav']), [])
+            self.assertEqual(s3.presigned, {})
+
+class DeliveryTest(TestCase):
+    url = '/api/youtubedl/save_track/'
+    content = bytes(range(256)) * 4
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media.name, SENDFILE_ROOT=media.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.path = os.path.join(media.name, 'youtube', 'Uploader', 'vid0.wav')
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'wb') as f:
+            f.write(self.content)
+
+    def get(self, **headers):
+        return self.client.get(self.url, {'dir': self.path, 'delivery': 'local'}, **headers)
+
+    def test_ranges(self):
+        response = self.get()
+        self.assertEqual((response.status_code, response['Accept-Ranges'], response['Content-Length']), (200, 'bytes', '1024'))
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+        response = self.get(HTTP_RANGE='bytes=10-19')
+        self.assertEqual((response.status_code, response['Content-Range'], response['Content-Length']), (206, 'bytes 10-19/1024', '10'))
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+
+        response = self.get(HTTP_RANGE='bytes=-100')
+        self.assertEqual(response['Content-Range'], 'bytes 924-1023/1024')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-100:])
+        self.assertEqual(self.get(HTTP_RANGE='bytes=1000-5000')['Content-Range'], 'bytes 1000-1023/1024')
+
+        response = self.get(HTTP_RANGE='bytes=2048-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */1024'))
+        # Multiple ranges are not honoured, the whole file is sent
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-1,5-6').status_code, 200)
+
+    def test_validators(self):
+        etag, last_modified = self.get()['ETag'], self.get()['Last-Modified']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag).status_code, 206)
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=last_modified).status_code, 206)
+        # A range on an older version of the file gets the whole current file
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"').status_code, 200)
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='Thu, 01 Jan 1970 00:00:00 GMT').status_code, 200)
+
+    def test_proxy_sendfile(self):
+        with override_settings(SENDFILE_BACKEND='nginx'):
+            response = self.get()
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/youtube/Uploader/vid0.wav')
+        self.assertEqual(response.content, b'')
+        self.assertNotIn('Content-Type', response)
+        with override_settings(SENDFILE_BACKEND='x-sendfile'):
+            self.assertEqual(self.get()['X-Sendfile'], os.path.realpath(self.path))
+
+    def test_only_library_files_are_served(self):
+        outside = tempfile.NamedTemporaryFile(suffix='.wav')
+        self.addCleanup(outside.close)
+        for path in (outside.name, '/etc/passwd', os.path.join(settings.MEDIA_ROOT, '..', os.path.basename(outside.name))):
+            self.assertEqual(self.client.get(self.url, {'dir': path, 'delivery': 'local'}).status_code, 404)
+        os.symlink(outside.name, os.path.join(settings.MEDIA_ROOT, 'link.wav'))
+        self.assertEqual(self.client.get(self.url, {'dir': 'link.wav', 'delivery': 'local'}).status_code, 404)
+        self.assertEqual(self.client.get(self.url, {'dir': 'youtube/Uploader/vid0.wav', 'delivery': 'local'}).status_code, 200)
+
+# Writes its input to stdout like a transcode, FAKE_FFMPEG_EXIT makes it fail
+FAKE_FFMPEG = """#!/bin/sh
+while [ $# -gt 0 ]; do
+    if [ "$1" = "-i" ]; then input="$2"; fi
+    shift
+done
+cat "$input"
+exit ${FAKE_FFMPEG_EXIT:-0}
+"""
+
+class TranscodeTest(TestCase):
+    url = '/api/youtubedl/stream/'
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.cache_dir = os.path.join(media.name, '.transcode')
+        overrides = override_settings(MEDIA_ROOT=media.name, TRANSCODE_CACHE_DIR=self.cache_dir, TRANSCODE_CACHE_MAX_BYTES=1500)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        bin_dir = os.path.join(media.name, '.bin')
+        os.makedirs(bin_dir)
+        with open(os.path.join(bin_dir, 'ffmpeg'), 'w') as f:
+            f.write(FAKE_FFMPEG)
+        os.chmod(os.path.join(bin_dir, 'ffmpeg'), 0o755)
+        environ = mock.patch.dict(os.environ, {'PATH': os.pathsep.join([bin_dir, os.environ.get('PATH', '')])})
+        environ.start()
+        self.addCleanup(environ.stop)
+        self.path = os.path.join(media.name, 'vid0.wav')
+        with open(self.path, 'wb') as f:
+            f.write(os.urandom(1024))
+
+    def renditions(self):
+        return sorted(name for _, _, names in os.walk(self.cache_dir) for name in names)
+
+    def stream(self, bitrate=128):
+        return self.client.get(self.url, {'dir': self.path, 'codec': 'opus', 'bitrate': bitrate})
+
+    def test_renditions_are_cached_and_evicted_least_recently_used_first(self):
+        response = self.stream()
+        with open(self.path, 'rb') as f:
+            self.assertEqual(b''.join(response.streaming_content), f.read())
+        first, = self.renditions()
+        self.assertTrue(first.endswith('.opus'))
+
+        response = self.stream()
+        self.assertIn('ETag', response)
+        self.assertEqual(response['Content-Disposition'], 'inline; filename="vid0.opus"')
+        self.assertEqual(self.renditions(), [first])
+
+        rendition = transcode.rendition_path(self.path, 'opus', 128)
+        os.utime(rendition, (0, 0))
+        b''.join(self.stream(bitrate=192).streaming_content)
+        self.assertEqual(self.renditions(), [os.path.basename(transcode.rendition_path(self.path, 'opus', 192))])
+
+    def test_failed_and_abandoned_transcodes_leave_no_file(self):
+        with mock.patch.dict(os.environ, {'FAKE_FFMPEG_EXIT': '1'}):
+            b''.join(self.stream().streaming_content)
+        self.assertEqual(self.renditions(), [])
+
+        response = self.stream()
+        next(iter(response.streaming_content))
+        response.close()
+        self.assertEqual(self.renditions(), [])
+
+    def test_only_library_files_are_transcoded(self):
+        outside = tempfile.NamedTemporaryFile(suffix='.wav')
+        self.addCleanup(outside.close)
+        self.assertEqual(self.client.get(self.url, {'dir': outside.name}).status_code, 404)
+        self.assertEqual(self.renditions(), [])
+
+class FakeSpotify:
+    """
+    Serves a playlist and an album of ``size`` tracks the way the Web API pages them.
+    """
+    def __init__(self, size, snapshot_id='snap1'):
+        self.tracks = [{'id': f'sp{i}', 'name': f'Track {i}', 'external_urls': {'spotify': f'https://open.spotify.com/track/sp{i}'}} for i in range(size)]
+        self.snapshot_id = snapshot_id
+        self.calls = []
+
+    def page(self, items, limit, offset):
+        return {'items': items[offset:offset + limit], 'total': len(items), 'limit': limit, 'offset': offset}
+
+    def playlist(self, playlist_id, fields=None):
+        self.calls.append(('playlist', fields))
+        if fields == 'snapshot_id':
+            return {'snapshot_id': self.snapshot_id}
+        items = [{'track': track} for track in self.tracks]
+        return {'id': playlist_id, 'name': 'Playlist', 'snapshot_id': self.snapshot_id, 'owner': {'display_name': 'Owner'}, 'tracks': self.page(items, 100, 0)}
+
+    def playlist_items(self, playlist_id, limit, offset):
+        self.calls.append(('playlist_items', offset))
+        return self.page([{'track': track} for track in self.tracks], limit, offset)
+
+    def album(self, album_id):
+        self.calls.append(('album', None))
+        return {'id': album_id, 'name': 'Album', 'artists': [{'name': 'Artist'}], 'tracks': self.page(self.tracks, 50, 0)}
+
+    def album_tracks(self, album_id, limit, offset):
+        self.calls.append(('album_tracks', offset))
+        return self.page(self.tracks, limit, offset)
+
+@override_settings(CACHES={'metadata': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SpotifyPaginationTest(TestCase):
+    def setUp(self):
+        caches['metadata'].clear()
+        self.spotify = SpotifyClient(client_id='id', client_secret='secret')
+
+    def test_playlist_pages_are_fetched_in_order_and_cached_per_snapshot(self):
+        self.spotify.sp = FakeSpotify(250)
+        playlist = self.spotify.get_playlist_info('https://open.spotify.com/playlist/PL1?si=x')
+        self.assertEqual([item['track']['id'] for item in playlist['tracks']['items']], [f'sp{i}' for i in range(250)])
+        self.assertEqual(sorted(offset for call, offset in self.spotify.sp.calls if call == 'playlist_items'), [100, 200])
+
+        self.spotify.sp.calls.clear()
+        self.assertEqual(len(self.spotify.get_playlist_info('https://open.spotify.com/playlist/PL1')['tracks']['items']), 250)
+        self.assertEqual(self.spotify.sp.calls, [('playlist', 'snapshot_id')])
+
+        self.spotify.sp = FakeSpotify(260, snapshot_id='snap2')
+        self.assertEqual(len(self.spotify.get_playlist_info('https://open.spotify.com/playlist/PL1')['tracks']['items']), 260)
+
+    def test_album_tracks_are_wrapped_like_playlist_items(self):
+        self.spotify.sp = FakeSpotify(120)
+        album = self.spotify.get_playlist_info('https://open.spotify.com/album/AL1')
+        self.assertEqual([item['track']['id'] for item in album['tracks']['items']], [f'sp{i}' for i in range(120)])
+        self.assertEqual(sorted(offset for call, offset in self.spotify.sp.calls if call == 'album_tracks'), [50, 100])
+
+def spotify_track(i, isrc=None, duration=200):
+    return {'id': f'sp{i}', 'name': f'Song {i}', 'artists': [{'name': 'Artist'}], 'duration_ms': duration * 1000, 'external_ids': {'isrc': isrc} if isrc else {}}
+
+class FakeSearchEngine:
+    def __init__(self):
+        self.queries = []
+
+    def extract_info(self, url, args=()):
+        self.queries.append(url)
+        title = url.split(':', 1)[1]
+        return [
+            {'id': 'far', 'title': title, 'channel': 'Artist', 'duration': 260},
+            {'id': 'live', 'title': f'{title} (Live)', 'channel': 'Artist', 'duration': 200},
+            {'id': 'best', 'title': title, 'channel': 'Artist', 'duration': 202},
+            {'id': 'other', 'title': 'Something else', 'channel': 'Someone', 'duration': 200},
+        ]
+
+@override_settings(SPOTIFY_RESOLVE_RATE=1000)
+class ResolverTest(TestCase):
+    def setUp(self):
+        self.engine = FakeSearchEngine()
+        patcher = mock.patch('youtubedl.resolver.get_engine', return_value=self.engine)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_picks_closest_matching_recording(self):
+        matches = resolve_tracks([spotify_track(1), spotify_track(2, duration=500)])
+        self.assertEqual(matches['sp1'].video_id, 'best')
+        self.assertEqual(matches['sp1'].video_url, 'https://www.youtube.com/watch?v=best')
+        self.assertNotIn('sp2', matches)
+        self.assertEqual(list(TrackMatch.objects.values_list('spotify_id', flat=True)), ['sp1'])
+
+    def test_known_tracks_are_never_searched_again(self):
+        resolve_tracks([spotify_track(i, isrc=f'ISRC{i}') for i in range(10)])
+        self.assertEqual(len(self.engine.queries), 10)
+
+        self.engine.queries.clear()
+        # Same ids, and the same recordings under another release's ids
+        tracks = [spotify_track(i, isrc=f'ISRC{i}') for i in range(10)] + [spotify_track(100 + i, isrc=f'ISRC{i}') for i in range(3)]
+        with self.assertNumQueries(2):
+            matches = resolve_tracks(tracks)
+        self.assertEqual(self.engine.queries, [])
+        self.assertEqual(matches['sp101'].video_id, matches['sp1'].video_id)
+        self.assertEqual(TrackMatch.objects.count(), 13)
+
+class FakeStreamingEngine:
+    """
+    Lists a playlist one flat entry at a time, holding the rest back until a worker starts on the first.
+    """
+    def __init__(self, size, fail_after=None):
+        self.size = size
+        # Stops listing with a failed page after this many entries, extract_info returns them as an incomplete listing
+        self.fail_after = fail_after
+        self.listed = 0
+        self.downloads = []
+        self.extractions = []
+        self.track_started = threading.Event()
+        self.overlapped = False
+
+    def iter_entries(self, url, args=()):
+        for i in range(self.size):
+            if i == self.fail_after:
+                raise ListingError("Unable to download API page")
+            if i == 1:
+                self.overlapped = self.track_started.wait(timeout=5)
+            self.listed += 1
+            info = track_info(i)
+            yield {'_type': 'url', 'url': info['webpage_url'], 'id': info['id'], 'title': info['title'], 'uploader': 'Uploader',
+                   'webpage_url': info['webpage_url'], 'webpage_url_basename': 'watch', 'playlist_title': 'Playlist', 'playlist_id': 'PL1'}
+
+    def video(self, url):
+        info = track_info(int(url.rsplit('vid', 1)[1]))
+        for key in ('playlist_title', 'playlist_id', 'playlist_index'):
+            del info[key]
+        return info
+
+    def download_info(self, url, output, args=(), progress=None):
+        self.track_started.set()
+        self.downloads.append(url)
+        if progress:
+            for downloaded in (0, 1, 2, 3):
+                progress({'status': 'downloading', 'downloaded_bytes': downloaded, 'total_bytes': 4, 'speed': 1024.0, 'eta': 4 - downloaded})
+            progress({'status': 'finished', 'downloaded_bytes': 4, 'total_bytes': 4})
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with open(f'{output}.wav', 'wb') as f:
+            f.write(b'RIFF')
+        return True, '', self.video(url)
+
+    def download(self, url, output, args=(), progress=None):
+        return self.download_info(url, output, args, progress)[:2]
+
+    def extract_info(self, url, args=()):
+        if 'list=' in url:
+            listing = Listing(track_info(i) for i in range(self.size if self.fail_after is None else self.fail_after))
+            if self.fail_after is not None:
+                listing.incomplete = "ERROR: [youtube] vid2: Private video"
+            return listing
+        self.track_started.set()
+        self.extractions.append(url)
+        return [self.video(url)]
+
+class StreamingPlaylistTest(TestCase):
+    url = 'https://www.youtube.com/playlist?list=PL1'
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name, AUDIO_STORAGE_FORMAT='wav')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # LocMemCache instances of one name share their entries, each test starts from an empty one
+        backend = LocMemCache('streaming', {})
+        backend.clear()
+        cache_patch = mock.patch('core.utils.get_metadata_cache', return_value=MetadataCache(backend=backend))
+        cache_patch.start()
+        self.addCleanup(cache_patch.stop)
+
+    def download(self, engine, refresh=True, **options):
+        with mock.patch('core.utils.get_engine', return_value=engine):
+            ydl = YoutubeDLHelper(self.url, refresh=refresh, stream=True)
+            self.assertEqual(engine.listed, 1)
+            ydl.download(**options)
+        return ydl
+
+    def test_tracks_download_while_the_playlist_is_listed(self):
+        engine = FakeStreamingEngine(5)
+        ydl = self.download(engine)
+
+        self.assertTrue(engine.overlapped)
+        self.assertEqual(len(engine.downloads), 5)
+        self.assertEqual([info['id'] for info in ydl.info], [f'vid{i}' for i in range(5)])
+        self.assertNotIn('formats', ydl.info[0])
+        self.assertEqual(ydl.info[0]['playlist_title'], 'Playlist')
+
+        result = handle_download(ydl, PlaylistSerializer)
+        self.assertTrue(result['is_valid'], result['errors'])
+        self.assertEqual(result['instance'].tracks.count(), 5)
+
+    def test_incremental_sync_keeps_files_and_still_fetches_their_metadata(self):
+        self.download(FakeStreamingEngine(5))
+        engine = FakeStreamingEngine(3)
+        ydl = self.download(engine, incremental=True)
+
+        self.assertEqual(engine.downloads, [])
+        self.assertEqual(len(engine.extractions), 3)
+        self.assertEqual(ydl.sync, {'added': 0, 'kept': 3, 'removed': 2})
+        self.assertEqual(len(ydl.info), 3)
+        self.assertEqual(sorted(os.listdir(ydl.path)), ['.sync.json', 'vid0.wav', 'vid1.wav', 'vid2.wav'])
+
+    def test_resyncing_an_unchanged_playlist_reads_kept_tracks_from_the_cache(self):
+        self.download(FakeStreamingEngine(3))
+        engine = FakeStreamingEngine(3)
+        ydl = self.download(engine, refresh=False, incremental=True)
+
+        self.assertEqual((engine.downloads, engine.extractions), ([], []))
+        self.assertEqual([info['id'] for info in ydl.info], ['vid0', 'vid1', 'vid2'])
+        self.assertEqual(ydl.info[0]['playlist_title'], 'Playlist')
+        result = handle_download(ydl, PlaylistSerializer)
+        self.assertTrue(result['is_valid'], result['errors'])
+
+    def test_synced_files_are_named_by_upload_id(self):
+        with mock.patch('core.utils.get_engine', return_value=FakeStreamingEngine(3)):
+            YoutubeDLHelper(self.url, refresh=True, stream=False).download()
+        engine = FakeStreamingEngine(5)
+        with mock.patch('core.utils.get_engine', return_value=engine):
+            ydl = YoutubeDLHelper(self.url, refresh=True, stream=False)
+            ydl.download(incremental=True)
+
+        self.assertEqual(ydl.sync, {'added': 2, 'kept': 3, 'removed': 0})
+        self.assertEqual(sorted(engine.downloads), [track_info(i)['webpage_url'] for i in (3, 4)])
+        self.assertEqual(sorted(os.listdir(ydl.path)), ['.sync.json', *[f'vid{i}.wav' for i in range(5)]])
+        self.assertEqual(ydl.read_manifest(), {f'vid{i}': f'vid{i}' for i in range(5)})
+
+    def test_files_of_older_syncs_are_renamed_when_their_name_was_unique(self):
+        ydl = self.download(FakeStreamingEngine(3))
+        os.rename(os.path.join(ydl.path, 'vid0.wav'), os.path.join(ydl.path, 'First.wav'))
+        os.rename(os.path.join(ydl.path, 'vid1.wav'), os.path.join(ydl.path, 'watch.wav'))
+        os.remove(os.path.join(ydl.path, 'vid2.wav'))
+        ydl.write_manifest({'vid0': 'First', 'vid1': 'watch', 'vid2': 'watch'})
+
+        engine = FakeStreamingEngine(3)
+        ydl = self.download(engine, incremental=True)
+        # The shared name held whichever video was written last, it is dropped rather than guessed
+        self.assertEqual(ydl.sync, {'added': 2, 'kept': 1, 'removed': 1})
+        self.assertEqual(sorted(os.listdir(ydl.path)), ['.sync.json', 'vid0.wav', 'vid1.wav', 'vid2.wav'])
+
+    def test_a_failed_listing_removes_nothing(self):
+        ydl = self.download(FakeStreamingEngine(5))
+        with open(os.path.join(ydl.path, '.sync.json')) as f:
+            manifest = f.read()
+        with self.assertRaises(ListingError):
+            ydl = self.download(FakeStreamingEngine(5, fail_after=2), incremental=True)
+
+        self.assertEqual(sorted(os.listdir(ydl.path)), ['.sync.json', *[f'vid{i}.wav' for i in range(5)]])
+        with open(os.path.join(ydl.path, '.sync.json')) as f:
+            self.assertEqual(f.read(), manifest)
+
+    def test_an_incomplete_listing_removes_nothing(self):
+        with mock.patch('core.utils.get_engine', return_value=FakeStreamingEngine(5)):
+            YoutubeDLHelper(self.url, refresh=True, stream=False).download()
+        with mock.patch('core.utils.get_engine', return_value=FakeStreamingEngine(5, fail_after=2)):
+            ydl = YoutubeDLHelper(self.url, refresh=True, stream=False)
+            with self.assertLogs('core.utils', 'INFO') as logs:
+                ydl.download(incremental=True)
+
+        self.assertIn("its listing is incomplete: ERROR: [youtube] vid2: Private video", logs.output[0])
+        self.assertEqual(ydl.sync, {'added': 0, 'kept': 2, 'removed': 0})
+        self.assertEqual(sorted(os.listdir(ydl.path)), ['.sync.json', *[f'vid{i}.wav' for i in range(5)]])
+        # Files missing from the listing stay in the manifest, a complete listing prunes them
+        self.assertEqual(ydl.read_manifest(), {f'vid{i}': f'vid{i}' for i in range(5)})
+        # Neither is the partial listing cached
+        with mock.patch('core.utils.get_engine', return_value=FakeStreamingEngine(5)):
+            self.assertEqual(len(YoutubeDLHelper(self.url, stream=False).info), 5)
+
+    def test_an_empty_listing_is_an_error(self):
+        for stream in (True, False):
+            with self.subTest(stream=stream), mock.patch('core.utils.get_engine', return_value=FakeStreamingEngine(0)):
+                with self.assertRaisesMessage(ListingError, f"Nothing could be extracted from {self.url}"):
+                    YoutubeDLHelper(self.url, refresh=True, stream=stream)
+
+@override_settings(PROGRESS_INTERVAL=60, PROGRESS_KEEPALIVE=1)
+class JobEventsTest(TestCase):
+    url = 'https://www.youtube.com/playlist?list=PL1'
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name, AUDIO_STORAGE_FORMAT='wav')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.broker = ProgressBroker()
+        broker_patch = mock.patch('youtubedl.progress._broker', self.broker)
+        broker_patch.start()
+        self.addCleanup(broker_patch.stop)
+
+    async def read_events(self, job_id, headers=None):
+        response = await self.async_client.get(f'/api/youtubedl/jobs/{job_id}/events', headers=headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        return [block.splitlines() for block in body.split('\n\n') if block]
+
+    def test_running_job_publishes_throttled_progress_and_its_result(self):
+        job = DownloadJob.objects.create(url=self.url, options={'stream': True, 'refresh': True})
+        with mock.patch('core.utils.get_engine', return_value=FakeStreamingEngine(3)), mock.patch('youtubedl.jobs.close_old_connections'):
+            run_job(job.id)
+
+        events = [message['event'] for message in self.broker.channels[job.id].history]
+        self.assertEqual(events[:2], ['status', 'status'])
+        # One downloading event per track gets through the interval, finishing is always sent
+        self.assertEqual(events.count('progress'), 6)
+        self.assertEqual(events.count('track'), 3)
+        self.assertEqual(events[-1], 'result')
+        progress = next(message['data'] for message in self.broker.channels[job.id].history if message['event'] == 'progress')
+        self.assertEqual((progress['upload_id'], progress['percent'], progress['eta']), ('vid0', 0.0, 4))
+        self.assertEqual(self.broker.channels[job.id].history[-1]['data']['status'], DownloadJob.SUCCEEDED)
+        self.assertFalse(self.broker.is_running(job.id))
+
+    async def test_stream_replays_missed_events_then_follows_live_ones(self):
+        job = await DownloadJob.objects.acreate(url=self.url, status=DownloadJob.RUNNING)
+        self.broker.publish(job.id, 'status', {'status': 'running'})
+        self.broker.publish(job.id, 'progress', {'upload_id': 'vid0', 'percent': 50.0})
+        # Published from a worker thread once the stream waits, after a keepalive
+        threading.Timer(1.5, self.broker.publish, [job.id, 'result', {'id': job.id, 'status': 'succeeded'}]).start()
+
+        events = await self.read_events(job.id, headers={'Last-Event-ID': '1'})
+        self.assertEqual(events[0], ['id: 2', 'event: progress', 'data: {"upload_id": "vid0", "percent": 50.0}'])
+        self.assertEqual(events[1], [': keepalive'])
+        self.assertEqual(events[2][:2], ['id: 3', 'event: result'])
+        self.assertEqual(self.broker.channels[job.id].listeners, set())
+
+    def test_streams_served_by_wsgi_follow_live_events(self):
+        job = DownloadJob.objects.create(url=self.url, status=DownloadJob.RUNNING)
+        self.broker.publish(job.id, 'status', {'status': 'running'})
+        response = self.client.get(f'/api/youtubedl/jobs/{job.id}/events')
+        self.assertFalse(response.is_async)
+        chunks = iter(response.streaming_content)
+        self.assertEqual(next(chunks).decode().splitlines()[:2], ['id: 1', 'event: status'])
+
+        # Each event arrives while the job is still running, not once it has ended
+        self.broker.publish(job.id, 'progress', {'upload_id': 'vid0', 'percent': 50.0})
+        self.assertEqual(next(chunks).decode().splitlines()[:2], ['id: 2', 'event: progress'])
+        self.broker.publish(job.id, 'result', {'id': job.id, 'status': 'succeeded'})
+        self.assertEqual(next(chunks).decode().splitlines()[:2], ['id: 3', 'event: result'])
+        self.assertEqual(list(chunks), [])
+        self.assertEqual(self.broker.channels[job.id].listeners, set())
+
+    async def test_finished_jobs_send_their_saved_result(self):
+        job = await DownloadJob.objects.acreate(url=self.url, status=DownloadJob.FAILED, error='Unsupported URL')
+        events = await self.read_events(job.id)
+        self.assertEqual(len(events), 1)
+        self.assertIn('"error": "Unsupported URL"', events[0][2])
+
+        response = await self.async_client.get(f'/api/youtubedl/jobs/{job.id + 1}/events')
+        self.assertEqual(response.status_code, 404)
+
+class JobRecoveryTest(TestCase):
+    url = 'https://www.youtube.com/playlist?list=PL1'
+
+    def test_jobs_interrupted_by_a_restart_are_failed_and_queued_ones_resumed(self):
+        now = timezone.now()
+        stale = DownloadJob.objects.create(url=self.url, status=DownloadJob.RUNNING, started_at=now - timedelta(hours=1), heartbeat_at=now - timedelta(minutes=10))
+        never_beat = DownloadJob.objects.create(url=self.url, status=DownloadJob.RUNNING, started_at=now - timedelta(hours=1))
+        alive = DownloadJob.objects.create(url=self.url, status=DownloadJob.RUNNING, started_at=now - timedelta(hours=1), heartbeat_at=now)
+        with mock.patch('youtubedl.jobs.get_executor') as get_executor:
+            resume_jobs()
+
+        get_executor.assert_called_once_with()
+        for job in (stale, never_beat):
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.error), (DownloadJob.FAILED, "Interrupted before it finished"))
+            self.assertIsNotNone(job.finished_at)
+        alive.refresh_from_db()
+        self.assertEqual(alive.status, DownloadJob.RUNNING)
+
+    async def test_resuming_from_the_event_loop_queries_off_it(self):
+        def off_loop(*args, **kwargs):
+            # Django raises SynchronousOnlyOperation for queries on a thread running an event loop
+            with self.assertRaises(RuntimeError):
+                asyncio.get_running_loop()
+            return 0
+        with mock.patch('youtubedl.jobs.fail_stale_jobs', side_effect=off_loop) as fail_stale_jobs, \
+             mock.patch('youtubedl.jobs.get_executor', side_effect=off_loop) as get_executor:
+            await asyncio.to_thread(resume_jobs_in_background().join)
+        fail_stale_jobs.assert_called_once_with()
+        get_executor.assert_called_once_with()
+
+    async def test_event_streams_of_interrupted_jobs_end(self):
+        job = await DownloadJob.objects.acreate(url=self.url, status=DownloadJob.RUNNING, heartbeat_at=timezone.now() - timedelta(minutes=10))
+        response = await self.async_client.get(f'/api/youtubedl/jobs/{job.id}/events')
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertIn('event: result', body)
+        self.assertIn('"status": "failed"', body)
+
+class ImmediateExecutor:
+    def submit(self, function, *args):
+        function(*args)
+
+@override_settings(CACHES={name: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'} for name in ('default', 'metadata')})
+class JobApiTest(TestCase):
+    url = 'https://www.youtube.com/playlist?list=PL1'
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name, AUDIO_STORAGE_FORMAT='wav', AWS_S3_UPLOAD=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for patch in (
+            mock.patch('core.utils.get_metadata_cache', return_value=MetadataCache(backend=LocMemCache('jobs', {}))),
+            mock.patch('core.utils.get_engine', return_value=FakeStreamingEngine(3)),
+            # Jobs run as their transaction commits, on the test's thread
+            mock.patch('youtubedl.jobs.get_executor', return_value=ImmediateExecutor()),
+            mock.patch('youtubedl.jobs.close_old_connections'),
+            mock.patch('youtubedl.progress._broker', ProgressBroker()),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_download_is_queued_and_polled_until_it_finishes(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/api/youtubedl/download/', {'url': self.url, 'stream': True, 'audio_format': 'wav'}, content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertTrue(job['success'])
+        self.assertEqual(job['status'], DownloadJob.QUEUED)
+        self.assertEqual(job['options'], {'timestamps': [], 'refresh': False, 'incremental': True, 'audio_format': 'wav', 'stream': True})
+        self.assertEqual(self.client.get(f"/api/youtubedl/jobs/{job['id']}/").json()['status'], DownloadJob.QUEUED)
+
+        for callback in callbacks:
+            callback()
+        response = self.client.get(f"/api/youtubedl/jobs/{job['id']}/")
+        self.assertEqual(response.status_code, 200)
+        finished = response.json()
+        self.assertEqual((finished['status'], finished['type'], finished['platform']), (DownloadJob.SUCCEEDED, 'playlist', 'youtube'))
+        self.assertEqual(len(finished['results']), 3)
+        self.assertTrue(all(result['success'] for result in finished['results']))
+        self.assertIsNotNone(finished['finished_at'])
+        self.assertEqual(Track.objects.count(), 3)
+        self.assertEqual([listed['id'] for listed in self.client.get('/api/youtubedl/jobs/').json()], [job['id']])
+
+    def test_failed_jobs_report_their_error(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            job = self.client.post('/api/youtubedl/download/', {'url': 'https://example.com/video'}, content_type='application/json').json()
+        finished = self.client.get(f"/api/youtubedl/jobs/{job['id']}/").json()
+        self.assertEqual(finished['status'], DownloadJob.FAILED)
+        self.assertIn("Unsupported URL", finished['error'])
+
+    def test_failed_tracks_are_logged_with_the_job_id(self):
+        handler = DatabaseLogHandler()
+        handler.start = mock.Mock()
+        logger = logging.getLogger('core.utils')
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        engine = FakeStreamingEngine(2)
+        engine.download = mock.Mock(return_value=(False, 'ERROR: Video unavailable'))
+        with mock.patch('core.utils.get_engine', return_value=engine), self.captureOnCommitCallbacks(execute=True):
+            job = self.client.post('/api/youtubedl/download/', {'url': self.url, 'stream': False}, content_type='application/json').json()
+        handler.flush()
+
+        errors = LogEntry.objects.filter(logger='core.utils', level=logging.ERROR)
+        self.assertEqual(sorted(errors.values_list('message', flat=True)), [
+            'Error downloading vid0: ERROR: Video unavailable',
+            'Error downloading vid1: ERROR: Video unavailable',
+        ])
+        self.assertEqual(set(errors.values_list('job_id', flat=True)), {job['id']})
+
+    def test_invalid_requests_and_unknown_jobs(self):
+        response = self.client.post('/api/youtubedl/download/', {'url': self.url, 'audio_format': 'mp3'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post('/api/youtubedl/download/', {}, content_type='application/json').status_code, 400)
+        self.assertEqual(DownloadJob.objects.count(), 0)
+        self.assertEqual(self.client.get('/api/youtubedl/jobs/12345/').status_code, 404)
+
+@override_settings(CACHES={name: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'} for name in ('default', 'metadata')})
+class SpotifyJobTest(TestCase):
+    url = 'https://open.spotify.com/playlist/SP1'
+
+    def setUp(self):
+        caches['metadata'].clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name, AUDIO_STORAGE_FORMAT='wav')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        spotify = SpotifyClient(client_id='id', client_secret='secret')
+        spotify.sp = FakeSpotify(3)
+        for patcher in (
+            mock.patch('core.utils.get_spotify_client', return_value=spotify),
+            mock.patch('core.utils.get_metadata_cache', return_value=MetadataCache(backend=LocMemCache('spotify', {}))),
+            mock.patch('youtubedl.jobs.close_old_connections'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        TrackMatch.objects.bulk_create([TrackMatch(spotify_id=f'sp{i}', video_id=f'vid{i}', title=f'Track {i}', score=2) for i in range(3)])
+
+    def run_job(self, engine, **options):
+        job = DownloadJob.objects.create(url=self.url, options={'refresh': True, **options})
+        with mock.patch('core.utils.get_engine', return_value=engine):
+            run_job(job.id)
+        job.refresh_from_db()
+        return job
+
+    def test_playlists_are_stored_as_the_matched_videos(self):
+        job = self.run_job(FakeStreamingEngine(3))
+        self.assertEqual(job.status, DownloadJob.SUCCEEDED, job.errors or job.error)
+        playlist = Playlist.objects.get()
+        self.assertEqual((playlist.title, playlist.upload_id, playlist.extractor_key), ('Playlist', 'SP1', 'Spotify'))
+        self.assertEqual(sorted(playlist.tracks.values_list('upload_id', 'extractor_key')), [(f'vid{i}', 'Youtube') for i in range(3)])
+
+        # Kept files take their video's metadata from the cache
+        engine = FakeStreamingEngine(3)
+        job = self.run_job(engine, refresh=False)
+        self.assertEqual(job.status, DownloadJob.SUCCEEDED, job.errors or job.error)
+        self.assertEqual(job.sync, {'added': 0, 'kept': 3, 'removed': 0})
+        self.assertEqual((engine.downloads, engine.extractions), ([], []))
+        self.assertEqual(Playlist.objects.get().tracks.count(), 3)
+
+class ListEndpointTest(TestCase):
+    url = '/api/youtubedl/'
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(6):
+            ydl = FakeYoutubeDL(20, start=i * 20, playlist_id=f'PL{i}')
+            for info in ydl.info:
+                info['uploader'] = f'Uploader {info["playlist_index"] % 2}'
+            serializer = PlaylistSerializer(ydl=ydl)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+
+    def walk(self, params, queries):
+        rows, url = [], self.url
+        while url:
+            with self.assertNumQueries(queries):
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200, response.content)
+            rows += response.json()['results']
+            url, params = response.json()['next'], None
+        return rows
+
+    def test_tracks_are_paginated_in_fixed_queries(self):
+        rows = self.walk({'type': 'tracks', 'page_size': 25}, 1)
+        self.assertEqual(len(rows), 120)
+        self.assertEqual(rows[0]['upload_id'], 'vid119')
+        self.assertNotIn('thumbnails', rows[0])
+        self.assertEqual(len({row['id'] for row in rows}), 120)
+
+    def test_playlists_prefetch_their_tracks(self):
+        rows = self.walk({'type': 'playlists', 'page_size': 4}, 2)
+        self.assertEqual([row['upload_id'] for row in rows], [f'PL{i}' for i in reversed(range(6))])
+        self.assertEqual(len(rows[0]['tracks']), 20)
+
+    def test_filters_and_ordering(self):
+        rows = self.walk({'type': 'tracks', 'uploader': 'Uploader 1', 'ordering': 'duration', 'page_size': 500}, 1)
+        self.assertEqual(len(rows), 60)
+        self.assertEqual([row['duration'] for row in rows], sorted(row['duration'] for row in rows))
+
+        rows = self.walk({'type': 'tracks', 'since': '2023-11-14T22:13:20Z', 'until': '2023-11-14T22:13:30Z'}, 1)
+        self.assertEqual(sorted(row['upload_id'] for row in rows), [f'vid{i}' for i in range(10)])
+
+        self.assertEqual(self.walk({'type': 'tracks', 'extractor': 'soundcloud'}, 1), [])
+        self.assertEqual(self.client.get(self.url, {'type': 'tracks', 'ordering': 'uploader_url'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'type': 'tracks', 'since': 'yesterday'}).status_code, 400)
+
+    def test_playlists_are_filtered_by_their_tracks(self):
+        rows = self.walk({'type': 'playlists', 'since': '2023-11-14T22:13:35Z', 'until': '2023-11-14T22:14:00Z'}, 2)
+        self.assertEqual([row['upload_id'] for row in rows], ['PL1', 'PL0'])
+        self.assertEqual(sorted(track['upload_id'] for row in rows for track in row['tracks']), sorted(f'vid{i}' for i in range(15, 40)))
+
+        rows = self.walk({'type': 'playlists', 'uploader': 'Uploader 1', 'until': '2023-11-14T22:13:25Z'}, 2)
+        self.assertEqual([row['upload_id'] for row in rows], ['PL0'])
+        self.assertEqual(sorted(track['upload_id'] for track in rows[0]['tracks']), ['vid1', 'vid3'])
+
+        self.assertEqual(self.walk({'type': 'playlists', 'since': '2030-01-01'}, 1), [])
+        self.assertEqual(self.client.get(self.url, {'type': 'playlists', 'until': 'tomorrow'}).status_code, 400)
+
+class StatsTest(TestCase):
+    url = '/api/youtubedl/stats/'
+
+    def setUp(self):
+        cache.clear()
+        serializer = PlaylistSerializer(ydl=FakeYoutubeDL(10))
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        # Three tracks came in last week, two in the week before and five earlier
+        now = timezone.now()
+        for i in range(10):
+            days = 3 if i < 3 else 10 if i < 5 else 40
+            Track.objects.filter(upload_id=f'vid{i}').update(created_at=now - timedelta(days=days))
+
+    def test_counts_and_growth_are_cached_until_invalidated(self):
+        with self.assertNumQueries(3):
+            tracks, playlists, thumbnails = self.client.get(self.url, {'window': 7}).json()
+        self.assertEqual((tracks['total'], tracks['added'], tracks['rate']), (10, 3, '42.86%'))
+        self.assertTrue(tracks['levelUp'])
+        self.assertEqual((thumbnails['total'], thumbnails['added']), (30, 9))
+        self.assertEqual((playlists['total'], playlists['added']), (1, 1))
+
+        Track.objects.filter(upload_id='vid9').delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url, {'window': 7}).json()[0]['total'], 10)
+        invalidate_stats()
+        self.assertEqual(self.client.get(self.url, {'window': 7}).json()[0]['total'], 9)
+        self.assertEqual(self.client.get(self.url, {'window': 5}).status_code, 400)
+
+    def test_rollup_writes_one_row_per_day(self):
+        today = timezone.localdate()
+        self.assertEqual(rollup(today - timedelta(days=44), today), 45)
+        self.assertEqual(rollup(today - timedelta(days=1), today), 2)
+        self.assertEqual(DailyStat.objects.count(), 45)
+        first, last = DailyStat.objects.order_by('date')[0], DailyStat.objects.get(date=today)
+        self.assertEqual(first.tracks_total, 0)
+        self.assertEqual((last.tracks_total, last.playlists_total, last.thumbnails_total), (10, 1, 30))
+        self.assertEqual(DailyStat.objects.get(date=today - timedelta(days=3)).tracks_added, 3)
+
+        with self.assertNumQueries(1):
+            rows = self.client.get('/api/youtubedl/stats/daily/', {'days': 7}).json()
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(rows[-1]['date'], str(today))
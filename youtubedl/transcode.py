@@ -0,0 +1,107 @@
+import hashlib
+import os
+import subprocess
+import threading
+import uuid
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.http import content_disposition_header
+from core.utils import log
+
+FORMATS = {
+    'opus': {'codec': 'libopus', 'muxer': 'ogg', 'ext': 'opus', 'content_type': 'audio/ogg'},
+    'mp3': {'codec': 'libmp3lame', 'muxer': 'mp3', 'ext': 'mp3', 'content_type': 'audio/mpeg'},
+}
+BITRATES = range(32, 321)
+CHUNK_SIZE = 64 * 1024
+
+_evict_lock = threading.Lock()
+
+def rendition_path(path: str, format: str, bitrate: int) -> str:
+    """
+    Cache location of a rendition. The source's size and mtime are part of the
+    key, so a replaced source never serves a stale rendition.
+    """
+    stat = os.stat(path)
+    key = f"{os.path.realpath(path)}:{stat.st_size}:{stat.st_mtime_ns}:{format}:{bitrate}"
+    digest = hashlib.sha1(key.encode()).hexdigest()
+    return os.path.join(settings.TRANSCODE_CACHE_DIR, digest[:2], f"{digest}.{FORMATS[format]['ext']}")
+
+def cached_rendition(path: str, format: str, bitrate: int):
+    rendition = rendition_path(path, format, bitrate)
+    if not os.path.isfile(rendition):
+        return None
+    # The mtime doubles as the last-used time for eviction
+    os.utime(rendition)
+    return rendition
+
+def evict_renditions() -> None:
+    """
+    Drop the least recently used renditions until the cache fits TRANSCODE_CACHE_MAX_BYTES.
+    """
+    with _evict_lock:
+        files = []
+        for root, _, names in os.walk(settings.TRANSCODE_CACHE_DIR):
+            for name in names:
+                if name.endswith('.part'):
+                    continue
+                file_path = os.path.join(root, name)
+                try:
+                    stat = os.stat(file_path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, file_path))
+        total = sum(size for _, size, _ in files)
+        for _, size, file_path in sorted(files):
+            if total <= settings.TRANSCODE_CACHE_MAX_BYTES:
+                break
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+def transcode(path: str, format: str, bitrate: int):
+    """
+    Yield the transcoded audio as ffmpeg produces it, writing it to the cache
+    alongside. The rendition only enters the cache once ffmpeg finished cleanly.
+    """
+    rendition = rendition_path(path, format, bitrate)
+    os.makedirs(os.path.dirname(rendition), exist_ok=True)
+    partial = f"{rendition}.{uuid.uuid4().hex}.part"
+    command = [
+        "ffmpeg", "-v", "error", "-i", path, "-vn", "-map", "0:a:0",
+        "-c:a", FORMATS[format]['codec'], "-b:a", f"{bitrate}k",
+        "-f", FORMATS[format]['muxer'], "pipe:1",
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    completed = False
+    try:
+        with open(partial, 'wb') as cache_file:
+            while True:
+                chunk = process.stdout.read1(CHUNK_SIZE)
+                if not chunk:
+                    break
+                cache_file.write(chunk)
+                yield chunk
+        completed = process.wait() == 0
+        if completed:
+            os.replace(partial, rendition)
+            evict_renditions()
+        else:
+            log(f"Transcoding {path} to {format} failed: {process.stderr.read().decode()}")
+    finally:
+        # Also runs when the client disconnects and the response is closed early
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+        if not completed and os.path.exists(partial):
+            os.remove(partial)
+
+def stream_response(path: str, format: str, bitrate: int) -> StreamingHttpResponse:
+    filename = f"{os.path.splitext(os.path.basename(path))[0]}.{FORMATS[format]['ext']}"
+    response = StreamingHttpResponse(transcode(path, format, bitrate), content_type=FORMATS[format]['content_type'])
+    response['Content-Disposition'] = content_disposition_header(False, filename)
+    return response
@@ -0,0 +1,104 @@
+import asyncio
+import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from .jobs import fail_stale_jobs
+from .models import DownloadJob
+from .progress import get_broker
+from .serializers import DownloadJobSerializer
+
+FINISHED = (DownloadJob.SUCCEEDED, DownloadJob.FAILED)
+
+def format_event(message: dict) -> str:
+    data = json.dumps(message['data'], cls=DjangoJSONEncoder)
+    return f"id: {message['id']}\nevent: {message['event']}\ndata: {data}\n\n"
+
+async def finished_result(job_id: int):
+    # A job whose worker died is failed here, its listeners would wait forever otherwise
+    await sync_to_async(fail_stale_jobs)(pk=job_id)
+    job = await DownloadJob.objects.filter(pk=job_id).afirst()
+    if job is None or job.status not in FINISHED:
+        return None
+    return DownloadJobSerializer(job).data
+
+async def stream_events(job_id: int, last_id: int):
+    """
+    The job's events as text/event-stream, ending with its result. Waiting for
+    an event only holds an asyncio queue, not a thread.
+    """
+    broker = get_broker()
+    listener, missed = broker.subscribe(job_id, last_id)
+    queue = listener[1]
+    try:
+        for message in missed:
+            yield format_event(message)
+            if message['event'] == 'result':
+                return
+        if not missed and not broker.is_running(job_id):
+            # Finished before this process kept its events, or ran in another process
+            result = await finished_result(job_id)
+            if result is not None:
+                yield format_event({'id': last_id + 1, 'event': 'result', 'data': result})
+                return
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), timeout=settings.PROGRESS_KEEPALIVE)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing the idle connection, and notices a job another process finished
+                if not broker.is_running(job_id):
+                    result = await finished_result(job_id)
+                    if result is not None:
+                        yield format_event({'id': last_id + 1, 'event': 'result', 'data': result})
+                        return
+                yield ": keepalive\n\n"
+                continue
+            last_id = message['id']
+            yield format_event(message)
+            if message['event'] == 'result':
+                return
+    finally:
+        broker.unsubscribe(job_id, listener)
+
+def sync_events(job_id: int, last_id: int):
+    """
+    stream_events for WSGI servers such as runserver, which would hold an async
+    stream back until it ended. Runs it on an event loop of its own and holds
+    the server's thread for as long as the job runs.
+    """
+    loop = asyncio.new_event_loop()
+    events = stream_events(job_id, last_id)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(events.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        loop.run_until_complete(events.aclose())
+        loop.close()
+
+@require_GET
+async def job_events(request, job_id):
+    """
+    Server-sent events of a download job: status changes, per-track percent,
+    speed and ETA, snippet completion and the final job as saved. A client
+    reconnecting with Last-Event-ID resumes after the events it has seen.
+    Under WSGI every open stream takes one of the server's threads.
+    """
+    if not await DownloadJob.objects.filter(pk=job_id).aexists():
+        return JsonResponse({'error': f'Job {job_id} not found'}, status=404)
+    last_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id') or '0'
+    try:
+        last_id = int(last_id)
+    except ValueError:
+        last_id = 0
+    events = stream_events(job_id, last_id) if isinstance(request, ASGIRequest) else sync_events(job_id, last_id)
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stops nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,18 +1,26 @@
 import os
 import re
+from datetime import timedelta
 from urllib.parse import quote
-from django.http import FileResponse
+from django.conf import settings
+from django.http import HttpResponseRedirect
+from django.utils import timezone
 from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny
 from rest_framework.decorators import action
 from rest_framework import viewsets, status
 from rest_framework.response import Response
-from .models import Track, Playlist, Thumbnail
-from .serializers import TrackSerializer, PlaylistSerializer
+from .models import DownloadJob, DailyStat
+from .serializers import TrackListSerializer, PlaylistListSerializer, DownloadJobSerializer, DailyStatSerializer
+from .pagination import LibraryCursorPagination, list_ordering, list_queryset
+from .jobs import enqueue
+from .delivery import DELIVERY_MODES, library_path, presigned_location, serve_file
+from .transcode import FORMATS, BITRATES, cached_rendition, stream_response
+from .stats import library_stats
 
 from django.core.exceptions import ObjectDoesNotExist
-from core.utils import YoutubeDLHelper
+from core.utils import AUDIO_FORMATS, find_audio
 
 class YoutubeDLViewSet(viewsets.ViewSet):
     permission_classes = (AllowAny,)
@@ -21,61 +29,56 @@ class YoutubeDLViewSet(viewsets.ViewSet):
     def list(self, request):
         if request.query_params.get('type') is None:
             return Response(data={'msg': 'Type missing'},status=status.HTTP_400_BAD_REQUEST)
-        
-        if request.query_params.get('type') == 'tracks':
-            queryset = Track.objects.all()
-            serializer = TrackSerializer(queryset, many=True)
-        else:
-            queryset = Playlist.objects.all()
-            serializer = PlaylistSerializer(queryset, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+
+        type = 'tracks' if request.query_params.get('type') == 'tracks' else 'playlists'
+        paginator = LibraryCursorPagination()
+        paginator.ordering = list_ordering(type, request.query_params)
+        page = paginator.paginate_queryset(list_queryset(type, request.query_params), request, view=self)
+        serializer_class = TrackListSerializer if type == 'tracks' else PlaylistListSerializer
+        return paginator.get_paginated_response(serializer_class(page, many=True).data)
         
     @action(methods=['post'], detail=False)
     def download(self, request):
         try:
-            ydl = YoutubeDLHelper(request.data["url"])
-            response = {
-                'success': False,
-                'info': ydl.info,
-                'path': ydl.path,
-                'url': ydl.url,
-                'type': ydl.type,
-                'platform': ydl.platform,
-                'download': ydl.download(timestamps=request.data["timestamps"]),
-            }
-
-            # return Response(data=response, status=status.HTTP_200_OK)
-
-            if ydl.type == 'track':
-                result = self.handle_download(ydl, TrackSerializer, Track, ydl.info[0]['id'])
-            else:
-                result = self.handle_download(ydl, PlaylistSerializer, Playlist, ydl.info[0]['playlist_id'])
+            audio_format = request.data.get("audio_format")
+            if audio_format and audio_format not in AUDIO_FORMATS:
+                return Response(data={'error': f'Unsupported audio format: {audio_format}'}, status=status.HTTP_400_BAD_REQUEST)
+            job = enqueue(
+                request.data["url"],
+                timestamps=request.data.get("timestamps") or [],
+                refresh=bool(request.data.get("refresh", False)),
+                incremental=bool(request.data.get("incremental", True)),
+                audio_format=audio_format,
+                # None leaves it to STREAM_PLAYLISTS
+                stream=None if request.data.get("stream") is None else bool(request.data.get("stream")),
+            )
+            response = DownloadJobSerializer(job).data
+            response['success'] = True
+            return Response(data=response, status=status.HTTP_202_ACCEPTED)
+        except (ObjectDoesNotExist, TokenError, KeyError) as e:
+            return Response(data={'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-            response['is_valid'] = result['is_valid']
-            response['errors'] = result['errors']
-            response['success'] = result['is_valid']
+    @action(methods=['get'], detail=False)
+    def jobs(self, request):
+        queryset = DownloadJob.objects.order_by('-created_at')[:50]
+        serializer = DownloadJobSerializer(queryset, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
-            return Response(data=response, status=status.HTTP_200_OK)
-        except (ObjectDoesNotExist, TokenError) as e:
-            return Response(data={'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
-    
-    def handle_download(self, ydl, serializer_class, model_class, upload_id):
+    @action(methods=['get'], detail=False, url_path=r'jobs/(?P<job_id>[0-9]+)')
+    def job(self, request, job_id=None):
         try:
-            instance = model_class.objects.get(upload_id=upload_id)
-            serializer = serializer_class(instance, ydl=ydl)
-        except model_class.DoesNotExist:
-            serializer = serializer_class(ydl=ydl)
-        
-        if serializer.is_valid():
-            instance = serializer.save()
-            return {'instance': instance, 'created': instance._state.adding, 'is_valid': True, 'errors': None}
-        else:
-            return {'instance': None, 'created': False, 'is_valid': False, 'errors': serializer.errors}
-    
-    @action(methods=['post'], detail=False)
+            job = DownloadJob.objects.get(pk=job_id)
+            return Response(DownloadJobSerializer(job).data, status=status.HTTP_200_OK)
+        except DownloadJob.DoesNotExist:
+            return Response(data={'error': f'Job {job_id} not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    @action(methods=['get', 'post'], detail=False)
     def save_track(self, request):
         try:
-            file_path = request.data.get("dir")
+            file_path = request.data.get("dir") or request.query_params.get("dir")
+            delivery = request.data.get("delivery") or request.query_params.get("delivery") or settings.AWS_S3_DELIVERY
+            if delivery not in DELIVERY_MODES:
+                return Response(data={'error': f'Unsupported delivery: {delivery}, one of {", ".join(DELIVERY_MODES)}'}, status=status.HTTP_400_BAD_REQUEST)
             escaped_path = re.sub(r'(:)', r'\\:', re.sub(r'(\s)', r'\\ ', file_path))
             response = {
                 'success': False,
@@ -84,43 +87,66 @@ class YoutubeDLViewSet(viewsets.ViewSet):
                 'escaped_path' : escaped_path,
             }
 
+            # Only library files are served, whatever path the caller sends
+            file_path = library_path(file_path)
+            if file_path is None:
+                return Response(data=response, status=status.HTTP_404_NOT_FOUND)
+            # Links handed out before the library was converted still point at the old extension
+            if not os.path.isfile(file_path):
+                file_path = find_audio(os.path.splitext(file_path)[0]) or file_path
+
+            location = presigned_location(file_path) if delivery != 'local' else None
+            if location and delivery == 'redirect':
+                return HttpResponseRedirect(location[0])
+            if location:
+                return Response(data={'success': True, 'url': location[0], 'expires_in': location[1]}, status=status.HTTP_200_OK)
             if os.path.isfile(file_path):
-                file_handle = open(file_path, 'rb')
-                response = FileResponse(file_handle, as_attachment=True, filename=os.path.basename(file_path))
-                response['Content-Disposition'] = f'attachment; filename="{os.path.basename(file_path)}"'
-                return response
+                return serve_file(request, file_path)
             else:
                 return Response(data=response, status=status.HTTP_404_NOT_FOUND)
 
-        except (TokenError, KeyError) as e:
+        except (TokenError, KeyError, TypeError) as e:
             return Response(data={'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+    @action(methods=['get'], detail=False)
+    def stream(self, request):
+        file_path = request.query_params.get("dir")
+        # ?format= is taken by DRF's renderer negotiation
+        format = request.query_params.get("codec", "opus")
+        try:
+            bitrate = int(request.query_params.get("bitrate", 128))
+        except ValueError:
+            bitrate = None
+        if format not in FORMATS or bitrate not in BITRATES:
+            return Response(data={'error': f'Unsupported codec or bitrate, codecs: {", ".join(FORMATS)}, bitrates: 32-320'}, status=status.HTTP_400_BAD_REQUEST)
+        source = library_path(file_path)
+        if source is None or not os.path.isfile(source):
+            return Response(data={'success': False, 'message': 'File not found', 'file_path': file_path}, status=status.HTTP_404_NOT_FOUND)
+        file_path = source
+
+        rendition = cached_rendition(file_path, format, bitrate)
+        if rendition:
+            filename = f"{os.path.splitext(os.path.basename(file_path))[0]}.{FORMATS[format]['ext']}"
+            return serve_file(request, rendition, filename=filename, as_attachment=False)
+        return stream_response(file_path, format, bitrate)
+
     @action(methods=['get'], detail=False)
     def stats(self, request):
-        return Response([
-            {
-                'title': 'Tracks',
-                'total': Track.objects.count(),
-                'rate': '0.43%',
-                'levelUp': True,
-                'levelDown': False,
-                'icon': 'faMusic'
-            },
-            {
-                'title': 'Playlists',
-                'total': Playlist.objects.count(),
-                'rate': '0.43%',
-                'levelUp': True,
-                'levelDown': False,
-                'icon': 'faClipboardList'
-            },
-            {
-                'title': 'Thumbnails',
-                'total': Thumbnail.objects.count(),
-                'rate': '0.43%',
-                'levelUp': True,
-                'levelDown': False,
-                'icon': 'faImage'
-            }
-        ], status=status.HTTP_200_OK)
+        try:
+            window = int(request.query_params.get('window', settings.STATS_DEFAULT_WINDOW))
+        except ValueError:
+            window = None
+        if window not in settings.STATS_WINDOWS:
+            return Response(data={'error': f'Unsupported window, days: {", ".join(map(str, settings.STATS_WINDOWS))}'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(library_stats(window), status=status.HTTP_200_OK)
+
+    @action(methods=['get'], detail=False, url_path='stats/daily')
+    def daily_stats(self, request):
+        try:
+            days = min(int(request.query_params.get('days', 30)), 366)
+        except ValueError:
+            return Response(data={'error': 'days must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        since = timezone.localdate() - timedelta(days=days)
+        queryset = DailyStat.objects.filter(date__gt=since).order_by('date')
+        return Response(DailyStatSerializer(queryset, many=True).data, status=status.HTTP_200_OK)